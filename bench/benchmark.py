@@ -0,0 +1,299 @@
+# python3 bench/benchmark.py [MODEL ...] [--cycles N] [--freq HZ]
+#
+# runs the firmware against the fake hardware in bench/hal and reports for
+# each board model:
+#
+#   cpu ms       real time spent in get_sensor_readings per cycle
+#   sim ms       simulated time per cycle, including every sensor wait
+#   alloc B      bytes allocated per cycle (peak heap growth under CPython)
+#   writes       GATT characteristic writes per cycle
+#   notifies     notifications sent to one connected central per cycle
+#   lag ms       the worst event loop lag seen, how late a task asking to
+#                run every millisecond got to run
+#   bus ms       time devices held an i2c bus per cycle, followed by a line
+#                for each device with its share and transactions per cycle
+#
+# --freq runs the main i2c bus at another clock than enviroble.bus picks,
+# to compare
+# followed by microbenchmarks of the characteristic encoders.
+#
+# each model runs in its own interpreter since the firmware sets up its
+# hardware when it's imported. under the unix MicroPython port pass a single
+# model, the waits then take real time as its clock can't be simulated
+from array import array
+import gc
+import sys
+import time
+
+try:
+    from os.path import abspath
+    BENCH = abspath(__file__).rpartition("/")[0]
+except ImportError:
+    BENCH = __file__.rpartition("/")[0] or "."
+ROOT = BENCH + "/.."
+HAL = BENCH + "/hal"
+
+MODELS = ("indoor", "grow", "weather", "urban")
+
+# the main i2c bus, see enviroble.constants
+MAIN_SDA_PIN = 4
+
+# simulated time between cycles, so that notifications aren't held back by
+# their minimum interval
+CYCLE_PERIOD_MS = 60 * 1000
+
+# aioble's flag for a characteristic that notifies
+_FLAG_NOTIFY = 0x0010
+
+try:
+    from time import perf_counter
+except ImportError:
+    def perf_counter():
+        return time.ticks_us() / 1000000
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+# bytes allocated between start() and stop(), or peak heap growth where the
+# total allocated can't be measured
+#
+# nothing the measurement makes itself may be counted or freed in between:
+# the start is kept in an array rather than as an int and the tuple it's read
+# from is gone before the peak is reset. it's not a context manager as with
+# frees the bound __enter__ once the peak has been reset, hiding that much of
+# what's allocated
+class Allocations:
+    def __init__(self):
+        self._start = array("q", [0])
+        self.bytes = 0
+
+    def start(self):
+        if tracemalloc is not None:
+            self._start[0] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        else:
+            gc.collect()
+            gc.disable()
+            self._start[0] = gc.mem_alloc()
+
+    def stop(self):
+        if tracemalloc is not None:
+            self.bytes = tracemalloc.get_traced_memory()[1] - self._start[0]
+        else:
+            self.bytes = gc.mem_alloc() - self._start[0]
+            gc.enable()
+
+
+# put the fake hardware in place of the real thing, as model if one's given,
+# for any of the bench scripts. run before importing anything from enviroble
+def setup(model=None):
+    sys.path[:0] = [HAL, ROOT]
+    import sim
+    sim.install()
+    if model is not None:
+        sim.select_model(model)
+    if sim.CPYTHON:
+        # keep the files the firmware writes to flash, such as the cached
+        # model, out of the tree
+        import os
+        import tempfile
+        os.chdir(tempfile.mkdtemp())
+
+
+def load_firmware(model, freq=None):
+    setup(model)
+    import sim
+    if freq is not None:
+        sim.i2c_frequencies[MAIN_SDA_PIN] = freq
+
+    # import main.py without starting it
+    import uasyncio
+    run = uasyncio.run
+    uasyncio.run = lambda coro: coro.close()
+    firmware = {"__name__": "main", "print": lambda *args, **kwargs: None}
+    try:
+        with open(ROOT + "/main.py") as f:
+            exec(f.read(), firmware)
+    finally:
+        uasyncio.run = run
+    return firmware
+
+
+def benchmark_model(model, cycles, freq=None):
+    firmware = load_firmware(model, freq)
+    import sim
+    import aioble
+    import uasyncio as asyncio
+    import enviroble.bus
+
+    board = firmware["board"]
+    publish = firmware["publish"]
+    # one central subscribed to everything
+    connection = aioble.DeviceConnection()
+    aioble.connections.append(connection)
+    firmware["enviroble"].centrals.add(connection)
+    for characteristic in aioble.characteristics:
+        if characteristic.flags & _FLAG_NOTIFY:
+            characteristic.central_subscribe(connection)
+
+    results = {"cpu": 0, "sim": 0, "alloc": 0, "lag": 0}
+    allocations = Allocations()
+
+    async def lag_probe():
+        while True:
+            start = sim.clock.now_us()
+            await asyncio.sleep_ms(1)
+            results["lag"] = max(results["lag"], (sim.clock.now_us() - start) / 1000 - 1)
+
+    async def run():
+        # the first cycle primes the edge counters and notification policies
+        publish(await board.get_sensor_readings(0))
+        await asyncio.sleep_ms(CYCLE_PERIOD_MS)
+        aioble.reset_stats()
+        enviroble.bus.reset()
+
+        for cycle in range(cycles):
+            probe = asyncio.create_task(lag_probe())
+            await asyncio.sleep_ms(0)
+            allocations.start()
+            start, sim_start = perf_counter(), sim.clock.now_us()
+            readings = await board.get_sensor_readings(CYCLE_PERIOD_MS / 1000)
+            results["cpu"] += perf_counter() - start
+            results["sim"] += (sim.clock.now_us() - sim_start) / 1000000
+            publish(readings)
+            allocations.stop()
+            results["alloc"] += allocations.bytes
+            # give the probe a chance to see a cycle that never yielded
+            await asyncio.sleep_ms(1)
+            probe.cancel()
+            await asyncio.sleep_ms(CYCLE_PERIOD_MS)
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+    try:
+        asyncio.run(run())
+    except Exception as e:
+        print(f"{model:<10}failed: {type(e).__name__}: {e}")
+        return
+
+    print(f"{model:<10}{results['cpu'] * 1000 / cycles:>9.2f}{results['sim'] * 1000 / cycles:>10.1f}"
+          f"{results['alloc'] / cycles:>10.0f}{aioble.stats['writes'] / cycles:>9.1f}"
+          f"{aioble.stats['notifies'] / cycles:>10.1f}{results['lag']:>9.2f}"
+          f"{sum(us for name, us, transactions in enviroble.bus.report()) / 1000 / cycles:>9.2f}")
+    for name, bus_us, transactions in enviroble.bus.report():
+        print(f"  {name:<8}{bus_us / 1000 / cycles:>9.2f} ms{transactions / cycles:>6.1f} transactions")
+
+
+# encoders
+# ===========================================================================
+# the struct.pack per update encoders that schema.py replaced, for comparison
+def legacy_encoders():
+    import struct
+    return {
+        "temperature": lambda v: struct.pack("<h", int(v * 100)),
+        "pressure": lambda v: struct.pack("<h", int(v * 10)),
+        "humidity": lambda v: struct.pack("<h", int(v * 100)),
+        "luminance": lambda v: struct.pack("<h", int(v / 12)),
+        "wind_direction": lambda v: struct.pack("<h", int(v * 100)),
+        "rainfall": lambda v: struct.pack("<h", int(v))
+    }
+
+
+def benchmark_encoders(iterations):
+    import struct
+    sys.path.insert(0, ROOT)
+    import enviroble.schema as schema
+
+    readings = {"temperature": 21.5, "pressure": 1013.25, "humidity": 45.2,
+                "luminance": 123.4, "wind_direction": 45, "rain": 0.28,
+                "wind_speed": 3.2}
+    legacy = legacy_encoders()
+    names = list(legacy)
+    properties = tuple(schema.FIELDS[name][0] for name in names)
+    buffers = tuple(bytearray(struct.calcsize(schema.FIELDS[name][2])) for name in names)
+    record = bytearray(schema.record_size("weather"))
+
+    def run_legacy():
+        for name, encode in legacy.items():
+            encode(readings.get(schema.FIELDS[name][0]))
+
+    # indexed rather than iterated, the iterator would be allocated each cycle
+    def run_schema():
+        i = 0
+        while i < 6:
+            schema.pack_into(names[i], buffers[i], 0, readings.get(properties[i]))
+            i += 1
+
+    def run_record():
+        schema.pack_record_into("weather", record, readings)
+
+    print()
+    allocations = Allocations()
+    print(f"{'encoder':<24}{'us/cycle':>10}{'alloc B':>10}")
+    for title, f in (("struct.pack per sensor", run_legacy), ("schema.pack_into", run_schema),
+                     ("schema record", run_record)):
+        start = perf_counter()
+        for i in range(iterations):
+            f()
+        elapsed = perf_counter() - start
+        # measured after the timed runs, CPython allocates as it specialises
+        # the bytecode over the first few calls
+        if tracemalloc is not None:
+            tracemalloc.start()
+        allocations.start()
+        f()
+        allocations.stop()
+        if tracemalloc is not None:
+            tracemalloc.stop()
+        print(f"{title:<24}{elapsed * 1000000 / iterations:>10.2f}{allocations.bytes:>10}")
+
+
+def header():
+    print(f"{'model':<10}{'cpu ms':>9}{'sim ms':>10}{'alloc B':>10}{'writes':>9}{'notifies':>10}{'lag ms':>9}{'bus ms':>9}")
+
+
+def main(argv):
+    cycles = 20
+    freq = None
+    models = []
+    child = False
+    args = iter(argv)
+    for arg in args:
+        if arg == "--cycles":
+            cycles = int(next(args))
+        elif arg == "--freq":
+            freq = int(next(args))
+        elif arg == "--child":
+            child = True
+        else:
+            models.append(arg)
+
+    if child or sys.implementation.name != "cpython":
+        if not child:
+            header()
+        for model in models or MODELS[:1]:
+            benchmark_model(model, cycles, freq)
+        if not child:
+            benchmark_encoders(cycles * 100)
+        return
+
+    import subprocess
+    header()
+    for model in models or MODELS:
+        sys.stdout.flush()
+        command = [sys.executable, __file__, "--child", "--cycles", str(cycles), model]
+        if freq is not None:
+            command += ["--freq", str(freq)]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode == 0:
+            print(result.stdout, end="")
+        else:
+            print(f"{model:<10}failed: {result.stderr.strip().splitlines()[-1]}")
+    benchmark_encoders(cycles * 1000)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
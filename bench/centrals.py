@@ -0,0 +1,115 @@
+# python3 bench/centrals.py [MODEL] [--centrals N] [--minutes M]
+#
+# connects N centrals to the firmware at once, each subscribed to every
+# characteristic, plus a stalled one that never takes anything it's sent,
+# then runs the firmware for M simulated minutes. every other central must
+# get every update the firmware sent, with the latest value last, however
+# far behind the stalled one falls. one more central tries to connect while
+# they're all connected and must wait until one leaves
+import sys
+
+from benchmark import load_firmware
+
+MODEL = "weather"
+CENTRALS = 3
+MINUTES = 10
+
+
+def main(argv):
+    model = MODEL
+    count = CENTRALS
+    minutes = MINUTES
+    args = iter(argv)
+    for arg in args:
+        if arg == "--centrals":
+            count = int(next(args))
+        elif arg == "--minutes":
+            minutes = int(next(args))
+        else:
+            model = arg
+
+    firmware = load_firmware(model)
+    import aioble
+    import uasyncio as asyncio
+
+    centrals = firmware["enviroble"].centrals
+    # the stalled central takes one of the connections
+    centrals.limit = count + 1
+    characteristics = [c for c in aioble.characteristics if c in centrals._cccds.values()]
+
+    # what the firmware sent each characteristic's subscribers, and the value
+    # it last sent. a value that moved less than its deadband is written
+    # without being sent
+    updates = {c: 0 for c in characteristics}
+    notified = {}
+    notify = centrals.notify
+
+    def count_updates(characteristic):
+        updates[characteristic] += 1
+        notified[characteristic] = bytes(characteristic.read())
+        notify(characteristic)
+
+    centrals.notify = count_updates
+
+    async def run():
+        tasks = [asyncio.create_task(firmware[name]())
+                 for name in ("sensor_task", "peripheral_task")]
+        tasks.append(asyncio.create_task(centrals.run()))
+
+        connections = [aioble.connect_central(f"central {i}") for i in range(count)]
+        connections.append(aioble.connect_central("stalled", stalled=True))
+        while len(centrals.centrals) < len(connections):
+            await asyncio.sleep_ms(10)
+        for connection in connections:
+            for characteristic in characteristics:
+                characteristic.central_subscribe(connection)
+
+        # no room for this one until another leaves
+        late = aioble.connect_central("late")
+        await asyncio.sleep_ms(minutes * 60 * 1000)
+        waited = late not in aioble.connections
+        # what everyone had received by then
+        results = [(connection, list(connection.received)) for connection in connections]
+        sent = dict(updates)
+        latest = dict(notified)
+
+        await connections[0].disconnect()
+        await asyncio.sleep_ms(1000)
+        admitted = late in aioble.connections
+
+        for connection in connections + [late]:
+            await connection.disconnect()
+        await asyncio.sleep_ms(0)
+        for task in tasks:
+            task.cancel()
+        return results, sent, latest, waited, admitted
+
+    results, updates, latest, waited, admitted = asyncio.run(run())
+
+    ok = True
+    published = sum(updates.values())
+    print(f"{model}: {len(characteristics)} characteristics, {published} updates in {minutes} minutes")
+    print(f"{'central':<12}{'received':>10}{'missing':>9}{'latest':>8}")
+    for connection, notifications in results:
+        received = {c: [] for c in characteristics}
+        for characteristic, data in notifications:
+            if characteristic in received:
+                received[characteristic].append(data)
+        # there may be one more each for catching up on subscribing, unless it
+        # was still waiting for room when the first update replaced it
+        missing = sum(max(0, updates[c] - len(received[c])) for c in characteristics)
+        current = all(values and values[-1] == latest.get(c) for c, values in received.items())
+        total = sum(len(values) for values in received.values())
+        print(f"{connection.device:<12}{total:>10}{missing:>9}{'yes' if current else 'no':>8}")
+        if connection.device != "stalled" and (missing or not current):
+            ok = False
+
+    print(f"late central waited for room: {'yes' if waited else 'no'}, connected once there was: "
+          f"{'yes' if admitted else 'no'}")
+    ok = ok and waited and admitted
+    print("PASS" if ok else "FAIL")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(sys.argv[1:]) else 1)
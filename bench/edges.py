@@ -0,0 +1,113 @@
+# python3 bench/edges.py
+#
+# drives enviroble.edges.EdgeCounter from a fake pin, toggled at simulated
+# times, and checks what edges(), interval_ms() and frequency() make of it:
+#
+#   steady        100 edges a second, asked about over windows of a second
+#                 and of 100ms
+#   full ring     more edges than the ring buffer holds
+#   one edge      too few edges to work out an interval
+#   stale         edges older than MAX_AGE_MS, which are forgotten
+#   tick wrap     edges either side of time.ticks_ms() wrapping
+#   count wrap    the running count passing COUNT_MASK, which must stay a
+#                 small int on the board, and copy_since() across it
+import sys
+
+from benchmark import setup
+
+# a pin nothing in the simulation drives, so only toggle() moves it
+PIN = 99
+
+# MicroPython's small ints, which don't allocate, are 31 bit signed
+SMALL_INT_MAX = (1 << 30) - 1
+
+
+def main(argv):
+    setup("indoor")
+    import sim
+    from machine import Pin
+    from enviroble.edges import EdgeCounter, COUNT_MASK, MAX_AGE_MS
+
+    # every reading of the clock, in the counter's irq handler and out of it,
+    # sees the time that's been set, so the results don't depend on how fast
+    # this runs
+    def at(ms):
+        sim.clock.irq_us = ms * 1000
+
+    # toggle the pin every interval ms from start, returning the time of
+    # the last edge
+    def toggle(pin, start, edges, interval):
+        for i in range(edges):
+            at(start + i * interval)
+            pin._edge()
+        return start + (edges - 1) * interval
+
+    results = []
+
+    def check(title, got, expected):
+        results.append((title, got, expected, got == expected))
+
+    pin = Pin(PIN)
+    counter = EdgeCounter(pin)
+    last = toggle(pin, 1000, 60, 10)
+    at(last)
+    check("steady edges(1000)", counter.edges(1000), (60, 590))
+    check("steady edges(100)", counter.edges(100), (11, 100))
+    check("steady interval_ms", counter.interval_ms(1000), 10.0)
+    check("steady frequency", counter.frequency(1000), 100.0)
+
+    pin = Pin(PIN)
+    counter = EdgeCounter(pin, size=128)
+    last = toggle(pin, 1000, 200, 5)
+    at(last)
+    check("full ring edges", counter.edges(10000), (128, 127 * 5))
+    check("full ring frequency", counter.frequency(10000), 200.0)
+
+    pin = Pin(PIN)
+    counter = EdgeCounter(pin)
+    at(1000)
+    pin._edge()
+    check("one edge edges", counter.edges(1000), (1, 0))
+    check("one edge interval_ms", counter.interval_ms(1000), None)
+    check("one edge frequency", counter.frequency(1000), 0)
+
+    pin = Pin(PIN)
+    counter = EdgeCounter(pin)
+    last = toggle(pin, 1000, 10, 100)
+    at(last + MAX_AGE_MS + 1)
+    check("stale edges", counter.edges(1000), (0, 0))
+    check("stale forgotten", counter._stored, 0)
+
+    pin = Pin(PIN)
+    counter = EdgeCounter(pin)
+    wrap_ms = sim._TICKS_PERIOD // 1000 * 1000
+    last = toggle(pin, wrap_ms - 250, 50, 10)
+    at(last)
+    check("tick wrap edges", counter.edges(1000), (50, 490))
+    check("tick wrap frequency", counter.frequency(1000), 100.0)
+
+    pin = Pin(PIN)
+    counter = EdgeCounter(pin)
+    start = COUNT_MASK - 2
+    counter.count = start
+    highest = 0
+    for i in range(5):
+        at(1000 + i * 10)
+        highest = max(highest, counter.count + 1)
+        pin._edge()
+    buffer = bytearray(4 * 8)
+    check("count wrap count", counter.count, 2)
+    check("count + 1 is a small int", highest <= SMALL_INT_MAX, True)
+    check("count wrap copy_since", counter.copy_since(start, buffer), (2, 5))
+
+    ok = True
+    print(f"{'check':<28}{'got':>16}{'expected':>16}")
+    for title, got, expected, passed in results:
+        print(f"{title:<28}{str(got):>16}{str(expected):>16}{'' if passed else '  <-'}")
+        ok = ok and passed
+    print("PASS" if ok else "FAIL")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(sys.argv[1:]) else 1)
@@ -0,0 +1,184 @@
+# fake aioble, an instrumented GATT server that counts what the firmware
+# sends and lets the benchmarks play the part of a central. notifications and
+# l2cap channels are timed with the link model in sim.py
+import asyncio
+import sim
+from aioble import core
+
+MTU = 23
+
+_ENOMEM = 12
+
+# the characteristic flags, as the real aioble keeps them
+_FLAG_READ = 0x0002
+_FLAG_WRITE_NO_RESPONSE = 0x0004
+_FLAG_WRITE = 0x0008
+_FLAG_NOTIFY = 0x0010
+_FLAG_INDICATE = 0x0020
+_FLAG_WRITE_CAPTURE = 0x10000
+_IRQ_GATTS_WRITE = 3
+
+# totals across every characteristic
+stats = {
+    "writes": 0,         # characteristic values set
+    "notifies": 0,       # notifications sent to connected centrals
+    "bytes": 0,          # bytes of characteristic values set
+    "adverts": 0         # advertising payloads (re)started
+}
+characteristics = []
+connections = []
+# attribute values by handle, for bluetooth.BLE().gatts_read()
+attributes = {}
+_handles = [0, 0]
+_pending = []
+_pending_event = asyncio.Event()
+
+
+def reset_stats():
+    for key in stats:
+        stats[key] = 0
+
+
+class Service:
+    def __init__(self, uuid):
+        self.uuid = uuid
+        self.characteristics = []
+
+
+class Characteristic:
+    def __init__(self, service, uuid, read=False, write=False, write_no_response=False,
+                 notify=False, indicate=False, initial=None, capture=False):
+        service.characteristics.append(self)
+        characteristics.append(self)
+        self.uuid = uuid
+        self.flags = ((_FLAG_READ if read else 0) | (_FLAG_WRITE if write else 0) |
+                      (_FLAG_WRITE_NO_RESPONSE if write_no_response else 0) | (_FLAG_NOTIFY if notify else 0) |
+                      (_FLAG_INDICATE if indicate else 0) | (_FLAG_WRITE_CAPTURE if capture else 0))
+        # the declaration, value and CCCD handles
+        _handles[0] += 3
+        self._value_handle = _handles[0] - 1
+        self._value = initial
+        self._written = asyncio.Event()
+        self._writes = []
+
+    def read(self):
+        return self._value
+
+    def write(self, data, send_update=False):
+        self._value = bytes(data)
+        stats["writes"] += 1
+        stats["bytes"] += len(data)
+        if send_update:
+            stats["notifies"] += len(connections)
+
+    # raises OSError like the real thing when the controller's buffers are full
+    def notify(self, connection, data=None):
+        if connection.link.room() <= 0:
+            raise OSError(_ENOMEM)
+        connection.link.queue(1)
+        data = (self._value or b"") if data is None else bytes(data)
+        stats["notifies"] += 1
+        stats["bytes"] += len(data)
+        connection.received.append((self, data))
+
+    # a central writes to the characteristic
+    def central_write(self, data, connection=None):
+        self._value = bytes(data)
+        self._writes.append((connection, bytes(data)))
+        self._written.set()
+
+    # a central subscribes to the characteristic, or unsubscribes
+    def central_subscribe(self, connection, notify=True):
+        cccd = self._value_handle + 1
+        attributes[cccd] = bytes((int(notify), 0))
+        core.ble_irq(_IRQ_GATTS_WRITE, (connection._conn_handle, cccd))
+
+    async def written(self, timeout_ms=None):
+        if not self._writes:
+            self._written.clear()
+            timeout = None if timeout_ms is None else timeout_ms / 1000
+            await asyncio.wait_for(self._written.wait(), timeout)
+        connection, data = self._writes.pop(0)
+        return (connection, data) if self.flags & _FLAG_WRITE_CAPTURE else connection
+
+
+class Descriptor:
+    def __init__(self, characteristic, uuid, read=False, write=False, initial=None):
+        self.uuid = uuid
+        self._value = initial
+
+    def read(self):
+        return self._value
+
+
+class DeviceConnection:
+    # a stalled central never takes anything it's sent
+    def __init__(self, device="central", mtu=MTU, stalled=False):
+        self.device = device
+        self.mtu = mtu
+        _handles[1] += 1
+        self._conn_handle = _handles[1]
+        # (characteristic, data) for every notification sent to this central
+        self.received = []
+        self.link = sim.Link(0 if stalled else sim.NOTIFICATIONS_PER_EVENT)
+        self.l2cap_link = sim.Link(sim.L2CAP_PACKETS_PER_EVENT)
+        self._l2cap_listening = {}
+        self._l2cap_accepted = asyncio.Queue()
+        self._disconnected = asyncio.Event()
+
+    def is_connected(self):
+        return not self._disconnected.is_set()
+
+    async def disconnect(self, timeout_ms=2000):
+        if self in connections:
+            connections.remove(self)
+        self._disconnected.set()
+
+    async def l2cap_accept(self, psm, mtu, timeout_ms=None):
+        self._l2cap_listening[psm] = mtu
+        timeout = None if timeout_ms is None else timeout_ms / 1000
+        return await asyncio.wait_for(self._l2cap_accepted.get(), timeout)
+
+    # the central opens a channel, returns the central's end
+    async def l2cap_connect(self, psm, mtu, timeout_ms=1000):
+        from aioble.l2cap import connect
+        return await connect(self, psm, mtu)
+
+    async def disconnected(self, timeout_ms=60000, disconnect=False):
+        timeout = None if timeout_ms is None else timeout_ms / 1000
+        await asyncio.wait_for(self._disconnected.wait(), timeout)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.disconnect()
+
+
+# a central connects to the board, returns its connection
+def connect_central(device="central", mtu=MTU, stalled=False):
+    connection = DeviceConnection(device, mtu, stalled)
+    _pending.append(connection)
+    _pending_event.set()
+    return connection
+
+
+def register_services(*services):
+    pass
+
+
+def config(*args, **kwargs):
+    if args == ("mtu",):
+        return MTU
+
+
+async def advertise(interval_us, adv_data=None, resp_data=None, connectable=True, limited_disc=False,
+                    br_edr=False, name=None, services=None, appearance=0, manufacturer=None, timeout_ms=None):
+    stats["adverts"] += 1
+    if not _pending:
+        _pending_event.clear()
+        timeout = None if timeout_ms is None else timeout_ms / 1000
+        await asyncio.wait_for(_pending_event.wait(), timeout)
+    connection = _pending.pop(0)
+    connections.append(connection)
+    return connection
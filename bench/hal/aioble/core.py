@@ -0,0 +1,14 @@
+# fake aioble.core, the firmware hooks its own handler into the bluetooth irq
+_irq_handlers = []
+
+
+def register_irq_handler(irq, shutdown):
+    if irq:
+        _irq_handlers.append(irq)
+
+
+def ble_irq(event, data):
+    for handler in _irq_handlers:
+        result = handler(event, data)
+        if result is not None:
+            return result
@@ -0,0 +1,110 @@
+# fake aioble l2cap connection oriented channels, timed with the link model in
+# sim.py
+#
+# a channel has two ends: the board's, returned by l2cap_accept(), and the
+# central's, returned by connect(). what one end sends the other receives,
+# each packet of an sdu uses up one of the central's credits and the central
+# hands them back as it reads
+import asyncio
+import sim
+
+
+class L2CAPDisconnectedError(Exception):
+    pass
+
+
+class L2CAPConnectionError(Exception):
+    pass
+
+
+class L2CAPChannel:
+    def __init__(self, connection, mtu, link, peer=None):
+        self.connection = connection
+        self.link = link
+        self.our_mtu = mtu
+        self.peer_mtu = mtu
+        self.peer = peer
+        self.received = bytearray()
+        self.credits = sim.L2CAP_CREDITS
+        self._connected = True
+        self._data = asyncio.Event()
+        self._space = asyncio.Event()
+
+    def available(self):
+        return len(self.received)
+
+    def _check(self):
+        if not self._connected:
+            raise L2CAPDisconnectedError
+
+    async def recvinto(self, buf, timeout_ms=None):
+        while not self.received:
+            self._check()
+            self._data.clear()
+            # like aioble, a timeout of 0 means none at all
+            timeout = timeout_ms / 1000 if timeout_ms else None
+            await asyncio.wait_for(self._data.wait(), timeout)
+        count = min(len(buf), len(self.received))
+        buf[:count] = self.received[:count]
+        del self.received[:count]
+        # hand back credits for the packets read
+        peer = self.peer
+        peer.credits = min(sim.L2CAP_CREDITS, peer.credits + sim.l2cap_packets(count))
+        peer._space.set()
+        return count
+
+    async def send(self, buf, timeout_ms=None, chunk_size=None):
+        chunk_size = min(chunk_size or self.peer_mtu, self.peer_mtu)
+        for offset in range(0, len(buf), chunk_size):
+            await self._send_sdu(bytes(buf[offset:offset + chunk_size]), timeout_ms)
+
+    async def _send_sdu(self, sdu, timeout_ms):
+        packets = sim.l2cap_packets(len(sdu))
+        link = self.link
+        # like aioble, a timeout of 0 means none at all
+        deadline = sim.clock.now_us() + timeout_ms * 1000 if timeout_ms else None
+        # wait for credits from the peer and room in the controller
+        while self.credits < packets or link.room() < packets:
+            self._check()
+            if deadline is not None and sim.clock.now_us() >= deadline:
+                raise asyncio.TimeoutError
+            self._space.clear()
+            try:
+                await asyncio.wait_for(self._space.wait(), sim.CONNECTION_INTERVAL_US / 1000000)
+            except asyncio.TimeoutError:
+                pass
+        self._check()
+        self.credits -= packets
+        link.queue(packets)
+        self.peer.received += sdu
+        self.peer._data.set()
+
+    async def flush(self, timeout_ms=None):
+        pass
+
+    async def disconnect(self, timeout_ms=1000):
+        for end in (self, self.peer):
+            end._connected = False
+            end._data.set()
+            end._space.set()
+
+    async def disconnected(self, timeout_ms=1000):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.disconnect()
+
+
+# the central opens a channel to the board on connection
+async def connect(connection, psm, mtu):
+    if psm not in connection._l2cap_listening:
+        raise L2CAPConnectionError(psm)
+    board = L2CAPChannel(connection, mtu, connection.l2cap_link)
+    central = L2CAPChannel(connection, mtu, sim.Link(sim.L2CAP_PACKETS_PER_EVENT), board)
+    board.peer = central
+    board.peer_mtu = central.peer_mtu = min(mtu, connection._l2cap_listening[psm])
+    connection._l2cap_accepted.put_nowait(board)
+    return central
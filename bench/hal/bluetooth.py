@@ -0,0 +1,30 @@
+# fake bluetooth module
+import aioble
+
+
+class UUID:
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, UUID) and other.value == self.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __repr__(self):
+        return f"UUID({self.value!r})"
+
+
+class BLE:
+    def active(self, *args):
+        return True
+
+    def config(self, *args, **kwargs):
+        return aioble.MTU
+
+    def gatts_read(self, handle):
+        return aioble.attributes.get(handle, b"")
+
+    def gap_advertise(self, interval_us, adv_data=None, resp_data=None, connectable=True):
+        aioble.stats["adverts"] += 1
@@ -0,0 +1,17 @@
+import sim
+
+
+class BreakoutBH1745:
+    def __init__(self, i2c, address=0x38):
+        self._i2c = i2c
+        self.address = address
+
+    def measurement_time_ms(self, ms):
+        sim.i2c_transfer(1, self._i2c.freq)
+
+    def leds(self, on):
+        sim.i2c_transfer(1, self._i2c.freq)
+
+    def rgbc_raw(self):
+        sim.i2c_transfer(8, self._i2c.freq)
+        return sim.trace("bh1745")
@@ -0,0 +1,11 @@
+import sim
+
+
+class BreakoutBME280:
+    def __init__(self, i2c, address=0x77):
+        self._i2c = i2c
+        self.address = address
+
+    def read(self):
+        sim.i2c_transfer(8, self._i2c.freq)
+        return sim.trace("bme280")
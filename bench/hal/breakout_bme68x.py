@@ -0,0 +1,13 @@
+import sim
+
+
+class BreakoutBME68X:
+    def __init__(self, i2c, address=0x76):
+        self._i2c = i2c
+        self.address = address
+
+    def read(self, heater_temp=300, heater_duration=100):
+        sim.i2c_transfer(17, self._i2c.freq)
+        # a forced mode reading blocks while the gas heater runs
+        sim.clock.skip_us(heater_duration * 1000)
+        return sim.trace("bme688")
@@ -0,0 +1,19 @@
+import sim
+
+
+class BreakoutLTR559:
+    PROXIMITY = 0
+    ALS_0 = 1
+    ALS_1 = 2
+    INTEGRATION_TIME = 3
+    GAIN = 4
+    RATIO = 5
+    LUX = 6
+
+    def __init__(self, i2c, interrupt=None):
+        self._i2c = i2c
+
+    def get_reading(self):
+        sim.i2c_transfer(7, self._i2c.freq)
+        lux = sim.trace("ltr559")
+        return [0, 0, 0, 50, 1, 0, lux]
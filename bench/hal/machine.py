@@ -0,0 +1,115 @@
+# fake machine module for running the firmware off-device, see sim.py
+import sim
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=None, pull=None, value=None):
+        self.id = id
+        self._value = sim.PIN_LEVELS.get(sim.model, {}).get(id, 0) if value is None else int(bool(value))
+        self._handler = None
+        self._trigger = 0
+
+    def init(self, mode=None, pull=None, value=None):
+        if value is not None:
+            self._value = int(bool(value))
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = int(bool(value))
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        self._handler = handler
+        self._trigger = trigger
+        if handler is not None:
+            sim.attach_edges(self)
+
+    # called by sim when the scripted signal on this pin changes
+    def _edge(self):
+        self._value ^= 1
+        trigger = self.IRQ_RISING if self._value else self.IRQ_FALLING
+        if self._handler is not None and self._trigger & trigger:
+            self._handler(self)
+
+
+class PWM:
+    def __init__(self, pin):
+        self.pin = pin
+        self._freq = 0
+        self._duty = 0
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self._duty
+        self._duty = value
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self.running = False
+
+    def init(self, mode=PERIODIC, period=-1, callback=None, **kwargs):
+        self.running = True
+
+    def deinit(self):
+        self.running = False
+
+
+class ADC:
+    def __init__(self, pin):
+        self.pin = pin
+
+    def read_u16(self):
+        if self.pin == 0:
+            return sim.analog("mic")
+        # the other traces are in volts
+        return min(65535, int(sim.analog(self.pin) * 65535 / 3.3))
+
+
+class RTC:
+    def datetime(self, datetime=None):
+        if datetime is None:
+            return (2024, 1, 1, 0, 0, 0, 0, 0)
+
+
+def unique_id():
+    return b"\xe6\x61\x41\x04\x03\x6b\x2a\x2f"
+
+
+def disable_irq():
+    state = sim.irq_disabled
+    sim.irq_disabled = True
+    return state
+
+
+def enable_irq(state):
+    sim.irq_disabled = state
+
+
+def lightsleep(ms=None):
+    sim.clock.skip_us((ms or 0) * 1000)
+
+
+def reset():
+    raise SystemExit("machine.reset()")
@@ -0,0 +1,37 @@
+# fake micropython module, the code emitters just run as regular python
+import builtins
+
+
+def const(value):
+    return value
+
+
+def native(f):
+    return f
+
+
+def viper(f):
+    return f
+
+
+def schedule(f, arg):
+    f(arg)
+    return True
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def mem_info(*args):
+    pass
+
+
+# the viper pointer casts, as views of the buffer's memory
+def _pointer(format):
+    return lambda buffer: memoryview(buffer).cast("B").cast(format)
+
+
+builtins.ptr8 = _pointer("B")
+builtins.ptr16 = _pointer("H")
+builtins.ptr32 = _pointer("i")
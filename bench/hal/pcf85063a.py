@@ -0,0 +1,25 @@
+# fake rtc, records what was asked of it in calls
+import sim
+
+calls = []
+
+
+class PCF85063A:
+    TIMER_TICK_4096HZ = 0
+    TIMER_TICK_64HZ = 1
+    TIMER_TICK_1HZ = 2
+    TIMER_TICK_1_OVER_60HZ = 3
+
+    def __init__(self, i2c):
+        self._i2c = i2c
+
+    def __getattr__(self, name):
+        def call(*args):
+            sim.i2c_transfer(2, self._i2c.freq)
+            calls.append((name,) + args)
+        return call
+
+    def datetime(self, datetime=None):
+        sim.i2c_transfer(7, self._i2c.freq)
+        if datetime is None:
+            return (2024, 1, 1, 0, 0, 0, 0)
@@ -0,0 +1,10 @@
+# fake pimoroni module
+import sim
+
+
+class Analog:
+    def __init__(self, pin, amplifier_gain=1, resistor=0, offset=0):
+        self.pin = pin
+
+    def read_voltage(self):
+        return sim.analog(self.pin)
@@ -0,0 +1,36 @@
+# fake i2c bus, answering with the devices of the board selected in sim
+import sim
+
+
+class PimoroniI2C:
+    def __init__(self, sda, scl, freq=100000):
+        self.freq = sim.i2c_frequencies.get(sda, freq)
+
+    def scan(self):
+        sim.i2c_transfer(128, self.freq)
+        return list(sim.I2C_DEVICES.get(sim.model, []))
+
+    def readfrom_mem(self, address, register, length):
+        sim.i2c_transfer(length, self.freq)
+        if address == 0x12:
+            return sim.pms5003_frame()[:length]
+        return bytes(length)
+
+    def readfrom_mem_into(self, address, register, buffer):
+        data = self.readfrom_mem(address, register, len(buffer))
+        buffer[:len(data)] = data
+
+    def readfrom(self, address, length):
+        return self.readfrom_mem(address, None, length)
+
+    def readfrom_into(self, address, buffer):
+        self.readfrom_mem_into(address, None, buffer)
+
+    def writeto_mem(self, address, register, data):
+        sim.i2c_transfer(len(data), self.freq)
+
+    def writeto(self, address, data):
+        sim.i2c_transfer(len(data), self.freq)
+        if address not in sim.I2C_DEVICES.get(sim.model, []):
+            raise OSError(19)  # ENODEV
+        return len(data)
@@ -0,0 +1,305 @@
+# the simulated world behind the fake hardware modules in bench/hal
+#
+# - a clock that runs at real speed but skips straight over every wait, so a
+#   five second fan spin up costs nothing while cpu time still counts
+# - scripted sensor traces, stepped on each read (i2c sensors) or with time
+#   (analog inputs and pulse trains)
+# - edge generators that call pin irq handlers at the right simulated times
+#
+# call select_model() before importing enviroble so that the fake i2c bus
+# looks like that board
+import math
+import sys
+import time
+
+CPYTHON = sys.implementation.name == "cpython"
+
+_TICKS_PERIOD = 1 << 30
+
+# buses made on these sda pins run at the given clock rather than the one
+# the firmware asks for, to see what another clock would cost
+i2c_frequencies = {}
+
+# what each simulated bus transaction costs, 9 clocks per byte at the bus's
+# clock
+I2C_CLOCKS_PER_BYTE = 9
+I2C_OVERHEAD_BYTES = 3      # address, register and restart
+ADC_READ_US = 2
+
+# the radio link to a central moves data in connection events every
+# CONNECTION_INTERVAL_US. each event carries at most NOTIFICATIONS_PER_EVENT
+# notifications however small they are, or L2CAP_PACKETS_PER_EVENT link layer
+# packets of up to LL_PAYLOAD_BYTES from a connection oriented channel, and
+# the controller queues up to TX_BUFFERS packets waiting to go. these are
+# assumptions, adjust them to match the central you're interested in
+CONNECTION_INTERVAL_US = 7500
+NOTIFICATIONS_PER_EVENT = 1
+L2CAP_PACKETS_PER_EVENT = 4
+LL_PAYLOAD_BYTES = 251
+TX_BUFFERS = 8
+# credits a central grants for a connection oriented channel, one per packet
+L2CAP_CREDITS = 16
+
+# i2c addresses that make enviroble detect each model
+I2C_DEVICES = {
+    "indoor": [0x38, 0x76],
+    "grow": [0x23, 0x77],
+    "weather": [0x23, 0x77],
+    "urban": [0x77]
+}
+
+# pin levels at power on, the weather board has a pull up on pin 12
+PIN_LEVELS = {
+    "weather": {12: 1}
+}
+
+# i2c sensor traces, each read returns the next entry
+TRACES = {
+    # temperature °C, pressure Pa, humidity %
+    "bme280": [
+        (21.50, 101325.0, 45.20),
+        (21.52, 101324.0, 45.18),
+        (21.61, 101321.5, 45.05),
+        (21.80, 101318.0, 44.70),
+        (22.10, 101310.0, 44.10),
+        (21.95, 101312.0, 44.40)
+    ],
+    # temperature, pressure, humidity, gas resistance Ω, status, gas index, meas index
+    "bme688": [
+        (21.50, 101325.0, 45.20, 48000.0, 0xB0, 0, 0),
+        (21.55, 101323.0, 45.10, 49500.0, 0xB0, 0, 0),
+        (21.70, 101320.0, 44.90, 52000.0, 0xB0, 0, 0),
+        (21.65, 101321.0, 45.00, 41000.0, 0xB0, 0, 0)
+    ],
+    # ltr559 lux
+    "ltr559": [123.4, 124.0, 131.5, 410.0, 380.2, 95.5],
+    # bh1745 raw red, green, blue, clear
+    "bh1745": [
+        (100, 200, 80, 400),
+        (102, 205, 81, 410),
+        (300, 420, 250, 1100),
+        (90, 180, 70, 360)
+    ],
+    # pms5003 µg/m³ pm1, pm2.5, pm10
+    "pms5003": [
+        (4, 7, 11),
+        (5, 8, 12),
+        (9, 15, 22),
+        (3, 5, 8)
+    ]
+}
+
+# time based traces for analog inputs, the value changes every TRACE_STEP_MS
+TRACE_STEP_MS = 10 * 1000
+ANALOG_TRACES = {
+    # wind vane voltage on the weather board
+    26: [0.9, 0.9, 2.0, 3.0, 3.0, 2.8, 2.5, 1.5],
+    # microphone amplitude in adc counts on the urban board
+    "mic": [1500, 1600, 4000, 9000, 2500]
+}
+MIC_HZ = 440
+
+# pulse trains on irq inputs in edges per second, changing every TRACE_STEP_MS
+EDGE_TRACES = {
+    "weather": {
+        9: [6.0, 9.0, 14.0, 4.0, 0.0, 7.0],   # anemometer
+        10: [0.0, 0.05, 0.0, 0.0]              # rain bucket
+    },
+    "grow": {
+        15: [25.0, 25.0, 24.5],                # moisture a
+        14: [40.0, 41.0, 39.0],                # moisture b
+        13: [15.0, 15.5, 16.0]                 # moisture c
+    }
+}
+
+model = None
+_trace_index = {}
+_edge_sources = []
+irq_disabled = False
+
+
+def select_model(name):
+    global model
+    model = name
+    _trace_index.clear()
+    _edge_sources.clear()
+
+
+def trace(name):
+    entries = TRACES[name]
+    index = _trace_index.get(name, 0)
+    _trace_index[name] = index + 1
+    return entries[index % len(entries)]
+
+
+def timed_trace(entries):
+    step = clock.now_us() // (TRACE_STEP_MS * 1000)
+    return entries[step % len(entries)]
+
+
+# clock
+# ===========================================================================
+class Clock:
+    def __init__(self):
+        self.skipped_us = 0
+        self.irq_us = None
+        self._start = time.perf_counter()
+
+    def now_us(self):
+        if self.irq_us is not None:
+            return self.irq_us
+        now = int((time.perf_counter() - self._start) * 1000000) + self.skipped_us
+        if _edge_sources and not irq_disabled:
+            _deliver_edges(now)
+        return now
+
+    # move the clock on without spending any real time, as though the cpu
+    # had been blocked for us
+    def skip_us(self, us):
+        self.skipped_us += max(0, int(us))
+
+
+clock = Clock()
+
+
+def ticks_ms():
+    return (clock.now_us() // 1000) % _TICKS_PERIOD
+
+
+def ticks_us():
+    return clock.now_us() % _TICKS_PERIOD
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) % _TICKS_PERIOD
+
+
+def ticks_diff(end, start):
+    diff = (end - start) % _TICKS_PERIOD
+    return diff - _TICKS_PERIOD if diff >= _TICKS_PERIOD // 2 else diff
+
+
+# put the simulated clock behind the MicroPython time functions
+def install():
+    if not CPYTHON:
+        # MicroPython's time module can't be patched, the fakes run on its
+        # real clock instead
+        return
+    epoch = int(time.time())
+    mktime = time.mktime
+    time.ticks_ms = ticks_ms
+    time.ticks_us = ticks_us
+    time.ticks_add = ticks_add
+    time.ticks_diff = ticks_diff
+    time.sleep_ms = lambda ms: clock.skip_us(ms * 1000)
+    time.sleep_us = clock.skip_us
+    time.sleep = lambda s: clock.skip_us(s * 1000000)
+    time.time = lambda: epoch + clock.now_us() // 1000000
+    # MicroPython's mktime takes an 8-tuple
+    time.mktime = lambda t: int(mktime(tuple(t) + (0,) * (9 - len(t))))
+
+
+# radio
+# ===========================================================================
+# packets queued in the controller for one connection, going out per_event at
+# a time in each connection event
+class Link:
+    def __init__(self, per_event):
+        self.per_event = per_event
+        self.queued = 0
+        self.packets = 0
+        # when the last packet queued goes out
+        self.delivered_us = 0
+        self._event = clock.now_us() // CONNECTION_INTERVAL_US
+
+    def _drain(self):
+        event = clock.now_us() // CONNECTION_INTERVAL_US
+        self.queued = max(0, self.queued - (event - self._event) * self.per_event)
+        self._event = event
+
+    def room(self):
+        self._drain()
+        return TX_BUFFERS - self.queued
+
+    def queue(self, packets):
+        self._drain()
+        self.queued += packets
+        self.packets += packets
+        if not self.per_event:
+            return
+        last_event = self._event + 1 + (self.queued - 1) // self.per_event
+        self.delivered_us = last_event * CONNECTION_INTERVAL_US
+
+
+# link layer packets needed for an l2cap sdu of size bytes, each carrying a
+# four byte header and the first the sdu length too
+def l2cap_packets(size):
+    room = LL_PAYLOAD_BYTES - 4
+    return (size + 2 + room - 1) // room
+
+
+# edges
+# ===========================================================================
+class _EdgeSource:
+    def __init__(self, pin, rates):
+        self.pin = pin
+        self.rates = rates
+        self.next_us = self._after(clock.now_us())
+
+    # time of the next edge after t, or None if the trace never has any
+    def _after(self, t):
+        step_us = TRACE_STEP_MS * 1000
+        for i in range(len(self.rates)):
+            step = t // step_us
+            rate = self.rates[step % len(self.rates)]
+            if rate > 0:
+                return t + int(1000000 / rate)
+            t = (step + 1) * step_us
+        return None
+
+
+def _deliver_edges(now):
+    for source in _edge_sources:
+        while source.next_us is not None and source.next_us <= now:
+            clock.irq_us = source.next_us
+            try:
+                source.pin._edge()
+            finally:
+                clock.irq_us = None
+            source.next_us = source._after(source.next_us)
+
+
+# called by the fake Pin when an irq handler is attached
+def attach_edges(pin):
+    rates = EDGE_TRACES.get(model, {}).get(pin.id)
+    if rates:
+        _edge_sources.append(_EdgeSource(pin, rates))
+
+
+# analog
+# ===========================================================================
+def analog(channel):
+    clock.skip_us(ADC_READ_US)
+    if channel == "mic":
+        amplitude = timed_trace(ANALOG_TRACES["mic"])
+        phase = clock.now_us() * MIC_HZ * 2 * math.pi / 1000000
+        return int(32768 + amplitude * math.sin(phase))
+    return timed_trace(ANALOG_TRACES.get(channel, [0]))
+
+
+# i2c
+# ===========================================================================
+def i2c_transfer(length, freq=100000):
+    clock.skip_us((length + I2C_OVERHEAD_BYTES) * I2C_CLOCKS_PER_BYTE * 1000000 // freq)
+
+
+# a 32 byte pms5003 frame carrying pm values from the trace
+def pms5003_frame():
+    pm1, pm2_5, pm10 = trace("pms5003")
+    words = [28, pm1, pm2_5, pm10, pm1, pm2_5, pm10,
+             pm1 * 60, pm1 * 20, pm1 * 5, pm2_5, pm10 // 2, pm10 // 4, 0x9700]
+    frame = bytearray(b"\x42\x4d")
+    for word in words:
+        frame += word.to_bytes(2, "big")
+    checksum = sum(frame)
+    return bytes(frame + checksum.to_bytes(2, "big"))
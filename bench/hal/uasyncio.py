@@ -0,0 +1,71 @@
+# fake uasyncio on top of CPython's asyncio, running on the simulated clock
+# so that sleeps end as soon as nothing else is ready to run
+import sim
+from asyncio import (CancelledError, Event, Lock, Queue, Semaphore, TimeoutError, create_task,
+                     current_task, ensure_future, gather, get_event_loop, sleep, wait_for)
+import asyncio as _asyncio
+
+
+async def sleep_ms(ms):
+    await _asyncio.sleep(ms / 1000)
+
+
+async def wait_for_ms(aw, timeout_ms):
+    return await _asyncio.wait_for(aw, timeout_ms / 1000)
+
+
+# set() may be called from an irq handler, which in the simulation always
+# runs in the event loop's thread
+class ThreadSafeFlag:
+    def __init__(self):
+        self._event = _asyncio.Event()
+
+    def set(self):
+        self._event.set()
+
+    def clear(self):
+        self._event.clear()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
+
+
+# an event loop that moves the simulated clock on instead of blocking
+class _Selector:
+    def __init__(self, selector):
+        self._selector = selector
+
+    def select(self, timeout=None):
+        events = self._selector.select(0)
+        if not events:
+            if timeout is None:
+                raise RuntimeError("simulation deadlocked, every task is waiting on an event")
+            sim.clock.skip_us(timeout * 1000000)
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class SimulatedLoop(_asyncio.SelectorEventLoop):
+    def __init__(self):
+        super().__init__()
+        self._selector = _Selector(self._selector)
+
+    def time(self):
+        return sim.clock.now_us() / 1000000
+
+
+def new_event_loop():
+    return SimulatedLoop()
+
+
+def run(coro):
+    loop = SimulatedLoop()
+    _asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        _asyncio.set_event_loop(None)
+        loop.close()
@@ -0,0 +1,10 @@
+# fake wakeup module, the board woke from the rtc alarm
+gpio_state = 1 << 8
+
+
+def get_gpio_state():
+    return gpio_state
+
+
+def reset_gpio_state():
+    pass
@@ -0,0 +1,160 @@
+# python3 bench/hotpaths.py [--iterations N]
+#
+# microbenchmarks of the firmware's small hot paths against the float maths
+# they replaced, reporting the time and bytes allocated per call for each:
+#
+#   led callback     the pulsing activity led's 50ms timer callback
+#   activity_led     setting the activity led's brightness
+#   wind_direction   reading the weather board's wind vane
+#   lux              indoor lux from the bh1745's rgbc
+#   colour temp      indoor colour temperature from the bh1745's rgbc
+#
+# under CPython this compares the interpreter work each version does. the
+# allocations matter more on the board, where the led callback runs as a
+# hard interrupt and mustn't allocate at all. they differ between the two
+# though: CPython allocates every int over 256 and recycles floats, where
+# MicroPython allocates every float but no int under 2**30. lux and colour
+# temp work in such ints, so they allocate here but not on the board
+import math
+import sys
+import time
+
+from benchmark import Allocations, setup
+
+try:
+    from time import perf_counter
+except ImportError:
+    def perf_counter():
+        return time.ticks_us() / 1000000
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+RGBC = (1200, 1500, 900, 3000)
+
+
+# a wind vane that always reads the same, the simulated one works its raw
+# reading out from a voltage each time, allocating an int the board's adc
+# wouldn't
+class SteadyVane:
+    def __init__(self, raw):
+        self.raw = raw
+
+    def read_u16(self):
+        return self.raw
+
+
+# what each function used to be, for comparison
+# ===========================================================================
+def legacy_led_callback(pwm, speed_hz=1):
+    brightness = (math.sin(time.ticks_ms() * math.pi * 2 / (1000 / speed_hz)) * 40) + 60
+    value = int(pow(brightness / 100.0, 2.8) * 65535.0 + 0.5)
+    pwm.duty_u16(value)
+
+
+def legacy_activity_led(pwm, brightness):
+    brightness = max(0, min(100, brightness))
+    value = int(pow(brightness / 100.0, 2.8) * 65535.0 + 0.5)
+    pwm.duty_u16(value)
+
+
+def legacy_wind_direction(pin):
+    ADC_TO_DEGREES = (0.9, 2.0, 3.0, 2.8, 2.5, 1.5, 0.3, 0.6)
+    closest_index = -1
+    last_index = None
+    while True:
+        value = pin.read_u16() * 3.3 / 65535
+        closest_index = -1
+        closest_value = float('inf')
+        for i in range(8):
+            distance = abs(ADC_TO_DEGREES[i] - value)
+            if distance < closest_value:
+                closest_value = distance
+                closest_index = i
+        if last_index == closest_index:
+            break
+        last_index = closest_index
+    return closest_index * 45
+
+
+def legacy_lux(r, g, b, c):
+    if g < 1:
+        tmp = 0
+    elif (c / g < 0.160):
+        tmp = 0.202 * r + 0.766 * g
+    else:
+        tmp = 0.159 * r + 0.646 * g
+    tmp = 0 if tmp < 0 else tmp
+    return round(tmp / 1 / 160 * 160)
+
+
+def legacy_colour_temperature(r, g, b, c):
+    if (g < 1) or (r + g + b < 1):
+        return 0
+    r_ratio = r / (r + g + b)
+    b_ratio = b / (r + g + b)
+    e = 2.71828
+    if c / g < 0.160:
+        b_eff = min(b_ratio * 3.13, 1)
+        ct = ((1 - b_eff) * 12746 * (e ** (-2.911 * r_ratio))) + (b_eff * 1637 * (e ** (4.865 * b_ratio)))
+    else:
+        b_eff = min(b_ratio * 10.67, 1)
+        ct = ((1 - b_eff) * 16234 * (e ** (-2.781 * r_ratio))) + (b_eff * 1882 * (e ** (4.448 * b_ratio)))
+    if ct > 10000:
+        ct = 10000
+    return round(ct)
+
+
+# ===========================================================================
+def measure(f, iterations):
+    allocations = Allocations()
+    start = perf_counter()
+    for i in range(iterations):
+        f()
+    elapsed = (perf_counter() - start) * 1000000 / iterations
+    # measured after the timed runs, CPython allocates as it specialises the
+    # bytecode over the first few calls
+    if tracemalloc is not None:
+        tracemalloc.start()
+    allocations.start()
+    f()
+    allocations.stop()
+    if tracemalloc is not None:
+        tracemalloc.stop()
+    return elapsed, allocations.bytes
+
+
+def main(argv):
+    iterations = 10000
+    args = iter(argv)
+    for arg in args:
+        if arg == "--iterations":
+            iterations = int(next(args))
+
+    setup("weather")
+    import enviroble
+    from enviroble.boards import indoor, weather
+
+    pwm = enviroble.activity_led_output()
+    enviroble.pulse_activity_led(1)
+    vane = SteadyVane(weather.wind_direction_pin.read_u16())
+    weather.wind_direction_pin = vane
+
+    pairs = (
+        ("led callback", lambda: legacy_led_callback(pwm), lambda: enviroble.activity_led_callback(None)),
+        ("activity_led", lambda: legacy_activity_led(pwm, 37), lambda: enviroble.activity_led(37)),
+        ("wind_direction", lambda: legacy_wind_direction(vane), weather.wind_direction),
+        ("lux", lambda: legacy_lux(*RGBC), lambda: indoor.lux_from_rgbc(*RGBC)),
+        ("colour temp", lambda: legacy_colour_temperature(*RGBC), lambda: indoor.colour_temperature_from_rgbc(*RGBC))
+    )
+
+    print(f"{'function':<16}{'old us':>9}{'new us':>9}{'speedup':>9}{'old B':>8}{'new B':>8}")
+    for title, old, new in pairs:
+        old_us, old_bytes = measure(old, iterations)
+        new_us, new_bytes = measure(new, iterations)
+        print(f"{title:<16}{old_us:>9.2f}{new_us:>9.2f}{old_us / new_us:>8.1f}x{old_bytes:>8}{new_bytes:>8}")
+
+
+main(sys.argv[1:])
@@ -0,0 +1,130 @@
+# python3 bench/humidity.py [--iterations N]
+#
+# compares enviroble.humidity's saturation vapour pressure table with the
+# closed form helpers it's built from, for accuracy across the temperature
+# sensors' working range and for time and bytes allocated per call:
+#
+#   svp            saturation vapour pressure at a temperature
+#   compensation   lowering the temperature by the usb power offset and
+#                  adjusting the humidity to match, the way indoor.py's old
+#                  commented out code did it with the helpers
+#   dew point      from temperature and humidity, against the closed form
+#                  inverted by bisection
+#
+# under CPython, where exp() and powers are cheap, this mostly compares the
+# interpreter work each version does. the difference is bigger on the board
+import gc
+import sys
+import time
+
+from benchmark import setup
+
+try:
+    from time import perf_counter
+except ImportError:
+    def perf_counter():
+        return time.ticks_us() / 1000000
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+OFFSET_C = 4.5
+
+
+def measure(f, iterations):
+    f()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        f()
+        allocated = tracemalloc.get_traced_memory()[1] - start
+        tracemalloc.stop()
+    else:
+        gc.collect()
+        gc.disable()
+        start = gc.mem_alloc()
+        f()
+        allocated = gc.mem_alloc() - start
+        gc.enable()
+    start = perf_counter()
+    for i in range(iterations):
+        f()
+    return (perf_counter() - start) * 1000000 / iterations, allocated
+
+
+def main(argv):
+    iterations = 10000
+    args = iter(argv)
+    for arg in args:
+        if arg == "--iterations":
+            iterations = int(next(args))
+
+    setup()
+    import enviroble.helpers as helpers
+    import enviroble.humidity as humidity
+
+    def closed_svp(temperature):
+        return helpers.get_saturation_vapor_pressure(helpers.celcius_to_kelvin(temperature))
+
+    def closed_compensation(temperature, relative_humidity):
+        adjusted = temperature - OFFSET_C
+        absolute = helpers.relative_to_absolute_humidity(relative_humidity, temperature)
+        return adjusted, helpers.absolute_to_relative_humidity(absolute, adjusted)
+
+    def table_compensation(temperature, relative_humidity):
+        adjusted = temperature - OFFSET_C
+        return adjusted, humidity.adjust_relative_humidity(relative_humidity, temperature, adjusted)
+
+    def closed_dew_point(temperature, relative_humidity):
+        pressure = closed_svp(temperature) * relative_humidity / 100
+        low, high = humidity.SVP_MINIMUM_C, temperature
+        for i in range(40):
+            middle = (low + high) / 2
+            if closed_svp(middle) < pressure:
+                low = middle
+            else:
+                high = middle
+        return (low + high) / 2
+
+    # accuracy, every 0.01 degrees across the table
+    worst_svp = 0
+    for i in range(humidity.SVP_MINIMUM_C * 100, humidity.SVP_MAXIMUM_C * 100 + 1):
+        temperature = i / 100
+        reference = closed_svp(temperature)
+        worst_svp = max(worst_svp, abs(humidity.saturation_vapor_pressure(temperature) - reference) / reference)
+
+    worst_compensation = 0
+    worst_dew_point = 0
+    for temperature in range(-30, 80):
+        temperature += 0.37
+        for relative_humidity in range(5, 100, 5):
+            reference = min(100, closed_compensation(temperature, relative_humidity)[1])
+            error = abs(table_compensation(temperature, relative_humidity)[1] - reference)
+            worst_compensation = max(worst_compensation, error)
+            if closed_dew_point(temperature, relative_humidity) > humidity.SVP_MINIMUM_C + 0.01:
+                error = abs(humidity.dew_point(temperature, relative_humidity) -
+                            closed_dew_point(temperature, relative_humidity))
+                worst_dew_point = max(worst_dew_point, error)
+
+    print(f"{'function':<14}{'worst error':>14}")
+    print(f"{'svp':<14}{worst_svp * 100:>13.4f}%")
+    print(f"{'compensation':<14}{worst_compensation:>12.4f}%RH")
+    print(f"{'dew point':<14}{worst_dew_point:>13.4f}C")
+    print()
+
+    pairs = (
+        ("svp", lambda: closed_svp(22.3), lambda: humidity.saturation_vapor_pressure(22.3)),
+        ("compensation", lambda: closed_compensation(26.8, 41.2), lambda: table_compensation(26.8, 41.2)),
+        ("dew point", lambda: closed_dew_point(22.3, 45.6), lambda: humidity.dew_point(22.3, 45.6))
+    )
+
+    print(f"{'function':<14}{'old us':>9}{'new us':>9}{'speedup':>9}{'old B':>8}{'new B':>8}")
+    for title, old, new in pairs:
+        old_us, old_bytes = measure(old, iterations)
+        new_us, new_bytes = measure(new, iterations)
+        print(f"{title:<14}{old_us:>9.2f}{new_us:>9.2f}{old_us / new_us:>8.1f}x{old_bytes:>8}{new_bytes:>8}")
+
+
+main(sys.argv[1:])
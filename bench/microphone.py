@@ -0,0 +1,85 @@
+# python3 bench/microphone.py [--readings N]
+#
+# compares the Urban's microphone readings, the read_u16() loop it used to
+# take noise readings with and read_microphone() as it is now, against the
+# fake microphone in bench/hal. for each it reports:
+#
+#   samples      samples per reading
+#   rate         samples per simulated second while capturing
+#   cpu ms       real time per reading
+#   sim ms       simulated time per reading
+#
+# under CPython the viper functions run as regular python and the capture is
+# paced by the fake clock, so the cpu times only compare the two loops'
+# python overheads. run it under the unix MicroPython port to have the
+# number crunching compiled, the captures then take real time
+import sys
+
+from benchmark import setup
+
+try:
+    from time import perf_counter
+except ImportError:
+    import time
+
+    def perf_counter():
+        return time.ticks_us() / 1000000
+
+
+# the loop read_microphone() used before it captured at a fixed rate, for
+# comparison, returning its reading and how many samples it took
+async def legacy_read_microphone(urban):
+    import time
+    import uasyncio as asyncio
+    start = time.ticks_ms()
+    min_value = 1.65
+    max_value = 1.65
+    samples = 0
+    while time.ticks_diff(time.ticks_ms(), start) < urban.MIC_SAMPLE_TIME_MS:
+        for _ in range(64):
+            value = (urban.noise_adc.read_u16() * 3.3) / 65535
+            min_value = min(min_value, value)
+            max_value = max(max_value, value)
+        samples += 64
+        await asyncio.sleep_ms(0)
+    return {"noise": round(max_value - min_value, 3)}, samples
+
+
+async def fixed_rate_read_microphone(urban):
+    blocks = max(1, urban.MIC_SAMPLE_TIME_MS * urban.MIC_SAMPLE_RATE_HZ // (1000 * urban.MIC_BLOCK_SAMPLES))
+    return await urban.read_microphone(0), blocks * urban.MIC_BLOCK_SAMPLES
+
+
+def main(argv):
+    readings = 5
+    args = iter(argv)
+    for arg in args:
+        if arg == "--readings":
+            readings = int(next(args))
+
+    setup("urban")
+    import sim
+    import uasyncio as asyncio
+    from enviroble.boards import urban
+
+    async def run(read):
+        results = {"cpu": 0, "sim": 0, "samples": 0}
+        # once to warm up
+        await read(urban)
+        for i in range(readings):
+            start, sim_start = perf_counter(), sim.clock.now_us()
+            reading, samples = await read(urban)
+            results["cpu"] += perf_counter() - start
+            results["sim"] += (sim.clock.now_us() - sim_start) / 1000000
+            results["samples"] += samples
+        return reading, results
+
+    print(f"{'loop':<12}{'samples':>9}{'rate':>9}{'cpu ms':>9}{'sim ms':>9}  reading")
+    for title, read in (("read_u16", legacy_read_microphone), ("fixed rate", fixed_rate_read_microphone)):
+        reading, results = asyncio.run(run(read))
+        print(f"{title:<12}{results['samples'] / readings:>9.0f}{results['samples'] / results['sim']:>9.0f}"
+              f"{results['cpu'] * 1000 / readings:>9.1f}{results['sim'] * 1000 / readings:>9.1f}  {reading}")
+    print(f"late or overrun capture blocks: {urban.mic_overruns}")
+
+
+main(sys.argv[1:])
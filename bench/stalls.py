@@ -0,0 +1,105 @@
+# python3 bench/stalls.py [MODEL ...] [--cycles N]
+#
+# how long the event loop stalls while each board takes its readings. every
+# wait in get_sensor_readings() is an asyncio.sleep_ms() that lets the other
+# tasks run. for comparison each board is run again with those waits made
+# blocking, the way the time.sleep() calls and busy loops they replaced were,
+# by swapping sleep_ms for one that moves the simulated clock on without
+# yielding. for each board it reports:
+#
+#   yielding ms   the worst event loop lag, how late a task asking to run
+#                 every millisecond got to run
+#   blocking ms   the same with every wait blocking
+#
+# each model runs in its own interpreter, as in benchmark.py
+import sys
+
+from benchmark import CYCLE_PERIOD_MS, MODELS, load_firmware
+
+CYCLES = 3
+
+
+def stalls(model, cycles):
+    firmware = load_firmware(model)
+    import sim
+    import uasyncio as asyncio
+
+    board = firmware["board"]
+    sleep_ms = asyncio.sleep_ms
+
+    async def blocking_sleep_ms(ms):
+        sim.clock.skip_us(ms * 1000)
+
+    worst = [0]
+
+    async def lag_probe():
+        while True:
+            start = sim.clock.now_us()
+            await sleep_ms(1)
+            worst[0] = max(worst[0], (sim.clock.now_us() - start) / 1000 - 1)
+
+    async def measure(blocking):
+        worst[0] = 0
+        for cycle in range(cycles):
+            probe = asyncio.create_task(lag_probe())
+            await sleep_ms(0)
+            if blocking:
+                asyncio.sleep_ms = blocking_sleep_ms
+            try:
+                await board.get_sensor_readings(CYCLE_PERIOD_MS / 1000)
+            finally:
+                asyncio.sleep_ms = sleep_ms
+            # give the probe a chance to see a cycle that never yielded
+            await sleep_ms(1)
+            probe.cancel()
+            await sleep_ms(CYCLE_PERIOD_MS)
+        return worst[0]
+
+    async def run():
+        # the first cycle primes the edge counters
+        await board.get_sensor_readings(0)
+        await sleep_ms(CYCLE_PERIOD_MS)
+        return await measure(False), await measure(True)
+
+    yielding, blocking = asyncio.run(run())
+    print(f"{model:<10}{yielding:>13.2f}{blocking:>13.2f}")
+
+
+def header():
+    print(f"{'model':<10}{'yielding ms':>13}{'blocking ms':>13}")
+
+
+def main(argv):
+    cycles = CYCLES
+    models = []
+    child = False
+    args = iter(argv)
+    for arg in args:
+        if arg == "--cycles":
+            cycles = int(next(args))
+        elif arg == "--child":
+            child = True
+        else:
+            models.append(arg)
+
+    if child or sys.implementation.name != "cpython":
+        if not child:
+            header()
+        for model in models or MODELS[:1]:
+            stalls(model, cycles)
+        return
+
+    import subprocess
+    header()
+    for model in models or MODELS:
+        sys.stdout.flush()
+        command = [sys.executable, __file__, "--child", "--cycles", str(cycles), model]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode == 0:
+            print(result.stdout, end="")
+        else:
+            print(f"{model:<10}failed: {result.stderr.strip().splitlines()[-1]}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,223 @@
+# python3 bench/stream.py [--model MODEL] [--records N]
+#
+# loopback comparison of the ways a central can get data off a board, with
+# the firmware's sending code on one side, the client library's decoding on
+# the other and the fake radio link from bench/hal in between:
+#
+#   notifications   a history download through the history characteristic
+#   l2cap stream    the same download over the l2cap stream
+#
+# for each it reports the bytes moved, link layer packets, simulated time and
+# throughput. the time depends entirely on the link model in bench/hal/sim.py,
+# so compare the transports with each other rather than with real hardware.
+#
+# then it checks flow control: a central that stops reading must not hold up
+# the board, whose live stream frames are dropped after their timeout. and
+# that two centrals can stream at once: each downloading history gets every
+# record itself, and once one has gone the other still gets the live frames
+import struct
+import sys
+
+from benchmark import setup
+
+MTUS = (23, 247)
+STREAM_MTU = 512
+LIVE_FRAMES = 20
+LIVE_TIMEOUT_MS = 500
+
+
+def fill_history(model, records):
+    from enviroble.history import History
+    import enviroble.schema as schema
+
+    history = History(model, records)
+    readings = {}
+    for name in schema.COMPACT_RECORDS[model][2]:
+        readings[schema.FIELDS[name][0]] = 1.0
+    for i in range(records):
+        history.append(readings, 1700000000 + i * 60)
+    return history
+
+
+async def notifications(history, mtu):
+    import aioble
+    import sim
+    import enviroble
+    import enviroble.schema as schema
+
+    service = aioble.Service("bench")
+    characteristic = enviroble.EnviroHistory(service, history)
+    connection = aioble.DeviceConnection(mtu=mtu)
+    start = sim.clock.now_us()
+    await characteristic.send_since(connection, 0)
+
+    data = b"".join(data for c, data in connection.received)
+    records = len(schema.unpack_history(data))
+    return records, len(data), connection.link.packets, connection.link.delivered_us - start
+
+
+async def l2cap(history):
+    import aioble
+    import sim
+    import uasyncio as asyncio
+    import enviroble.schema as schema
+    from enviroble.stream import StreamServer
+    from enviroble.client import FrameReader
+
+    server = StreamServer(history, STREAM_MTU)
+    connection = aioble.DeviceConnection(mtu=247)
+    accept = asyncio.create_task(server.accept(connection))
+    await asyncio.sleep_ms(0)
+    channel = await connection.l2cap_connect(schema.STREAM_PSM, STREAM_MTU)
+    await asyncio.sleep_ms(0)
+
+    start = sim.clock.now_us()
+    request = struct.pack(schema.HISTORY_REQUEST, 0)
+    await channel.send(struct.pack(schema.STREAM_HEADER, schema.STREAM_HISTORY, 0, len(request)) + request)
+
+    reader = FrameReader()
+    buffer = bytearray(STREAM_MTU)
+    data = bytearray()
+    received = 0
+    done = False
+    while not done:
+        count = await channel.recvinto(buffer)
+        received += count
+        for frame in reader.feed(buffer[:count]):
+            if not frame.payload:
+                done = True
+            data += frame.payload
+
+    records = len(schema.unpack_history(data))
+    elapsed = connection.l2cap_link.delivered_us - start
+    await channel.disconnect()
+    await accept
+    return records, received, connection.l2cap_link.packets, elapsed
+
+
+# a central that opens the stream and never reads from it
+async def stalled(history):
+    import aioble
+    import sim
+    import uasyncio as asyncio
+    import enviroble.schema as schema
+    from enviroble.stream import StreamServer
+
+    server = StreamServer(history, STREAM_MTU)
+    connection = aioble.DeviceConnection(mtu=247)
+    accept = asyncio.create_task(server.accept(connection))
+    await asyncio.sleep_ms(0)
+    channel = await connection.l2cap_connect(schema.STREAM_PSM, STREAM_MTU)
+    await asyncio.sleep_ms(0)
+
+    samples = bytearray(2 * 1024)
+    longest = 0
+    for i in range(LIVE_FRAMES):
+        start = sim.clock.now_us()
+        await server.send(schema.STREAM_MICROPHONE, samples, LIVE_TIMEOUT_MS)
+        longest = max(longest, sim.clock.now_us() - start)
+    await channel.disconnect()
+    await accept
+    return server.sent, server.dropped, longest
+
+
+# download history over the stream from an open channel
+async def download(channel):
+    import enviroble.schema as schema
+    from enviroble.client import FrameReader
+
+    request = struct.pack(schema.HISTORY_REQUEST, 0)
+    await channel.send(struct.pack(schema.STREAM_HEADER, schema.STREAM_HISTORY, 0, len(request)) + request)
+    reader = FrameReader()
+    buffer = bytearray(STREAM_MTU)
+    data = bytearray()
+    while True:
+        count = await channel.recvinto(buffer)
+        for frame in reader.feed(buffer[:count]):
+            if not frame.payload:
+                return len(schema.unpack_history(data))
+            data += frame.payload
+
+
+# two centrals with the stream open at once
+async def two_centrals(history):
+    import aioble
+    import uasyncio as asyncio
+    import enviroble.schema as schema
+    from enviroble.stream import StreamServer
+    from enviroble.client import FrameReader
+
+    server = StreamServer(history, STREAM_MTU)
+    connections = [aioble.DeviceConnection(mtu=247) for i in range(2)]
+    accepts = [asyncio.create_task(server.accept(connection)) for connection in connections]
+    await asyncio.sleep_ms(0)
+    channels = []
+    for connection in connections:
+        channels.append(await connection.l2cap_connect(schema.STREAM_PSM, STREAM_MTU))
+        await asyncio.sleep_ms(0)
+
+    records = await asyncio.gather(*[download(channel) for channel in channels])
+
+    # the first leaves, the second should still get live frames
+    await channels[0].disconnect()
+    await accepts[0]
+    samples = bytes(64)
+    sent = 0
+    for i in range(LIVE_FRAMES):
+        if await server.send(schema.STREAM_MICROPHONE, samples, LIVE_TIMEOUT_MS):
+            sent += 1
+    reader = FrameReader()
+    buffer = bytearray(STREAM_MTU)
+    live = 0
+    while channels[1].available():
+        count = await channels[1].recvinto(buffer)
+        live += sum(1 for frame in reader.feed(buffer[:count]) if frame.stream == schema.STREAM_MICROPHONE)
+    await channels[1].disconnect()
+    await accepts[1]
+    return records, sent, live
+
+
+def main(argv):
+    model = "weather"
+    records = 24 * 60
+    args = iter(argv)
+    for arg in args:
+        if arg == "--model":
+            model = next(args)
+        elif arg == "--records":
+            records = int(next(args))
+
+    setup(model)
+    import sim
+    import uasyncio as asyncio
+    history = fill_history(model, records)
+
+    async def run():
+        results = []
+        for mtu in MTUS:
+            results.append(("notifications", mtu, await notifications(history, mtu)))
+        results.append(("l2cap stream", STREAM_MTU, await l2cap(history)))
+        return results, await stalled(history), await two_centrals(history)
+
+    results, (sent, dropped, longest), (both_records, live_sent, live) = asyncio.run(run())
+
+    print(f"{records} {model} history records, {history.record_size}B each")
+    print(f"{'transport':<16}{'mtu':>6}{'records':>9}{'bytes':>9}{'packets':>9}{'sim ms':>9}{'kB/s':>8}{'vs notify':>10}")
+    # compared with notifications at the biggest MTU
+    count, size, packets, elapsed_us = results[len(MTUS) - 1][2]
+    baseline = size / elapsed_us * 1000
+    for title, mtu, (count, size, packets, elapsed_us) in results:
+        rate = size / elapsed_us * 1000
+        print(f"{title:<16}{mtu:>6}{count:>9}{size:>9}{packets:>9}{elapsed_us / 1000:>9.0f}"
+              f"{rate:>8.1f}{rate / baseline:>9.1f}x")
+
+    print()
+    print(f"stalled central: {sent} live frames sent, {dropped} dropped, "
+          f"longest send {longest / 1000:.0f}ms (timeout {LIVE_TIMEOUT_MS}ms)")
+    print(f"two centrals: history records {both_records[0]} and {both_records[1]} of {records}, "
+          f"after one left the other got {live} of {live_sent} live frames")
+    print(f"link model: {sim.CONNECTION_INTERVAL_US / 1000}ms connection interval, "
+          f"{sim.NOTIFICATIONS_PER_EVENT} notification or {sim.L2CAP_PACKETS_PER_EVENT} l2cap packets per event")
+
+
+main(sys.argv[1:])
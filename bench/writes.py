@@ -0,0 +1,110 @@
+# python3 bench/writes.py [--writes N]
+#
+# writes to the Grow's pump characteristics the way a central would, with
+# the io_task loop that used to poll them and with enviroble.writes, and
+# reports for each:
+#
+#   latency ms   simulated time from a central writing 1 to a pump
+#                characteristic to the pump's pin going high, mean and worst
+#   idle wakes   how many times the characteristics were waited on in a
+#                minute without any writes
+#
+# the sensors keep sampling throughout, as they would on the board
+import sys
+
+from benchmark import load_firmware
+
+WRITES = 20
+
+# simulated time between writes, not a multiple of the old loop's period so
+# that the writes land all over it
+WRITE_INTERVAL_MS = 2370
+
+IDLE_MS = 60 * 1000
+
+
+# the loop that used to poll the pump characteristics, for comparison
+async def legacy_io_task(pump_channels):
+    import uasyncio as asyncio
+    while True:
+        for pump_channel in pump_channels:
+            try:
+                await pump_channel.written(100)
+                pump_channel.set_from(pump_channel.read())
+            except asyncio.TimeoutError:
+                pass
+        await asyncio.sleep_ms(1000 * 1)
+
+
+def main(argv):
+    writes = WRITES
+    args = iter(argv)
+    for arg in args:
+        if arg == "--writes":
+            writes = int(next(args))
+
+    firmware = load_firmware("grow")
+    import sim
+    import uasyncio as asyncio
+
+    board = firmware["board"]
+    pump_channels = firmware["pump_channels"]
+    characteristics = pump_channels + firmware["target_channels"]
+
+    # when each pump's pin last went high
+    switched = {}
+    for pin in board.pump_pins:
+        def value(v=None, pin=pin, original=pin.value):
+            if v:
+                switched[pin] = sim.clock.now_us()
+            return original(v)
+        pin.value = value
+
+    # how many times each characteristic has been waited on
+    waits = [0]
+    for characteristic in characteristics:
+        def written(timeout_ms=None, original=characteristic.written):
+            waits[0] += 1
+            return original(timeout_ms)
+        characteristic.written = written
+
+    async def run(dispatcher):
+        tasks = [asyncio.create_task(firmware["sensor_task"]()), asyncio.create_task(dispatcher)]
+        await asyncio.sleep_ms(WRITE_INTERVAL_MS)
+
+        latencies = []
+        for i in range(writes):
+            channel = i % len(pump_channels)
+            pin = board.pump_pins[channel]
+            switched.pop(pin, None)
+            start = sim.clock.now_us()
+            pump_channels[channel].central_write(b"\x01\x00")
+            while pin not in switched:
+                await asyncio.sleep_ms(0)
+            latencies.append((switched[pin] - start) / 1000)
+            await asyncio.sleep_ms(WRITE_INTERVAL_MS)
+            pump_channels[channel].central_write(b"\x00\x00")
+            await asyncio.sleep_ms(WRITE_INTERVAL_MS)
+
+        await asyncio.sleep_ms(WRITE_INTERVAL_MS)
+        idle_start = waits[0]
+        await asyncio.sleep_ms(IDLE_MS)
+        idle = waits[0] - idle_start
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return latencies, idle
+
+    # both in one event loop, the characteristics' events belong to it
+    async def compare():
+        print(f"{'dispatch':<12}{'mean ms':>9}{'worst ms':>10}{'idle wakes':>12}")
+        for title, dispatcher in (("io_task", legacy_io_task(pump_channels)),
+                                  ("writes", firmware["enviroble"].writes.run())):
+            latencies, idle = await run(dispatcher)
+            print(f"{title:<12}{sum(latencies) / len(latencies):>9.1f}{max(latencies):>10.1f}{idle:>12}")
+
+    asyncio.run(compare())
+
+
+main(sys.argv[1:])
@@ -1,16 +1,52 @@
-import time
+import uasyncio as asyncio
 from breakout_bme280 import BreakoutBME280
 from breakout_ltr559 import BreakoutLTR559
 from machine import Pin, PWM
-from enviroble import i2c, logging
+from enviroble import i2c, i2c_bus, logging, Lazy, vbus_present
+from enviroble.humidity import compensated
+from enviroble.edges import EdgeCounter
+from enviroble.pump import Pump
+from enviroble.scheduler import read_sources
 from collections import OrderedDict
 
 model = "grow"
 
+# on usb power the board warms itself up, so its temperature is lowered by
+# this many degrees and its humidity adjusted to match. None leaves them be
+USB_POWER_TEMPERATURE_OFFSET = None
+
 CHANNEL_NAMES = ['A', 'B', 'C']
 
-bme280 = BreakoutBME280(i2c, 0x77)
-ltr559 = BreakoutLTR559(i2c)
+# how far back to look when working out the moisture sensor tick rate
+MOISTURE_WINDOW_MS = 2000
+# how long the edge counters need to have been counting for a reading
+EDGE_WINDOW_MS = MOISTURE_WINDOW_MS
+
+# water each channel's soil when its moisture falls below its target, set to
+# 0 to never water it. the targets can be changed over bluetooth. with
+# AUTO_WATER off the board beeps instead of running the pumps
+AUTO_WATER = False
+MOISTURE_TARGETS = (50, 50, 50)
+# the beep for a dry channel sounds at most this often, although the moisture
+# is read more often than that
+DRY_ALERT_INTERVAL_MS = 60 * 1000
+
+# each dose runs the pump for PUMP_MS_PER_PERCENT for every percent the soil
+# is below its target, never for more than PUMP_MAX_ON_MS. the pump then waits
+# PUMP_SOAK_MS for the water to soak in before measuring again, up to
+# PUMP_DOSES times. if the soil still isn't wet enough after that the
+# reservoir is probably empty or the sensor out of the soil, so the pump rests
+# for PUMP_REST_MS before trying again
+PUMP_MS_PER_PERCENT = 40
+PUMP_MAX_ON_MS = 5000
+PUMP_SOAK_MS = 30 * 1000
+PUMP_DOSES = 3
+PUMP_REST_MS = 60 * 60 * 1000
+
+bme280 = Lazy(BreakoutBME280, i2c, 0x77)
+ltr559 = Lazy(BreakoutLTR559, i2c)
+bme280_device = i2c_bus.device("bme280")
+ltr559_device = i2c_bus.device("ltr559")
 
 piezo_pwm = PWM(Pin(28))
 
@@ -20,112 +56,172 @@ moisture_sensor_pins = [
     Pin(13, Pin.IN, Pin.PULL_DOWN)
 ]
 
+# the moisture sensors are counted continuously in the background so all
+# three channels are always being measured at the same time
+moisture_counters = [EdgeCounter(pin) for pin in moisture_sensor_pins]
+
 pump_pins = [
     Pin(12, Pin.OUT, value=0),
     Pin(11, Pin.OUT, value=0),
     Pin(10, Pin.OUT, value=0)
 ]
 
+pumps = [Pump(pin, PUMP_MAX_ON_MS) for pin in pump_pins]
+
+moisture_targets = list(MOISTURE_TARGETS)
+
+# set by read_moisture() when a channel wants watering, see water_task()
+water_wanted = [asyncio.Event() for _ in CHANNEL_NAMES]
+
+
+# the moisture of one channel from 0 to 100, or None if its sensor isn't
+# ticking
+def moisture_level(channel):
+    # average time between transitions in ms over the last window
+    average = moisture_counters[channel].interval_ms(MOISTURE_WINDOW_MS)
+
+    if average is None:
+        return None
+
+    # scale the result to a 0...100 range where 0 is very dry
+    # and 100 is standing in water
+    #
+    # dry = 10ms per transition, wet = 80ms per transition
+    min_ms = 20
+    max_ms = 80
+    average = max(min_ms, min(max_ms, average)) # clamp range
+    scaled = ((average - min_ms) / (max_ms - min_ms)) * 100
+    return round(scaled, 2)
+
 
 def moisture_readings():
     results = []
 
-    for i in range(0, 3):
-        # count time for sensor to "tick" 25 times
-        sensor = moisture_sensor_pins[i]
-
-        last_value = sensor.value()
-        start = time.ticks_ms()
-        first = None
-        last = None
-        ticks = 0
-        while ticks < 10 and time.ticks_diff(time.ticks_ms(), start) <= 1000:
-            value = sensor.value()
-            if last_value != value:
-                if first is None:
-                    first = time.ticks_ms()
-                last = time.ticks_ms()
-                ticks += 1
-                last_value = value
-
-        if not first or not last:
-            results.append(0.0)
-            continue
-
-        # calculate the average tick between transitions in ms
-        average = time.ticks_diff(last, first) / ticks
-        # scale the result to a 0...100 range where 0 is very dry
-        # and 100 is standing in water
-        #
-        # dry = 10ms per transition, wet = 80ms per transition
-        min_ms = 20
-        max_ms = 80
-        average = max(min_ms, min(max_ms, average)) # clamp range
-        scaled = ((average - min_ms) / (max_ms - min_ms)) * 100
-        results.append(round(scaled, 2))
+    for channel in range(len(moisture_counters)):
+        level = moisture_level(channel)
+        results.append(0.0 if level is None else level)
 
     return results
 
 
 # make a semi convincing drip noise
-def drip_noise():
+async def drip_noise():
     piezo_pwm.duty_u16(32768)
     for i in range(0, 10):
         f = i * 20
         piezo_pwm.freq((f * f) + 1000)
-        time.sleep(0.02)
+        await asyncio.sleep_ms(20)
     piezo_pwm.duty_u16(0)
 
 
-def water(moisture_levels):
-    from enviroble import config
-    targets = [
-        config.moisture_target_a,
-        config.moisture_target_b,
-        config.moisture_target_c
-    ]
+# whether channel's soil is below its target, never if it has no target or
+# its sensor isn't ticking
+def needs_water(channel, level):
+    target = moisture_targets[channel]
+    return target > 0 and level is not None and level < target
+
 
-    for i in range(0, 3):
-        if moisture_levels[i] < targets[i]:
-            # determine a duration to run the pump for
-            duration = round((targets[i] - moisture_levels[i]) / 25, 1)
+# look after one channel's pump, waiting for read_moisture() to say that it
+# needs water and then dosing it until it's reached its target. each channel
+# has its own task, so all three pumps can run at once and nothing else waits
+# for them
+async def water_task(channel):
+    name = CHANNEL_NAMES[channel]
+    pump = pumps[channel]
+    wanted = water_wanted[channel]
 
-            logging.info(f"> sensor {CHANNEL_NAMES[i]} below moisture target {targets[i]} (currently at {int(moisture_levels[i])}).")
+    while True:
+        await wanted.wait()
 
-            if config.auto_water:
-                logging.info(f"    - running pump {CHANNEL_NAMES[i]} for {duration} second(s)")
-                pump_pins[i].value(1)
-                time.sleep(duration)
-                pump_pins[i].value(0)
-            else:
-                logging.info("    - playing beep")
-                for j in range(0, i + 1):
-                    drip_noise()
-                time.sleep(0.5)
+        level = moisture_level(channel)
+        if not needs_water(channel, level):
+            wanted.clear()
+            continue
+
+        logging.info(f"> sensor {name} below moisture target {moisture_targets[channel]} (currently at {int(level)}).")
+
+        if not AUTO_WATER:
+            logging.info("    - playing beep")
+            for j in range(0, channel + 1):
+                await drip_noise()
+            # whatever's asked for meanwhile waits for the next reading after
+            await asyncio.sleep_ms(DRY_ALERT_INTERVAL_MS)
+            wanted.clear()
+            continue
 
+        for dose in range(PUMP_DOSES):
+            duration = int((moisture_targets[channel] - level) * PUMP_MS_PER_PERCENT)
+            logging.info(f"    - running pump {name} for {min(duration, PUMP_MAX_ON_MS)}ms")
+            await pump.dose(duration)
+            # measure again once the water has soaked in
+            await asyncio.sleep_ms(PUMP_SOAK_MS)
+            level = moisture_level(channel)
+            if not needs_water(channel, level):
+                break
+        else:
+            logging.info(f"    - sensor {name} still below target after {PUMP_DOSES} doses, resting pump {name}")
+            await asyncio.sleep_ms(PUMP_REST_MS)
 
-def get_sensor_readings(seconds_since_last):
+        # anything asked for while watering is out of date
+        wanted.clear()
+
+
+async def read_bme280(seconds_since_last):
     # bme280 returns the register contents immediately and then starts a new reading
     # we want the current reading so do a dummy read to discard register contents first
-    bme280.read()
-    time.sleep(0.1)
-    bme280_data = bme280.read()
+    async with bme280_device:
+        bme280.read()
+    await asyncio.sleep_ms(100)
+    async with bme280_device:
+        bme280_data = bme280.read()
+
+    return {
+        "temperature": round(bme280_data[0], 2),
+        "humidity": round(bme280_data[2], 2),
+        "pressure": round(bme280_data[1] / 100.0, 2)
+    }
+
+
+async def read_ltr559(seconds_since_last):
+    async with ltr559_device:
+        ltr_data = ltr559.get_reading()
+
+    return {
+        "luminance": round(ltr_data[BreakoutLTR559.LUX], 2)
+    }
 
-    ltr_data = ltr559.get_reading()
 
+async def read_moisture(seconds_since_last):
     moisture_levels = moisture_readings()
 
-    water(moisture_levels) # run pumps if needed
+    # wake the pumps of any channels that need water, see water_task()
+    for channel in range(len(moisture_levels)):
+        if moisture_levels[channel] < moisture_targets[channel]:
+            water_wanted[channel].set()
 
-    return OrderedDict({
-        "temperature": round(bme280_data[0], 2),
-        "humidity": round(bme280_data[2], 2),
-        "pressure": round(bme280_data[1] / 100.0, 2),
-        "luminance": round(ltr_data[BreakoutLTR559.LUX], 2),
+    return {
         "moisture_a": round(moisture_levels[0], 2),
         "moisture_b": round(moisture_levels[1], 2),
         "moisture_c": round(moisture_levels[2], 2)
-    })
+    }
+
+
+# the hardware behind each reading, see enviroble.scheduler
+SOURCES = OrderedDict({
+    "bme280": (compensated(read_bme280, USB_POWER_TEMPERATURE_OFFSET, vbus_present),
+               ("temperature", "humidity", "pressure", "dew_point")),
+    "ltr559": (read_ltr559, ("luminance",)),
+    "moisture": (read_moisture, ("moisture_a", "moisture_b", "moisture_c"))
+})
+
+# how often to sample each reading, anything not listed is sampled every minute
+SAMPLE_PERIODS_MS = {
+    "luminance": 10 * 1000
+}
+
+
+async def get_sensor_readings(seconds_since_last):
+    return await read_sources(SOURCES, seconds_since_last)
 
 
 def play_tone(frequency=None):
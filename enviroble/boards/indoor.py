@@ -1,86 +1,172 @@
-import enviroble.helpers as helpers
 import math
+from micropython import const
 from breakout_bme68x import BreakoutBME68X
 from breakout_bh1745 import BreakoutBH1745
 from collections import OrderedDict
 
-from enviroble import i2c
+from enviroble import i2c, i2c_bus, Lazy, vbus_present
+from enviroble.humidity import compensated
+from enviroble.iaq import IAQ
+from enviroble.scheduler import read_sources
 
 model = "indoor"
 
-bme688 = BreakoutBME68X(i2c, address=0x77)
+# on usb power the board warms itself up, so its temperature is lowered by
+# this many degrees and its humidity adjusted to match. None leaves them be
+USB_POWER_TEMPERATURE_OFFSET = 4.5
 
-bh1745 = BreakoutBH1745(i2c)
-# need to write default values back into bh1745 chip otherwise it
-# reports bad results (this is undocumented...)
-i2c.writeto_mem(0x38, 0x44, b'\x02')
+# the air quality index learns a baseline of clean air from the gas sensor,
+# which is kept in IAQ_BASELINE_FILE every IAQ_SAVE_INTERVAL_S so that it
+# survives a reset. None keeps it in memory only
+IAQ_BASELINE_FILE = "iaq.bin"
+IAQ_SAVE_INTERVAL_S = 60 * 60
+
+# the gas sensor's hot plate is heated to BME688_HEATER_TEMPERATURE degrees
+# for BME688_HEATER_MS for each reading. the driver's read() triggers the
+# measurement, waits out the heater and reads the result in one blocking
+# call, with no way to split it up, so this stalls the whole event loop (not
+# just the bus) for that long. it's a known limitation: a shorter heater time
+# shortens the stall at the cost of less settled gas readings
+BME688_HEATER_TEMPERATURE = 300
+BME688_HEATER_MS = 100
+
+bme688 = Lazy(BreakoutBME68X, i2c, address=0x77)
+bme688_device = i2c_bus.device("bme688")
+
+iaq = Lazy(IAQ, IAQ_BASELINE_FILE, IAQ_SAVE_INTERVAL_S)
+
+
+def setup_bh1745():
+    bh1745 = BreakoutBH1745(i2c)
+    # need to write default values back into bh1745 chip otherwise it
+    # reports bad results (this is undocumented...)
+    i2c.writeto_mem(0x38, 0x44, b'\x02')
+    return bh1745
+
+
+bh1745 = Lazy(setup_bh1745)
+bh1745_device = i2c_bus.device("bh1745")
 
 
 def lux_from_rgbc(r, g, b, c):
     if g < 1:
         tmp = 0
-    elif (c / g < 0.160):
-        tmp = 0.202 * r + 0.766 * g
+    elif c * 1000 < g * 160:    # c / g < 0.160
+        tmp = 202 * r + 766 * g
     else:
-        tmp = 0.159 * r + 0.646 * g
-    tmp = 0 if tmp < 0 else tmp
+        tmp = 159 * r + 646 * g
+    tmp = 0 if tmp < 0 else (tmp + 500) // 1000
     integration_time = 160
     gain = 1
-    return round(tmp / gain / integration_time * 160)
+    return tmp * 160 // (gain * integration_time)
+
+
+# the colour temperature is a blend of two exponentials of the red and blue
+# ratios, a * e ** (k * ratio), with a and k depending on the c / g ratio.
+# rather than raising e to a float power for every reading, each exponential
+# is kept as a table of 65 steps across the ratio's range and interpolated
+# between them. everything's done in integers with ratios in units of 1/4096
+# so that nothing outgrows a small int, and the tables are tuples so that a
+# lookup hands back an int that already exists
+_RATIO_BITS = const(12)
+_STEP_BITS = const(6)
+_cct_tables = None
+
+
+def _cct_table(a, k):
+    steps = 1 << _STEP_BITS
+    return tuple(round(a * math.exp(k * i / steps)) for i in range(steps + 1))
+
+
+def _cct_lookup(table, ratio):
+    index = ratio >> _STEP_BITS
+    if index >= len(table) - 1:
+        return table[-1]
+    low = table[index]
+    return low + ((table[index + 1] - low) * (ratio & ((1 << _STEP_BITS) - 1)) >> _STEP_BITS)
 
 
 def colour_temperature_from_rgbc(r, g, b, c):
-    if (g < 1) or (r + g + b < 1):
+    global _cct_tables
+    total = r + g + b
+    if (g < 1) or (total < 1):
         return 0
 
-    r_ratio = r / (r + g + b)
-    b_ratio = b / (r + g + b)
-    e = 2.71828
-    ct = 0
-
-    if c / g < 0.160:
-        b_eff = min(b_ratio * 3.13, 1)
-        ct = ((1 - b_eff) * 12746 * (e ** (-2.911 * r_ratio))) + (b_eff * 1637 * (e ** (4.865 * b_ratio)))
-    else:
-        b_eff = min(b_ratio * 10.67, 1)
-        ct = ((1 - b_eff) * 16234 * (e ** (-2.781 * r_ratio))) + (b_eff * 1882 * (e ** (4.448 * b_ratio)))
+    if _cct_tables is None:
+        # (blue scale, red table, blue table) for c / g below 0.160 and above
+        _cct_tables = (
+            (round(3.13 * (1 << _RATIO_BITS)), _cct_table(12746, -2.911), _cct_table(1637, 4.865)),
+            (round(10.67 * (1 << _RATIO_BITS)), _cct_table(16234, -2.781), _cct_table(1882, 4.448))
+        )
+
+    one = 1 << _RATIO_BITS
+    r_ratio = (r << _RATIO_BITS) // total
+    b_ratio = (b << _RATIO_BITS) // total
+    blue_scale, red_table, blue_table = _cct_tables[0 if c * 1000 < g * 160 else 1]
+    b_eff = (b_ratio * blue_scale) >> _RATIO_BITS
+    if b_eff > one:
+        b_eff = one
+    ct = ((one - b_eff) * _cct_lookup(red_table, r_ratio) +
+          b_eff * _cct_lookup(blue_table, b_ratio) + (one >> 1)) >> _RATIO_BITS
 
     if ct > 10000:
         ct = 10000
 
-    return round(ct)
+    return ct
 
 
-def get_sensor_readings(seconds_since_last):
-    data = bme688.read()
+async def read_bme688(seconds_since_last):
+    # blocks while the gas heater runs, see BME688_HEATER_MS
+    async with bme688_device:
+        data = bme688.read(BME688_HEATER_TEMPERATURE, BME688_HEATER_MS)
 
     temperature = round(data[0], 2)
     humidity = round(data[2], 2)
 
-    # Compensate for additional heating when on usb power - this also changes the
-    # relative humidity value.
-    #if is_usb_power:
-    #    adjusted_temperature = temperature - config.usb_power_temperature_offset
-    #    absolute_humidity = helpers.relative_to_absolute_humidity(humidity, temperature)
-    #    humidity = helpers.absolute_to_relative_humidity(absolute_humidity, adjusted_temperature)
-    #    temperature = adjusted_temperature
+    # the extra heating on usb power is made up for in SOURCES, see
+    # enviroble.humidity.compensated()
 
     pressure = round(data[1] / 100.0, 2)
     gas_resistance = round(data[3])
-    # an approximate air quality calculation that accounts for the effect of
-    # humidity on the gas sensor
-    # https://forums.pimoroni.com/t/bme680-observed-gas-ohms-readings/6608/25
-    aqi = round(math.log(gas_resistance) + 0.04 * humidity, 1)
+    # an air quality index against a baseline of clean air, which accounts
+    # for the effect of humidity on the gas sensor, see enviroble.iaq
+    index = iaq.add(gas_resistance, humidity, seconds_since_last)
 
-    bh1745.measurement_time_ms(160)
-    r, g, b, c = bh1745.rgbc_raw()
-
-    return OrderedDict({
+    return {
         "temperature": temperature,
         "humidity": humidity,
         "pressure": pressure,
         "gas_resistance": gas_resistance,
-        "aqi": aqi,
+        "iaq": round(index, 1),
+        "iaq_accuracy": iaq.accuracy()
+    }
+
+
+async def read_bh1745(seconds_since_last):
+    async with bh1745_device:
+        bh1745.measurement_time_ms(160)
+        r, g, b, c = bh1745.rgbc_raw()
+
+    return {
         "luminance": lux_from_rgbc(r, g, b, c),
         "color_temperature": colour_temperature_from_rgbc(r, g, b, c)
-    })
+    }
+
+
+# the hardware behind each reading, see enviroble.scheduler
+SOURCES = OrderedDict({
+    "bme688": (compensated(read_bme688, USB_POWER_TEMPERATURE_OFFSET, vbus_present),
+               ("temperature", "humidity", "pressure", "dew_point", "gas_resistance",
+                "iaq", "iaq_accuracy")),
+    "bh1745": (read_bh1745, ("luminance", "color_temperature"))
+})
+
+# how often to sample each reading, anything not listed is sampled every minute
+SAMPLE_PERIODS_MS = {
+    "luminance": 10 * 1000,
+    "color_temperature": 10 * 1000
+}
+
+
+async def get_sensor_readings(seconds_since_last):
+    return await read_sources(SOURCES, seconds_since_last)
@@ -1,81 +1,362 @@
+import math
+import sys
 import time
+import micropython
+import uasyncio as asyncio
+from array import array
 from machine import Pin, ADC
+from micropython import const
 from breakout_bme280 import BreakoutBME280
-from pimoroni_i2c import PimoroniI2C
-from enviroble import i2c, logging
+from enviroble import i2c, i2c_bus, logging, Lazy, vbus_present
+from enviroble.humidity import compensated
+from enviroble.bus import I2CBus
+from enviroble.pms5003 import PMS5003, READINGS as PMS5003_READINGS, FRAME_SIZE as PMS5003_FRAME_SIZE, FRAME_INTERVAL_MS
+from enviroble.scheduler import read_sources
+import enviroble.schema as schema
 from collections import OrderedDict
 
 model = "urban"
 
+# on usb power the board warms itself up, so its temperature is lowered by
+# this many degrees and its humidity adjusted to match. None leaves them be
+USB_POWER_TEMPERATURE_OFFSET = None
+
 # how long to capture the microphone signal for when taking a reading, in milliseconds
 MIC_SAMPLE_TIME_MS = 500
 
+# the microphone is sampled at a fixed rate, in blocks with a yield to the
+# event loop between each. a block holds up everything else while it's
+# captured, 16ms at these settings
+MIC_SAMPLE_RATE_HZ = 16000
+MIC_BLOCK_SAMPLES = 256
+
+# how many raw samples from the start of each capture to keep for streaming,
+# a whole number of blocks
+MIC_STREAM_SAMPLES = 1024
+
+# pole of the two high-pass stages that roughly A-weight the signal for the
+# dB(A) reading, out of 256. 210 puts the corner near 500Hz at 16kHz, below
+# which A-weighting falls away at about the same 12dB per octave
+MIC_WEIGHTING_POLE = const(210)
+
+# dB(A) of a weighted signal of 1 volt rms. this is a rough figure for the
+# Urban's microphone and amplifier, calibrate it against a sound level meter
+# for anything better than relative levels
+MIC_DBA_AT_1V = 110.0
+
+# the particulate sensor is powered up for each reading and left to warm up
+# for PMS5003_WARM_UP_MS, then PMS5003_FRAMES frames are averaged. set
+# PMS5003_CONTINUOUS to leave it running and average every frame between
+# readings instead, which wears the fan out sooner and draws about 100mA
+PMS5003_CONTINUOUS = False
+PMS5003_WARM_UP_MS = 5000
+PMS5003_FRAMES = 5
+# the fan has to warm up for each reading, so they're never taken faster
+# than this
+PMS5003_PERIOD_MS = 60 * 1000
+
 sensor_reset_pin = Pin(9, Pin.OUT, value=True)
 sensor_enable_pin = Pin(10, Pin.OUT, value=False)
 boost_enable_pin = Pin(11, Pin.OUT, value=False)
 
 noise_adc = ADC(0)
 
-bme280 = BreakoutBME280(i2c, 0x77)
+# the start of the latest microphone capture as uint16 samples, waiting to be
+# streamed, see enviroble.stream. its blocks are captured straight into it
+# and the rest of the capture goes through mic_block
+mic_samples = bytearray(2 * MIC_STREAM_SAMPLES)
+mic_samples_ready = 0
+mic_stream_blocks = [memoryview(mic_samples)[i:i + 2 * MIC_BLOCK_SAMPLES]
+                     for i in range(0, len(mic_samples), 2 * MIC_BLOCK_SAMPLES)]
+mic_block = array("H", [0] * MIC_BLOCK_SAMPLES)
+
+# running totals for a capture, see _mic_stats(), and the state of the
+# weighting filter
+mic_totals = array("i", [0] * 7)
+mic_filter = array("i", [0] * 3)
+
+# samples the adc couldn't take on time since boot
+mic_overruns = 0
+
+bme280 = Lazy(BreakoutBME280, i2c, 0x77)
+bme280_device = i2c_bus.device("bme280")
+
+# the particulate sensor has a bus of its own, which it can't run any faster
+# than standard mode
+PMS5003_I2C_FREQUENCY = 100000
+pms5003_bus = I2CBus(14, 15, PMS5003_I2C_FREQUENCY)
+pms5003_device = pms5003_bus.device("pms5003", 0x12)
+# a frame is read in one go into the same buffer every time
+pms5003_frame = bytearray(PMS5003_FRAME_SIZE)
 
-PM1_UGM3 = 2
-PM2_5_UGM3 = 3
-PM10_UGM3 = 4
-PM1_UGM3_ATHMOSPHERIC = 5
-PM2_5_UGM3_ATHMOSPHERIC = 6
-PM10_UGM3_ATHMOSPHERIC = 7
-PM0_3_PER_LITRE = 8
-PM0_5_PER_LITRE = 9
-PM1_PER_LITRE = 10
-PM2_5_PER_LITRE = 11
-PM5_PER_LITRE = 12
-PM10_PER_LITRE = 13
 
+def pms5003_power(on):
+    if on:
+        boost_enable_pin.value(True)
+        sensor_enable_pin.value(True)
+    else:
+        sensor_enable_pin.value(False)
+        boost_enable_pin.value(False)
 
-def particulates(particulate_data, measure):
-    # bit of a fudge to convert decilitres into litres... who uses decilitre?!
-    multiplier = 10 if measure >= PM0_3_PER_LITRE else 1
-    return ((particulate_data[measure * 2] << 8) | particulate_data[measure * 2 + 1]) * multiplier
 
+pms5003 = PMS5003(pms5003_device, pms5003_frame, pms5003_power, PMS5003_CONTINUOUS, PMS5003_WARM_UP_MS,
+                  PMS5003_FRAMES)
 
-def get_sensor_readings(seconds_since_last):
+
+async def read_bme280(seconds_since_last):
     # bme280 returns the register contents immediately and then starts a new reading
     # we want the current reading so do a dummy read to discard register contents first
-    bme280.read()
-    time.sleep(0.1)
-    bme280_data = bme280.read()
+    async with bme280_device:
+        bme280.read()
+    await asyncio.sleep_ms(100)
+    async with bme280_device:
+        bme280_data = bme280.read()
 
-    logging.debug("    - starting sensor")
-    boost_enable_pin.value(True)
-    sensor_enable_pin.value(True)
-    logging.debug("    - wait 5 seconds for airflow")
-    time.sleep(5)  # allow airflow to start
+    return {
+        "temperature": round(bme280_data[0], 2),
+        "humidity": round(bme280_data[2], 2),
+        "pressure": round(bme280_data[1] / 100.0, 2)
+    }
 
-    # setup the i2c bus for the particulate sensor
+
+async def read_pms5003(seconds_since_last):
     logging.debug("    - taking pms5003i reading")
-    pms_i2c = PimoroniI2C(14, 15, 100000)
-    particulate_data = pms_i2c.readfrom_mem(0x12, 0x00, 32)
+    errors = pms5003.errors
+    readings = await pms5003.read()
+    if pms5003.errors != errors:
+        logging.info(f"    - pms5003i dropped {pms5003.errors - errors} bad frames")
+    return readings
+
+
+# microphone
+# ===========================================================================
+_ADC_CS = const(0x4004C000)
+_ADC_FCS = const(0x4004C008)
+_ADC_FIFO = const(0x4004C00C)
+_ADC_DIV = const(0x4004C010)
+_CS_EN = const(0x1)
+_CS_START_MANY = const(0x8)
+_CS_READY = const(0x100)
+_FCS_EN = const(0x1)
+_FCS_EMPTY = const(0x100)
+_FCS_UNDER = const(0x400)
+_FCS_OVER = const(0x800)
+
+
+# fill samples with count readings of adc 0 paced by the rp2040 adc's own
+# clock, which divides 48MHz by div / 256. the samples go through the adc's
+# fifo so they stay evenly spaced, returns non-zero if the fifo overflowed
+# because something held us up for longer than it could cover
+@micropython.viper
+def _capture_rp2(samples, count: int, div: int) -> int:
+    buffer = ptr16(samples)
+    cs = ptr32(_ADC_CS)
+    fcs = ptr32(_ADC_FCS)
+    fifo = ptr32(_ADC_FIFO)
+    cs[0] = _CS_EN
+    ptr32(_ADC_DIV)[0] = div
+    fcs[0] = _FCS_EN | _FCS_UNDER | _FCS_OVER
+    while not (fcs[0] & _FCS_EMPTY):
+        value = fifo[0]
+    cs[0] = _CS_EN | _CS_START_MANY
+    i = 0
+    while i < count:
+        while fcs[0] & _FCS_EMPTY:
+            pass
+        value = fifo[0] & 0xFFF
+        # scaled the same as read_u16()
+        buffer[i] = (value << 4) | (value >> 8)
+        i += 1
+    cs[0] = _CS_EN
+    overrun = fcs[0] & _FCS_OVER
+    fcs[0] = _FCS_UNDER | _FCS_OVER
+    ptr32(_ADC_DIV)[0] = 0
+    while not (cs[0] & _CS_READY):
+        pass
+    return overrun
+
+
+# the same with read_u16() against the microsecond clock, for other ports,
+# returns how many samples were late
+@micropython.viper
+def _capture_timed(samples, count: int, interval_us: int) -> int:
+    buffer = ptr16(samples)
+    read = noise_adc.read_u16
+    due = int(time.ticks_us())
+    late = 0
+    i = 0
+    while i < count:
+        wait = int(time.ticks_diff(due, time.ticks_us()))
+        if wait > 0:
+            time.sleep_us(wait)
+        elif wait < 0 - interval_us:
+            late += 1
+        buffer[i] = int(read())
+        due = int(time.ticks_add(due, interval_us))
+        i += 1
+    return late
 
-    sensor_enable_pin.value(False)
-    boost_enable_pin.value(False)
 
+# sum of count samples, at the adc's 12 bits
+@micropython.viper
+def _mic_sum(samples, count: int) -> int:
+    buffer = ptr16(samples)
+    total = 0
+    i = 0
+    while i < count:
+        total += int(buffer[i]) >> 4
+        i += 1
+    return total
+
+
+# add count samples around mean to the totals, all at the adc's 12 bits:
+#
+#   0, 1  squared deviations from the mean, as high and low parts
+#   2, 3  squared weighted samples, as high and low parts
+#   4     largest deviation from the mean
+#   5, 6  smallest and largest sample
+#
+# the squares are summed 64 at a time so they can't overflow 31 bits and
+# each sum is split into its top bits and bottom 8 bits, add them back up as
+# (high << 8) + low. state carries the weighting filter between blocks
+@micropython.viper
+def _mic_stats(samples, count: int, mean: int, state, totals):
+    buffer = ptr16(samples)
+    filter = ptr32(state)
+    out = ptr32(totals)
+    previous = filter[0]
+    first = filter[1]
+    second = filter[2]
+    peak = out[4]
+    low = out[5]
+    high = out[6]
+    i = 0
+    while i < count:
+        end = i + 64
+        if end > count:
+            end = count
+        squares = 0
+        weighted = 0
+        while i < end:
+            sample = int(buffer[i]) >> 4
+            deviation = sample - mean
+            squares += deviation * deviation
+            if deviation < 0:
+                deviation = 0 - deviation
+            if deviation > peak:
+                peak = deviation
+            if sample < low:
+                low = sample
+            if sample > high:
+                high = sample
+            # two first order high-pass stages
+            stage = sample - previous + ((first * MIC_WEIGHTING_POLE) >> 8)
+            output = stage - first + ((second * MIC_WEIGHTING_POLE) >> 8)
+            previous = sample
+            first = stage
+            second = output
+            if output > 4095:
+                output = 4095
+            elif output < -4095:
+                output = -4095
+            weighted += output * output
+            i += 1
+        out[0] = out[0] + (squares >> 8)
+        out[1] = out[1] + (squares & 0xFF)
+        out[2] = out[2] + (weighted >> 8)
+        out[3] = out[3] + (weighted & 0xFF)
+    filter[0] = previous
+    filter[1] = first
+    filter[2] = second
+    out[4] = peak
+    out[5] = low
+    out[6] = high
+
+
+if sys.platform == "rp2":
+    _capture = _capture_rp2
+    _capture_rate = 48000000 * 256 // MIC_SAMPLE_RATE_HZ - 256
+else:
+    _capture = _capture_timed
+    _capture_rate = 1000000 // MIC_SAMPLE_RATE_HZ
+
+
+async def read_microphone(seconds_since_last):
+    global mic_samples_ready, mic_overruns
     logging.debug("    - taking microphone reading")
-    start = time.ticks_ms()
-    min_value = 1.65
-    max_value = 1.65
-    while time.ticks_diff(time.ticks_ms(), start) < MIC_SAMPLE_TIME_MS:
-        value = (noise_adc.read_u16() * 3.3) / 65535
-        min_value = min(min_value, value)
-        max_value = max(max_value, value)
+    blocks = max(1, MIC_SAMPLE_TIME_MS * MIC_SAMPLE_RATE_HZ // (1000 * MIC_BLOCK_SAMPLES))
+    totals = mic_totals
+    for i in range(len(totals)):
+        totals[i] = 0
+    totals[5] = 4095
 
-    noise_vpp = max_value - min_value
+    for block in range(blocks):
+        samples = mic_stream_blocks[block] if block < len(mic_stream_blocks) else mic_block
+        if _capture(samples, MIC_BLOCK_SAMPLES, _capture_rate):
+            mic_overruns += 1
+        if block == 0:
+            mic_filter[0] = _mic_sum(samples, 1)
+            mic_filter[1] = mic_filter[2] = 0
+        mean = _mic_sum(samples, MIC_BLOCK_SAMPLES) // MIC_BLOCK_SAMPLES
+        _mic_stats(samples, MIC_BLOCK_SAMPLES, mean, mic_filter, totals)
+        await asyncio.sleep_ms(0)
 
-    return OrderedDict({
-        "temperature": round(bme280_data[0], 2),
-        "humidity": round(bme280_data[2], 2),
-        "pressure": round(bme280_data[1] / 100.0, 2),
-        "noise": round(noise_vpp, 3),
-        "pm1": particulates(particulate_data, PM1_UGM3),
-        "pm2_5": particulates(particulate_data, PM2_5_UGM3),
-        "pm10": particulates(particulate_data, PM10_UGM3)
-    })
+    mic_samples_ready = min(blocks, len(mic_stream_blocks)) * MIC_BLOCK_SAMPLES
+    count = blocks * MIC_BLOCK_SAMPLES
+    volts = 3.3 / 4095
+    rms = math.sqrt(((totals[0] << 8) + totals[1]) / count) * volts
+    weighted = math.sqrt(((totals[2] << 8) + totals[3]) / count) * volts
+    # don't go below what the adc can resolve
+    dba = 20 * math.log10(max(weighted, volts / 2)) + MIC_DBA_AT_1V
+
+    return {
+        "noise": round((totals[6] - totals[5]) * volts, 3),
+        "noise_rms": round(rms, 4),
+        "noise_peak": round(totals[4] * volts, 3),
+        "noise_dba": round(dba, 1)
+    }
+
+
+# the hardware behind each reading, see enviroble.scheduler
+SOURCES = OrderedDict({
+    "bme280": (compensated(read_bme280, USB_POWER_TEMPERATURE_OFFSET, vbus_present),
+               ("temperature", "humidity", "pressure", "dew_point")),
+    "pms5003": (read_pms5003, PMS5003_READINGS),
+    "microphone": (read_microphone, ("noise", "noise_rms", "noise_peak", "noise_dba"))
+})
+
+# how often to sample each reading, anything not listed is sampled every minute
+SAMPLE_PERIODS_MS = {
+    "noise": 10 * 1000,
+    "noise_rms": 10 * 1000,
+    "noise_peak": 10 * 1000,
+    "noise_dba": 10 * 1000
+}
+for name in PMS5003_READINGS:
+    SAMPLE_PERIODS_MS[name] = PMS5003_PERIOD_MS
+
+# how each particulate reading is measured, see schema.pack_measurement(). it's
+# the mean of the frames taken since the last one
+_pms5003_mean_s = (PMS5003_PERIOD_MS if PMS5003_CONTINUOUS else PMS5003_FRAMES * FRAME_INTERVAL_MS) // 1000
+MEASUREMENTS = {
+    name: (schema.SAMPLING_MEAN, _pms5003_mean_s, PMS5003_PERIOD_MS // 1000) for name in PMS5003_READINGS
+}
+
+
+# the raw samples from the latest microphone capture, once
+def microphone_samples():
+    global mic_samples_ready
+    ready = mic_samples_ready
+    mic_samples_ready = 0
+    return memoryview(mic_samples)[:ready * 2]
+
+
+# raw data for enviroble.stream, each a function returning what's new since
+# it was last called
+STREAMS = {
+    schema.STREAM_MICROPHONE: microphone_samples
+}
+
+
+async def get_sensor_readings(seconds_since_last):
+    return await read_sources(SOURCES, seconds_since_last)
@@ -1,17 +1,27 @@
 import time
 import math
-import os
+import uasyncio as asyncio
 from breakout_bme280 import BreakoutBME280
 from breakout_ltr559 import BreakoutLTR559
-from machine import Pin
-from pimoroni import Analog
-from enviroble import i2c, activity_led, logging
+import machine
+from machine import Pin, ADC
+from enviroble import i2c, i2c_bus, activity_led, logging, Lazy, vbus_present
+from enviroble.humidity import compensated
+from enviroble.edges import EdgeCounter, COUNT_MASK
+from enviroble.wind import WindStats
+from enviroble.scheduler import read_sources
+from enviroble.rainlog import RainLog
 import enviroble.helpers as helpers
+import enviroble.schema as schema
 from enviroble.constants import WAKE_REASON_RTC_ALARM, WAKE_REASON_BUTTON_PRESS
 from collections import OrderedDict
 
 model = "weather"
 
+# on usb power the board warms itself up, so its temperature is lowered by
+# this many degrees and its humidity adjusted to match. None leaves them be
+USB_POWER_TEMPERATURE_OFFSET = None
+
 # amount of rain required for the bucket to tip in mm
 RAIN_MM_PER_TICK = 0.2794
 
@@ -20,44 +30,65 @@ RAIN_MM_PER_TICK = 0.2794
 WIND_CM_RADIUS = 7.0
 # scaling factor for wind speed in m/s
 WIND_FACTOR = 0.0218
-
-bme280 = BreakoutBME280(i2c, 0x77)
-ltr559 = BreakoutLTR559(i2c)
-
-wind_direction_pin = Analog(26)
+# how far back to look when working out the anemometer tick rate
+WIND_WINDOW_MS = 3000
+# the wind is sampled in the background this often, and gusts are the
+# fastest wind over this many samples in a row
+WIND_SAMPLE_MS = 1000
+WIND_GUST_SAMPLES = 3
+# the wind readings are the mean, strongest gust and mean direction over this
+WIND_REPORT_MS = 60 * 1000
+# how long the edge counters need to have been counting for a reading
+EDGE_WINDOW_MS = WIND_WINDOW_MS
+
+bme280 = Lazy(BreakoutBME280, i2c, 0x77)
+ltr559 = Lazy(BreakoutLTR559, i2c)
+bme280_device = i2c_bus.device("bme280")
+ltr559_device = i2c_bus.device("ltr559")
+
+wind_direction_pin = ADC(26)
 wind_speed_pin = Pin(9, Pin.IN, Pin.PULL_UP)
+# the anemometer is counted continuously in the background
+wind_speed_counter = EdgeCounter(wind_speed_pin, 256)
+wind_stats = WindStats(WIND_GUST_SAMPLES)
 rain_pin = Pin(10, Pin.IN, Pin.PULL_DOWN)
-last_rain_trigger = False
+
+# anemometer edge times waiting to be streamed, see enviroble.stream
+wind_edge_buffer = bytearray(4 * 64)
+wind_edges_streamed = 0
+
+# ignore further edges from the rain sensor for this long after a tip so
+# that switch bounce isn't counted as rain
+RAIN_DEBOUNCE_MS = 100
+
+rain_log = Lazy(RainLog)
+rain_pending = 0
+rain_last_tick = None
+rain_flag = asyncio.ThreadSafeFlag()
+
+
+def rain_irq(pin):
+    global rain_pending, rain_last_tick
+    now = time.ticks_ms()
+    if rain_last_tick is not None and time.ticks_diff(now, rain_last_tick) < RAIN_DEBOUNCE_MS:
+        return
+    rain_last_tick = now
+    rain_pending += 1
+    rain_flag.set()
+
+
+rain_pin.irq(handler=rain_irq, trigger=Pin.IRQ_RISING)
 
 
 def startup(reason):
-    global last_rain_trigger
     import wakeup
 
     # check if rain sensor triggered wake
     rain_sensor_trigger = wakeup.get_gpio_state() & (1 << 10)
 
     if rain_sensor_trigger:
-        # read the current rain entries
-        rain_entries = []
-        if helpers.file_exists("rain.txt"):
-            with open("rain.txt", "r") as rainfile:
-                rain_entries = rainfile.read().split("\n")
-
-        # add new entry
         logging.info(f"> add new rain trigger at {helpers.datetime_string()}")
-        rain_entries.append(helpers.datetime_string())
-
-        # limit number of entries to 190 - each entry is 21 bytes including
-        # newline so this keeps the total rain.txt filesize just under one
-        # filesystem block (4096 bytes)
-        rain_entries = rain_entries[-190:]
-
-        # write out adjusted rain log
-        with open("rain.txt", "w") as rainfile:
-            rainfile.write("\n".join(rain_entries))
-
-        last_rain_trigger = True
+        rain_log.append(time.time())
 
         # if we were woken by the RTC or a Poke continue with the startup
         return (reason is WAKE_REASON_RTC_ALARM 
@@ -67,122 +98,126 @@ def startup(reason):
     return True
 
 
+# log any bucket tips counted by the rain sensor irq since the last check
 def check_trigger():
-    global last_rain_trigger
-    rain_sensor_trigger = rain_pin.value()
-
-    if rain_sensor_trigger and not last_rain_trigger:
-        activity_led(100)
-        time.sleep(0.05)
-        activity_led(0)
-
-        # read the current rain entries
-        rain_entries = []
-        if helpers.file_exists("rain.txt"):
-            with open("rain.txt", "r") as rainfile:
-                rain_entries = rainfile.read().split("\n")
-
-        # add new entry
+    global rain_pending
+    state = machine.disable_irq()
+    pending = rain_pending
+    rain_pending = 0
+    machine.enable_irq(state)
+
+    now = time.time()
+    for _ in range(pending):
         logging.info(f"> add new rain trigger at {helpers.datetime_string()}")
-        rain_entries.append(helpers.datetime_string())
-
-        # limit number of entries to 190 - each entry is 21 bytes including
-        # newline so this keeps the total rain.txt filesize just under one 
-        # filesystem block (4096 bytes)
-        rain_entries = rain_entries[-190:]
-
-        # write out adjusted rain log
-        with open("rain.txt", "w") as rainfile:
-            rainfile.write("\n".join(rain_entries))
-
-    last_rain_trigger = rain_sensor_trigger
+        rain_log.append(now)
 
+    return pending
 
-def wind_speed(sample_time_ms=1000):
-    # get initial sensor state
-    state = wind_speed_pin.value()
 
-    # create an array for each sensor to log the times when the sensor state changed
-    # then we can use those values to calculate an average tick time for each sensor
-    ticks = []
-
-    start = time.ticks_ms()
-    while time.ticks_diff(time.ticks_ms(), start) <= sample_time_ms:
-        now = wind_speed_pin.value()
-        if now != state: # sensor output changed
-            # record the time of the change and update the state
-            ticks.append(time.ticks_ms())
-            state = now
-
-    # if no sensor connected then we have no readings, skip
-    if len(ticks) < 2:
-        return 0
+async def rain_task():
+    while True:
+        await rain_flag.wait()
+        if check_trigger():
+            activity_led(100)
+            await asyncio.sleep_ms(50)
+            activity_led(0)
 
-    # calculate the average tick between transitions in ms
-    average_tick_ms = (time.ticks_diff(ticks[-1], ticks[0])) / (len(ticks) - 1)
 
-    if average_tick_ms == 0:
+# wind speed in metres per second from edges counted over elapsed_ms
+def wind_speed_from_edges(edges, elapsed_ms):
+    if elapsed_ms <= 0:
         return 0
     # work out rotation speed in hz (two ticks per rotation)
-    rotation_hz = (1000 / average_tick_ms) / 2
+    rotation_hz = edges * 1000 / elapsed_ms / 2
 
     # calculate the wind speed in metres per second
     circumference = WIND_CM_RADIUS * 2.0 * math.pi
-    wind_m_s = rotation_hz * circumference * WIND_FACTOR
+    return rotation_hz * circumference * WIND_FACTOR
+
 
-    return wind_m_s
+def wind_speed(window_ms=WIND_WINDOW_MS):
+    # count edges are count - 1 intervals apart
+    count, span = wind_speed_counter.edges(window_ms)
+    if count < 2 or span == 0:
+        return 0
+    return wind_speed_from_edges(count - 1, span)
 
 
-def wind_direction():
-    # adc reading voltage to cardinal direction taken from our python
-    # library - each array index represents a 45 degree step around
-    # the compass (index 0 == 0, 1 == 45, 2 == 90, etc.)
-    # we find the closest matching value in the array and use the index
-    # to determine the heading
-    ADC_TO_DEGREES = (0.9, 2.0, 3.0, 2.8, 2.5, 1.5, 0.3, 0.6)
+# sample the wind every WIND_SAMPLE_MS into wind_stats, so that the readings
+# cover the whole time since the last rather than the moment they're taken
+async def wind_task():
+    count = wind_speed_counter.count
+    last = time.ticks_ms()
+    while True:
+        await asyncio.sleep_ms(WIND_SAMPLE_MS)
+        now = time.ticks_ms()
+        total = wind_speed_counter.count
+        wind_stats.add((total - count) & COUNT_MASK, time.ticks_diff(now, last), wind_direction())
+        count = total
+        last = now
+
+
+# the times of the anemometer edges since the last call
+def wind_edges():
+    global wind_edges_streamed
+    wind_edges_streamed, copied = wind_speed_counter.copy_since(wind_edges_streamed, wind_edge_buffer)
+    return memoryview(wind_edge_buffer)[:copied * 4]
+
+
+# the wind vane's voltage to its heading, taken from our python library: each
+# heading is a 45 degree step around the compass with its own voltage. in
+# order of voltage, WIND_VANE_THRESHOLDS holds the highest raw adc reading
+# nearer each voltage than the next one's and WIND_VANE_HEADINGS its heading.
+# readings are compared with the midpoints between voltages so a reading only
+# needs one pass of integer compares
+def _wind_vane_tables():
+    voltages = sorted((voltage, index * 45) for index, voltage in enumerate((0.9, 2.0, 3.0, 2.8, 2.5, 1.5, 0.3, 0.6)))
+    thresholds = []
+    for i in range(len(voltages)):
+        if i + 1 < len(voltages):
+            thresholds.append(int((voltages[i][0] + voltages[i + 1][0]) / 2 * 65535 / 3.3))
+        else:
+            thresholds.append(65535)
+    return tuple(thresholds), tuple(heading for voltage, heading in voltages)
+
+
+WIND_VANE_THRESHOLDS, WIND_VANE_HEADINGS = _wind_vane_tables()
+
+# how many times to read the wind vane looking for two readings in a row that
+# agree before settling for the last one
+WIND_DIRECTION_READS = 8
+
+
+# indexed rather than iterated so that no iterator is allocated
+def wind_vane_heading(raw):
+    i = 0
+    while i < len(WIND_VANE_THRESHOLDS):
+        if raw <= WIND_VANE_THRESHOLDS[i]:
+            return WIND_VANE_HEADINGS[i]
+        i += 1
+    return 0
 
-    closest_index = -1
-    last_index = None
 
+def wind_direction():
     # ensure we have two readings that match in a row as otherwise if
     # you read during transition between two values it can glitch
     # fixes https://github.com/pimoroni/enviro/issues/20
-    while True:
-        value = wind_direction_pin.read_voltage()
-
-        closest_index = -1
-        closest_value = float('inf')
-
-        for i in range(8):
-            distance = abs(ADC_TO_DEGREES[i] - value)
-            if distance < closest_value:
-                closest_value = distance
-                closest_index = i
-
-        if last_index == closest_index:
+    last_heading = None
+    reads = 0
+    while reads < WIND_DIRECTION_READS:
+        heading = wind_vane_heading(wind_direction_pin.read_u16())
+        if heading == last_heading:
             break
-
-        last_index = closest_index
-
-    return closest_index * 45
+        last_heading = heading
+        reads += 1
+    return heading
 
 
 def rainfall(seconds_since_last):
-    amount = 0
-    now = helpers.timestamp(helpers.datetime_string())
-    if helpers.file_exists("rain.txt"):
-        with open("rain.txt", "r") as rainfile:
-            rain_entries = rainfile.read().split("\n")
-
-        # count how many rain ticks since the last reading
-        for entry in rain_entries:
-            if entry:
-                ts = helpers.timestamp(entry)
-                if now - ts < seconds_since_last:
-                    amount += RAIN_MM_PER_TICK
-
-        os.remove("rain.txt")
-    
+    # count how many rain ticks since the last reading
+    now = time.time()
+    amount = rain_log.count_since(now - int(seconds_since_last), now) * RAIN_MM_PER_TICK
+
     per_second = 0
     if seconds_since_last > 0:
         per_second = amount / seconds_since_last
@@ -190,23 +225,97 @@ def rainfall(seconds_since_last):
     return amount, per_second
 
 
-def get_sensor_readings(seconds_since_last):
+async def read_bme280(seconds_since_last):
     # bme280 returns the register contents immediately and then starts a new reading
     # we want the current reading so do a dummy read to discard register contents first
-    bme280.read()
-    time.sleep(0.1)
-    bme280_data = bme280.read()
-
-    ltr_data = ltr559.get_reading()
-    rain, rain_per_second = rainfall(seconds_since_last)
+    async with bme280_device:
+        bme280.read()
+    await asyncio.sleep_ms(100)
+    async with bme280_device:
+        bme280_data = bme280.read()
 
-    return OrderedDict({
+    return {
         "temperature": round(bme280_data[0], 2),
         "humidity": round(bme280_data[2], 2),
-        "pressure": round(bme280_data[1] / 100.0, 2),
-        "luminance": round(ltr_data[BreakoutLTR559.LUX], 2),
-        "wind_speed": wind_speed(),
+        "pressure": round(bme280_data[1] / 100.0, 2)
+    }
+
+
+async def read_ltr559(seconds_since_last):
+    async with ltr559_device:
+        ltr_data = ltr559.get_reading()
+
+    return {
+        "luminance": round(ltr_data[BreakoutLTR559.LUX], 2)
+    }
+
+
+# the mean speed, strongest gust and mean direction since the last reading,
+# or the wind right now if it's not being sampled in the background, as in
+# low power mode
+async def read_wind(seconds_since_last):
+    stats = wind_stats
+    if stats.samples == 0:
+        speed = wind_speed()
+        gust = speed
+        direction = wind_direction()
+    else:
+        speed = wind_speed_from_edges(stats.edges, stats.elapsed_ms)
+        gust = wind_speed_from_edges(stats.gust_edges, stats.gust_elapsed_ms)
+        direction = stats.direction()
+        stats.reset()
+
+    return {
+        "wind_speed": speed,
+        "wind_gust": gust,
+        "gust_factor": gust / speed if speed > 0 else 0,
+        "wind_direction": direction
+    }
+
+
+async def read_rain(seconds_since_last):
+    rain, rain_per_second = rainfall(seconds_since_last)
+
+    return {
         "rain": rain,
-        "rain_per_second": rain_per_second,
-        "wind_direction": wind_direction()
-    })
+        "rain_per_second": rain_per_second
+    }
+
+
+# the hardware behind each reading, see enviroble.scheduler
+SOURCES = OrderedDict({
+    "bme280": (compensated(read_bme280, USB_POWER_TEMPERATURE_OFFSET, vbus_present),
+               ("temperature", "humidity", "pressure", "dew_point")),
+    "ltr559": (read_ltr559, ("luminance",)),
+    "wind": (read_wind, ("wind_speed", "wind_gust", "gust_factor", "wind_direction")),
+    "rain": (read_rain, ("rain", "rain_per_second"))
+})
+
+# how often to sample each reading, anything not listed is sampled every minute
+SAMPLE_PERIODS_MS = {
+    "luminance": 10 * 1000,
+    "wind_speed": WIND_REPORT_MS,
+    "wind_gust": WIND_REPORT_MS,
+    "gust_factor": WIND_REPORT_MS,
+    "wind_direction": WIND_REPORT_MS
+}
+
+# how the wind readings are measured, for their Environmental Sensing
+# Measurement descriptors, as (sampling function, measurement period in
+# seconds, update interval in seconds)
+MEASUREMENTS = {
+    "wind_speed": (schema.SAMPLING_MEAN, WIND_REPORT_MS // 1000, WIND_REPORT_MS // 1000),
+    "wind_gust": (schema.SAMPLING_MAXIMUM, WIND_GUST_SAMPLES * WIND_SAMPLE_MS // 1000, WIND_REPORT_MS // 1000),
+    "gust_factor": (schema.SAMPLING_UNSPECIFIED, WIND_REPORT_MS // 1000, WIND_REPORT_MS // 1000),
+    "wind_direction": (schema.SAMPLING_MEAN, WIND_REPORT_MS // 1000, WIND_REPORT_MS // 1000)
+}
+
+# raw data for enviroble.stream, each a function returning what's new since
+# it was last called
+STREAMS = {
+    schema.STREAM_WIND: wind_edges
+}
+
+
+async def get_sensor_readings(seconds_since_last):
+    return await read_sources(SOURCES, seconds_since_last)
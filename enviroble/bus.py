@@ -0,0 +1,105 @@
+import time
+import uasyncio as asyncio
+from pimoroni_i2c import PimoroniI2C
+
+# the fastest clock every device on each board's main i2c bus supports. all
+# of them manage fast mode
+FREQUENCIES = {
+    "indoor": 400000,
+    "grow": 400000,
+    "weather": 400000,
+    "urban": 400000
+}
+
+# until the board is known, the bus runs at a clock anything will answer at
+DETECT_FREQUENCY = 100000
+
+# every bus that's been set up
+buses = []
+
+
+# an i2c bus shared by every device on it. the bus object is made once and
+# reused, and tasks take turns with it through a device's async context so
+# that one can't start a transaction in the middle of another's:
+#
+#   async with bme280_device:
+#       data = bme280.read()
+#
+# the time each device holds the bus is added up, see report(). at boot,
+# before any tasks are running, the bus object can be used directly
+class I2CBus:
+    def __init__(self, sda, scl, freq):
+        self._pins = (sda, scl)
+        self.freq = freq
+        self.i2c = PimoroniI2C(sda, scl, freq)
+        self.lock = asyncio.Lock()
+        self.devices = []
+        buses.append(self)
+
+    # change the clock, before anything's been handed the bus object
+    def set_freq(self, freq):
+        if freq != self.freq:
+            self.freq = freq
+            self.i2c = PimoroniI2C(self._pins[0], self._pins[1], freq)
+
+    def device(self, name, address=None):
+        device = I2CDevice(self, name, address)
+        self.devices.append(device)
+        return device
+
+    # the microseconds and transactions each device has held the bus for, as
+    # (name, us, transactions), since the last reset
+    def report(self):
+        return [(device.name, device.bus_us, device.transactions) for device in self.devices]
+
+    def reset(self):
+        for device in self.devices:
+            device.bus_us = 0
+            device.transactions = 0
+
+
+# what every device on every bus has used, see I2CBus.report()
+def report():
+    results = []
+    for bus in buses:
+        results.extend(bus.report())
+    return results
+
+
+def reset():
+    for bus in buses:
+        bus.reset()
+
+
+# one device on an I2CBus, holding the bus for as long as it's in its async
+# context and counting the time. a device with an address can make its own
+# register reads and writes, which are made as single transactions: a burst
+# read of several registers in a row into a buffer that's reused is one
+# transaction rather than one per register
+class I2CDevice:
+    def __init__(self, bus, name, address=None):
+        self.bus = bus
+        self.name = name
+        self.address = address
+        self.bus_us = 0
+        self.transactions = 0
+        self._started = 0
+
+    async def __aenter__(self):
+        await self.bus.lock.acquire()
+        self._started = time.ticks_us()
+        return self.bus.i2c
+
+    async def __aexit__(self, *args):
+        self.bus_us += time.ticks_diff(time.ticks_us(), self._started)
+        self.transactions += 1
+        self.bus.lock.release()
+
+    # read len(buffer) registers from register onwards into buffer
+    async def read_into(self, register, buffer):
+        async with self as i2c:
+            i2c.readfrom_mem_into(self.address, register, buffer)
+
+    async def write(self, register, data):
+        async with self as i2c:
+            i2c.writeto_mem(self.address, register, data)
@@ -0,0 +1,343 @@
+# client library for collecting readings from Enviro BLE boards
+#
+# this runs under regular (CPython) asyncio rather than on a board, for
+# example:
+#
+#   backend = BleakBackend()
+#   collector = Collector(backend, max_connections=4)
+#   for advertisement in await scan(backend):
+#       collector.add(advertisement.address)
+#   async for reading in collector:
+#       print(reading.address, reading.model, reading.readings)
+import asyncio
+import struct
+import time
+from collections import deque, namedtuple
+
+import enviroble.schema as schema
+from enviroble.client.backend import Advertisement, BleakBackend, uuid16
+
+ENV_SENSE_UUID = uuid16(0x181A)
+DEVICE_INFO_UUID = uuid16(0x180A)
+RECORD_UUID = schema.RECORD_UUID
+HISTORY_UUID = schema.HISTORY_UUID
+STATS_UUID = schema.STATS_UUID
+
+DEVICE_INFO = {
+    "manufacturer": uuid16(0x2A29),
+    "model": uuid16(0x2A24),
+    "serial": uuid16(0x2A25),
+    "firmware": uuid16(0x2A26),
+    "version": uuid16(0x2A28)
+}
+
+# sequence is only set for readings collected from beacon advertisements or
+# downloaded from a board's history
+Reading = namedtuple("Reading", ("address", "model", "received", "readings", "sequence"), defaults=(None,))
+
+# a frame from a board's l2cap stream, see schema.STREAM_PSM
+Frame = namedtuple("Frame", ("stream", "sequence", "payload"))
+
+
+# find boards advertising nearby
+async def scan(backend, timeout=5.0, prefix="enviro-"):
+    return [adv for adv in await backend.scan(timeout) if adv.name and adv.name.startswith(prefix)]
+
+
+# decode the readings from a beacon mode advertisement, returns None if the
+# advertisement isn't from a board in beacon mode or it hasn't taken its
+# first reading yet
+def decode_beacon(advertisement):
+    data = advertisement.service_data.get(ENV_SENSE_UUID)
+    if not data:
+        return None
+    try:
+        sequence, model, version, readings = schema.unpack_beacon(data)
+    except ValueError:
+        # other devices use Environmental Sensing service data too
+        return None
+    if sequence == 0:
+        return None
+    return Reading(advertisement.address, model, time.time(), readings, sequence)
+
+
+# collect readings from boards in beacon mode without connecting, yielding
+# each new reading once no matter how many times it's advertised
+async def beacons(backend, **kwargs):
+    sequences = {}
+    async for advertisement in backend.advertisements(**kwargs):
+        reading = decode_beacon(advertisement)
+        if reading is None or sequences.get(reading.address) == reading.sequence:
+            continue
+        sequences[reading.address] = reading.sequence
+        yield reading
+
+
+# a connection to a single board
+class Board:
+    def __init__(self, backend, address):
+        self.backend = backend
+        self.address = address
+        self.connection = None
+        self.info = {}
+        self._history = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.disconnect()
+
+    @property
+    def model(self):
+        return self.info.get("model")
+
+    async def connect(self):
+        self.connection = await self.backend.connect(self.address)
+        for key, uuid in DEVICE_INFO.items():
+            if self.connection.has(uuid):
+                self.info[key] = (await self.connection.read(uuid)).decode()
+
+    async def disconnect(self):
+        if self.connection is not None:
+            await self.connection.disconnect()
+            self.connection = None
+            self._history = None
+
+    def _decode(self, data):
+        model, version, readings = schema.unpack_record(data)
+        return Reading(self.address, model, time.time(), readings)
+
+    # every reading from the board, from the packed readings characteristic
+    async def read(self):
+        return self._decode(await self.connection.read(RECORD_UUID))
+
+    # the individual Environmental Sensing characteristics, keyed by the names
+    # used in schema.FIELDS
+    async def read_sensors(self):
+        readings = {}
+        for uuid, name in schema.UUIDS.items():
+            if self.connection.has(uuid16(uuid)):
+                readings[name] = schema.unpack(name, await self.connection.read(uuid16(uuid)))
+        return readings
+
+    # the minimum, maximum, mean and standard deviation of each reading over
+    # the board's last reporting interval, as the interval in seconds and a
+    # dict of (samples, minimum, maximum, mean, standard deviation) keyed by
+    # reading, or None if the board doesn't keep statistics
+    async def read_stats(self):
+        if not self.connection.has(STATS_UUID):
+            return None
+        model, version, interval, stats = schema.unpack_stats(await self.connection.read(STATS_UUID))
+        return interval, stats
+
+    # call callback with a Reading whenever the board notifies new readings
+    async def subscribe(self, callback):
+        await self.connection.subscribe(RECORD_UUID, lambda data: callback(self._decode(data)))
+
+    def _history_received(self, data):
+        if self._history is not None:
+            self._history[0].extend(data)
+            self._history[1].set()
+
+    # download the readings the board has kept since sequence number since,
+    # oldest first, as Readings with their sequence numbers set and received
+    # set to when they were taken. pass the last sequence number seen to pick
+    # up where an earlier download left off. gives up if nothing arrives for
+    # timeout seconds, returning the records that did arrive
+    async def history(self, since=0, timeout=5.0):
+        oldest, newest, offset, record_size = await self._history_status()
+        if newest <= since:
+            return []
+        expected = (newest - max(since, oldest - 1)) * record_size
+
+        if self._history is None:
+            self._history = (bytearray(), asyncio.Event())
+            await self.connection.subscribe(HISTORY_UUID, self._history_received)
+        stream, progress = self._history
+        del stream[:]
+        await self.connection.write(HISTORY_UUID, struct.pack(schema.HISTORY_REQUEST, since))
+        try:
+            while len(stream) < expected:
+                progress.clear()
+                await asyncio.wait_for(progress.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        return self._history_readings(stream, offset)
+
+    # the oldest and newest records the board has, what to add to its
+    # timestamps to get local time and the size of each record
+    async def _history_status(self):
+        status = await self.connection.read(HISTORY_UUID)
+        oldest, newest, board_time, record_size = struct.unpack_from(schema.HISTORY_STATUS, status)
+        # the board's clock may not be set, so timestamps are taken relative
+        # to its idea of now
+        return oldest, newest, time.time() - board_time, record_size
+
+    def _history_readings(self, data, offset):
+        return [Reading(self.address, model, timestamp + offset, readings, sequence)
+                for sequence, timestamp, model, version, readings in schema.unpack_history(bytes(data))]
+
+    # open the board's l2cap stream, which it only listens for with
+    # _STREAM_MODE set
+    async def open_stream(self, mtu=512):
+        return Stream(self, await self.connection.open_channel(schema.STREAM_PSM, mtu))
+
+
+# splits what's received on a stream back into frames, however it was cut up
+# on the way, and counts the frames lost on each stream from the gaps in
+# their sequence numbers
+class FrameReader:
+    def __init__(self):
+        self.lost = {}
+        self._buffer = bytearray()
+        self._header = struct.calcsize(schema.STREAM_HEADER)
+        self._next = {}
+
+    def feed(self, data):
+        self._buffer += data
+        frames = []
+        while len(self._buffer) >= self._header:
+            stream, sequence, length = struct.unpack_from(schema.STREAM_HEADER, self._buffer)
+            end = self._header + length
+            if len(self._buffer) < end:
+                break
+            frames.append(Frame(stream, sequence, bytes(self._buffer[self._header:end])))
+            del self._buffer[:end]
+            expected = self._next.get(stream)
+            if expected is not None and sequence != expected:
+                self.lost[stream] = self.lost.get(stream, 0) + ((sequence - expected) & 0xFFFF)
+            self._next[stream] = (sequence + 1) & 0xFFFF
+        return frames
+
+
+# a board's l2cap stream, iterate over it for Frames of raw data:
+#
+#   async with Board(backend, address) as board:
+#       stream = await board.open_stream()
+#       async for frame in stream:
+#           if frame.stream == schema.STREAM_WIND:
+#               ...
+class Stream:
+    def __init__(self, board, channel):
+        self.board = board
+        self.channel = channel
+        self.reader = FrameReader()
+        self._sequences = {}
+        self._pending = deque()
+
+    @property
+    def lost(self):
+        return self.reader.lost
+
+    async def send(self, stream, payload):
+        sequence = self._sequences.get(stream, 0)
+        self._sequences[stream] = (sequence + 1) & 0xFFFF
+        await self.channel.send(struct.pack(schema.STREAM_HEADER, stream, sequence, len(payload)) + payload)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._pending:
+            data = await self.channel.recv()
+            if not data:
+                raise StopAsyncIteration
+            self._pending.extend(self.reader.feed(data))
+        return self._pending.popleft()
+
+    # download the board's history like Board.history() does, over the
+    # stream instead. frames from other streams that arrive meanwhile are
+    # kept for iterating over afterwards
+    async def history(self, since=0, timeout=5.0):
+        oldest, newest, offset, record_size = await self.board._history_status()
+        await self.send(schema.STREAM_HISTORY, struct.pack(schema.HISTORY_REQUEST, since))
+        records = bytearray()
+        others = deque()
+        try:
+            while True:
+                frame = await asyncio.wait_for(self.__anext__(), timeout)
+                if frame.stream != schema.STREAM_HISTORY:
+                    others.append(frame)
+                elif frame.payload:
+                    records += frame.payload
+                else:
+                    break
+        except (asyncio.TimeoutError, StopAsyncIteration):
+            pass
+        self._pending.extendleft(reversed(others))
+        return self.board._history_readings(records, offset)
+
+    async def close(self):
+        await self.channel.close()
+
+
+# collects readings from many boards at once as an async stream of Readings
+#
+# at most max_connections boards are connected at a time. by default each
+# board stays connected and its notifications are streamed, so any boards
+# beyond max_connections wait for a free slot. with poll_interval set, boards
+# are instead connected, read and disconnected in turn every poll_interval
+# seconds which lets a small pool serve any number of boards
+class Collector:
+    def __init__(self, backend, max_connections=8, poll_interval=None, queue_size=1024):
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self.received = 0
+        self.dropped = 0
+        self.errors = 0
+        self._slots = asyncio.Semaphore(max_connections)
+        self._queue = asyncio.Queue(queue_size)
+        self._workers = {}
+
+    def add(self, address):
+        if address not in self._workers:
+            self._workers[address] = asyncio.ensure_future(self._worker(address))
+
+    async def remove(self, address):
+        worker = self._workers.pop(address, None)
+        if worker is not None:
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+
+    async def close(self):
+        for address in list(self._workers):
+            await self.remove(address)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._queue.get()
+
+    def _put(self, reading):
+        self.received += 1
+        # if nobody is keeping up with the stream drop the oldest reading
+        # rather than stalling the boards
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(reading)
+
+    async def _worker(self, address):
+        retry_delay = 1
+        while True:
+            try:
+                async with self._slots:
+                    async with Board(self.backend, address) as board:
+                        self._put(await board.read())
+                        if self.poll_interval is None:
+                            await board.subscribe(self._put)
+                            await board.connection.disconnected()
+                retry_delay = 1
+                if self.poll_interval is not None:
+                    await asyncio.sleep(self.poll_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # back off and try again, boards come and go
+                self.errors += 1
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60)
@@ -0,0 +1,128 @@
+# python3 -m enviroble.client [--fake BOARDS] [--connections N] [--poll SECONDS] [--beacons] [--history] [--stream] [--duration SECONDS]
+#
+# scans for Enviro BLE boards and prints their readings as they arrive, with
+# --fake it runs against that many simulated boards and reports throughput.
+# --beacons collects from boards in beacon mode without connecting and
+# --history downloads the readings each board has kept instead. --stream
+# uses the boards' l2cap streams, for history downloads with --history or
+# otherwise reporting the raw data streamed from the first board found,
+# falling back to notifications where a stream can't be opened
+import argparse
+import asyncio
+import time
+
+from enviroble.client import BleakBackend, Board, Collector, beacons, scan
+
+
+# opens the board's l2cap stream, or gives None where it can't be opened,
+# such as without Linux bluetooth sockets, to use notifications instead
+async def open_stream(board):
+    try:
+        return await board.open_stream()
+    except OSError as error:
+        print(f"{board.address}: no l2cap stream ({error}), using notifications")
+        return None
+
+
+async def download_history(backend, quiet, use_stream):
+    for advertisement in await scan(backend):
+        start = time.monotonic()
+        async with Board(backend, advertisement.address) as board:
+            stream = await open_stream(board) if use_stream else None
+            if stream is not None:
+                readings = await stream.history()
+                await stream.close()
+            else:
+                readings = await board.history()
+        elapsed = time.monotonic() - start
+        if not quiet:
+            for reading in readings:
+                print(reading.address, reading.sequence, time.ctime(reading.received), reading.readings)
+        print(f"{advertisement.address}: {len(readings)} records in {elapsed:.1f}s "
+              f"({len(readings) / elapsed:.0f}/s)")
+
+
+async def watch_stream(backend, duration, quiet):
+    advertisement = (await scan(backend))[0]
+    start = time.monotonic()
+    frames = received = 0
+    async with Board(backend, advertisement.address) as board:
+        stream = await open_stream(board)
+        if stream is None:
+            return False
+
+        async def consume():
+            nonlocal frames, received
+            async for frame in stream:
+                frames += 1
+                received += len(frame.payload)
+                if not quiet:
+                    print(advertisement.address, frame.stream, frame.sequence, len(frame.payload))
+
+        try:
+            await asyncio.wait_for(consume(), duration)
+        except asyncio.TimeoutError:
+            pass
+        await stream.close()
+
+    elapsed = time.monotonic() - start
+    print(f"{frames} frames, {received} bytes from {advertisement.address} in {elapsed:.1f}s "
+          f"({received / elapsed:.0f}B/s), lost {stream.lost}")
+    return True
+
+
+async def main(args):
+    if args.fake:
+        from enviroble.client.fake import FakeBackend
+        backend = FakeBackend(args.fake, interval=args.interval)
+    else:
+        backend = BleakBackend()
+
+    if args.history:
+        await download_history(backend, args.quiet, args.stream)
+        return
+    if args.stream and await watch_stream(backend, args.duration, args.quiet):
+        return
+
+    collector = Collector(backend, max_connections=args.connections, poll_interval=args.poll)
+    if args.beacons:
+        stream = beacons(backend, passive=True)
+    else:
+        for advertisement in await scan(backend):
+            collector.add(advertisement.address)
+        stream = collector
+
+    start = time.monotonic()
+    boards = set()
+    received = 0
+
+    async def consume():
+        nonlocal received
+        async for reading in stream:
+            received += 1
+            boards.add(reading.address)
+            if not args.quiet:
+                print(reading.address, reading.model, reading.readings)
+
+    try:
+        await asyncio.wait_for(consume(), args.duration)
+    except asyncio.TimeoutError:
+        pass
+    await collector.close()
+
+    elapsed = time.monotonic() - start
+    print(f"{received} readings from {len(boards)} boards in {elapsed:.1f}s "
+          f"({received / elapsed:.1f}/s), {collector.dropped} dropped, {collector.errors} errors")
+
+
+parser = argparse.ArgumentParser(prog="python3 -m enviroble.client")
+parser.add_argument("--fake", type=int, default=0, help="use this many simulated boards")
+parser.add_argument("--interval", type=float, default=1.0, help="simulated board update interval in seconds")
+parser.add_argument("--connections", type=int, default=8, help="maximum simultaneous connections")
+parser.add_argument("--poll", type=float, default=None, help="poll boards every this many seconds instead of subscribing")
+parser.add_argument("--beacons", action="store_true", help="collect from boards in beacon mode without connecting")
+parser.add_argument("--history", action="store_true", help="download the readings each board has kept")
+parser.add_argument("--stream", action="store_true", help="use the boards' l2cap streams")
+parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+parser.add_argument("--quiet", action="store_true", help="only print the summary")
+asyncio.run(main(parser.parse_args()))
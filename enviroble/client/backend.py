@@ -0,0 +1,121 @@
+# BLE backends for the client library
+#
+# a backend provides scan(), advertisements() and connect(), and a connection
+# provides has(), read(), write(), subscribe(), disconnect() and disconnected(), all
+# using full 128-bit UUID strings, plus open_channel() for an l2cap connection
+# oriented channel with send(), recv() and close(). BleakBackend talks to real hardware,
+# enviroble.client.fake has an in-process stand-in for trying things out
+# without any boards
+import asyncio
+import socket
+from collections import namedtuple
+
+Advertisement = namedtuple("Advertisement", ("address", "name", "rssi", "service_data", "manufacturer_data"))
+
+
+# the full UUID of a 16-bit one, full UUIDs are passed through as they are
+def uuid16(uuid):
+    if isinstance(uuid, str):
+        return uuid
+    return f"0000{uuid:04x}-0000-1000-8000-00805f9b34fb"
+
+
+class BleakBackend:
+    def __init__(self):
+        # bleak is only needed when talking to real hardware
+        import bleak
+        self._bleak = bleak
+
+    def _advertisement(self, device, adv):
+        return Advertisement(device.address, adv.local_name or device.name, adv.rssi,
+                             {uuid: bytes(data) for uuid, data in adv.service_data.items()},
+                             {company: bytes(data) for company, data in adv.manufacturer_data.items()})
+
+    async def scan(self, timeout=5.0):
+        found = await self._bleak.BleakScanner.discover(timeout=timeout, return_adv=True)
+        return [self._advertisement(device, adv) for device, adv in found.values()]
+
+    # every advertisement received, for as long as the iterator is used
+    #
+    # passive scanning never sends scan requests, but on Linux bleak needs
+    # extra BlueZ arguments for it, see the bleak documentation
+    async def advertisements(self, passive=False, **kwargs):
+        queue = asyncio.Queue()
+        scanner = self._bleak.BleakScanner(
+            detection_callback=lambda device, adv: queue.put_nowait(self._advertisement(device, adv)),
+            scanning_mode="passive" if passive else "active",
+            **kwargs)
+        async with scanner:
+            while True:
+                yield await queue.get()
+
+    async def connect(self, address, timeout=10.0):
+        connection = BleakConnection(self._bleak, address)
+        await connection.connect(timeout)
+        return connection
+
+
+class BleakConnection:
+    def __init__(self, bleak, address):
+        self.address = address
+        self._disconnected = asyncio.Event()
+        self._client = bleak.BleakClient(address, disconnected_callback=lambda client: self._disconnected.set())
+
+    async def connect(self, timeout):
+        await self._client.connect(timeout=timeout)
+
+    def has(self, uuid):
+        return self._client.services.get_characteristic(uuid) is not None
+
+    async def read(self, uuid):
+        return bytes(await self._client.read_gatt_char(uuid))
+
+    async def write(self, uuid, data):
+        await self._client.write_gatt_char(uuid, data, response=True)
+
+    async def subscribe(self, uuid, callback):
+        await self._client.start_notify(uuid, lambda characteristic, data: callback(bytes(data)))
+
+    # bleak has no l2cap support, so channels go through a Linux bluetooth
+    # socket alongside bleak's connection
+    async def open_channel(self, psm, mtu):
+        return await SocketChannel.open(self.address, psm, mtu)
+
+    async def disconnect(self):
+        await self._client.disconnect()
+
+    async def disconnected(self):
+        await self._disconnected.wait()
+
+
+# an l2cap connection oriented channel through a Linux bluetooth socket, which
+# needs a Python whose sockets can take an LE address type
+class SocketChannel:
+    def __init__(self, sock, mtu):
+        self.mtu = mtu
+        self._socket = sock
+
+    @classmethod
+    async def open(cls, address, psm, mtu, address_type=None):
+        if not hasattr(socket, "BDADDR_LE_PUBLIC"):
+            raise OSError("L2CAP channels need Linux bluetooth sockets with LE addresses")
+        if address_type is None:
+            address_type = socket.BDADDR_LE_PUBLIC
+        sock = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_SEQPACKET, socket.BTPROTO_L2CAP)
+        sock.setblocking(False)
+        try:
+            await asyncio.get_running_loop().sock_connect(sock, (address, psm, 0, address_type))
+        except BaseException:
+            sock.close()
+            raise
+        return cls(sock, mtu)
+
+    async def send(self, data):
+        await asyncio.get_running_loop().sock_sendall(self._socket, data)
+
+    # the next data received, empty once the channel has closed
+    async def recv(self):
+        return await asyncio.get_running_loop().sock_recv(self._socket, self.mtu)
+
+    async def close(self):
+        self._socket.close()
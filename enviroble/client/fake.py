@@ -0,0 +1,297 @@
+# in-process stand-in for a fleet of Enviro BLE boards, use FakeBackend in
+# place of BleakBackend to try the client library without any hardware
+import asyncio
+import math
+import random
+import struct
+import time
+
+import enviroble.schema as schema
+from enviroble.stats import ReadingStats
+from enviroble.constants import ENVIRO_BLE_VERSION
+from enviroble.client.backend import Advertisement, uuid16
+
+# typical value and how far it wanders for each property
+_READINGS = {
+    "temperature": (21.0, 2.0),
+    "humidity": (45.0, 5.0),
+    "dew_point": (9.0, 2.0),
+    "pressure": (1013.0, 5.0),
+    "luminance": (250.0, 100.0),
+    "color_temperature": (4500.0, 500.0),
+    "gas_resistance": (50000.0, 5000.0),
+    "iaq": (50.0, 25.0),
+    "iaq_accuracy": (2.0, 1.0),
+    "moisture_a": (50.0, 10.0),
+    "moisture_b": (50.0, 10.0),
+    "moisture_c": (50.0, 10.0),
+    "wind_speed": (3.0, 2.0),
+    "wind_direction": (180.0, 180.0),
+    "wind_gust": (6.0, 3.0),
+    "gust_factor": (1.5, 0.5),
+    "rain": (0.5, 0.5),
+    "noise": (0.2, 0.1),
+    "noise_rms": (0.05, 0.03),
+    "noise_peak": (0.1, 0.05),
+    "noise_dba": (50.0, 10.0),
+    "pm1": (5.0, 3.0),
+    "pm2_5": (8.0, 4.0),
+    "pm10": (12.0, 6.0),
+    "pm1_atmospheric": (5.0, 3.0),
+    "pm2_5_atmospheric": (8.0, 4.0),
+    "pm10_atmospheric": (12.0, 6.0),
+    "pm0_3_per_litre": (3000.0, 1000.0),
+    "pm0_5_per_litre": (1000.0, 300.0),
+    "pm1_per_litre": (250.0, 100.0),
+    "pm2_5_per_litre": (80.0, 30.0),
+    "pm5_per_litre": (60.0, 20.0),
+    "pm10_per_litre": (30.0, 10.0)
+}
+
+
+# how many samples go into each of a board's statistics, as though it were
+# sampling every ten seconds for five minutes
+STATS_SAMPLES = 30
+
+
+class FakeBoard:
+    # boards come with history_records of history taken every history_interval
+    # seconds, as though they'd been running for a while
+    def __init__(self, address, model, history_records=24 * 60, history_interval=60):
+        self.address = address
+        self.model = model
+        self.name = f"enviro-{model}"
+        self._record = bytearray(schema.record_size(model))
+        self._compact = bytearray(schema.record_size(model, schema.COMPACT_RECORDS))
+        self._beacon = bytearray(1 + len(self._compact))
+        self._stats = bytearray(schema.stats_size(model))
+        self.stats = ReadingStats(schema.FIELDS[name][0] for name in schema.stats_fields(model))
+        self.sequence = 0
+        self.values = {
+            uuid16(0x2A29): b"Pimoroni",
+            uuid16(0x2A24): model.encode(),
+            uuid16(0x2A25): address.replace(":", "").lower().encode(),
+            uuid16(0x2A26): b"fake",
+            uuid16(0x2A28): ENVIRO_BLE_VERSION.encode()
+        }
+        self.history = []
+        start = int(time.time()) - history_records * history_interval
+        for i in range(history_records):
+            self.sample()
+            self.record_history(start + i * history_interval)
+        self.sample()
+
+    # keep the current readings in the board's history
+    def record_history(self, timestamp=None):
+        if timestamp is None:
+            timestamp = int(time.time())
+        sequence = len(self.history) + 1
+        self.history.append(struct.pack(schema.HISTORY_HEADER, sequence, timestamp) + bytes(self._compact))
+        self.values[schema.HISTORY_UUID] = struct.pack(
+            schema.HISTORY_STATUS, 1, sequence, int(time.time()), len(self.history[-1]))
+
+    # the history after sequence as the board would stream it
+    def history_since(self, sequence):
+        return b"".join(self.history[sequence:])
+
+    # a second of raw data for the board's l2cap streams
+    def raw_streams(self):
+        now = time.monotonic()
+        if self.model == "weather":
+            rate = max(0.5, random.gauss(10, 3))
+            ticks = [int((now + i / rate) * 1000) & 0xFFFFFFFF for i in range(int(rate))]
+            return {schema.STREAM_WIND: struct.pack(f"<{len(ticks)}L", *ticks)}
+        if self.model == "urban":
+            samples = [int(32768 + 3000 * math.sin(i * 0.2)) for i in range(1024)]
+            return {schema.STREAM_MICROPHONE: struct.pack("<1024H", *samples)}
+        return {}
+
+    def sample(self):
+        readings = {}
+        for name in schema.RECORDS[self.model][2]:
+            property = schema.FIELDS[name][0]
+            typical, spread = _READINGS[property]
+            readings[property] = max(0, typical + random.uniform(-spread, spread))
+        schema.pack_record_into(self.model, self._record, readings)
+        schema.pack_record_into(self.model, self._compact, readings, schema.COMPACT_RECORDS)
+        self.values[schema.RECORD_UUID] = bytes(self._record)
+        self.sequence = self.sequence % 255 + 1
+        schema.pack_beacon_into(self.model, self._beacon, self.sequence, readings)
+        # summarised every STATS_SAMPLES samples
+        self.stats.add(readings, readings)
+        if self.stats.summary(self.stats.properties[0])[0] >= STATS_SAMPLES:
+            schema.pack_stats_into(self.model, self._stats, STATS_SAMPLES * 10, self.stats)
+            self.values[schema.STATS_UUID] = bytes(self._stats)
+            self.stats.reset()
+        return self.values[schema.RECORD_UUID]
+
+    # the board's advertisement, as it would be in beacon mode
+    def advertisement(self):
+        service_data = {uuid16(schema.BEACON_UUID): bytes(self._beacon)}
+        return Advertisement(self.address, self.name, random.randint(-90, -40), service_data, {})
+
+
+class FakeConnection:
+    def __init__(self, backend, board):
+        self.address = board.address
+        self._backend = backend
+        self._board = board
+        self._tasks = []
+        self._callbacks = {}
+        self._disconnected = asyncio.Event()
+
+    def has(self, uuid):
+        return uuid in self._board.values
+
+    async def read(self, uuid):
+        await asyncio.sleep(self._backend.latency)
+        return self._board.values[uuid]
+
+    async def write(self, uuid, data):
+        await asyncio.sleep(self._backend.latency)
+        if uuid == schema.HISTORY_UUID and uuid in self._callbacks:
+            since, = struct.unpack(schema.HISTORY_REQUEST, data)
+            self._tasks.append(asyncio.ensure_future(self._send_history(since)))
+
+    # stream the history in notifications of up to mtu - 3 bytes, one per
+    # connection event
+    async def _send_history(self, since):
+        data = self._board.history_since(since)
+        chunk = self._backend.mtu - 3
+        for offset in range(0, len(data), chunk):
+            self._callbacks[schema.HISTORY_UUID](data[offset:offset + chunk])
+            await asyncio.sleep(self._backend.connection_interval)
+
+    async def subscribe(self, uuid, callback):
+        if uuid == schema.HISTORY_UUID:
+            await asyncio.sleep(self._backend.latency)
+            self._callbacks[uuid] = callback
+            return
+
+        async def notify():
+            while True:
+                await asyncio.sleep(self._backend.interval)
+                callback(self._board.sample())
+
+        await asyncio.sleep(self._backend.latency)
+        self._tasks.append(asyncio.ensure_future(notify()))
+
+    async def open_channel(self, psm, mtu):
+        await asyncio.sleep(self._backend.latency)
+        if psm != schema.STREAM_PSM:
+            raise ConnectionRefusedError(psm)
+        channel = FakeChannel(self._backend, self._board, mtu)
+        self._tasks.append(asyncio.ensure_future(channel.run()))
+        return channel
+
+    async def disconnect(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if not self._disconnected.is_set():
+            self._backend.connected -= 1
+            self._disconnected.set()
+
+    async def disconnected(self):
+        await self._disconnected.wait()
+
+
+# the board's end of an l2cap stream, sending a frame every connection
+# interval
+class FakeChannel:
+    def __init__(self, backend, board, mtu):
+        self._backend = backend
+        self._board = board
+        self._mtu = mtu
+        self._header = struct.calcsize(schema.STREAM_HEADER)
+        self._requests = bytearray()
+        self._received = asyncio.Queue()
+        self._outgoing = asyncio.Queue()
+        self._sequences = {}
+
+    def _frames(self, stream, data):
+        room = self._mtu - self._header
+        for offset in range(0, max(1, len(data)), room):
+            payload = data[offset:offset + room]
+            sequence = self._sequences.get(stream, 0)
+            self._sequences[stream] = (sequence + 1) & 0xFFFF
+            self._outgoing.put_nowait(struct.pack(schema.STREAM_HEADER, stream, sequence, len(payload)) + payload)
+
+    async def run(self):
+        async def live():
+            while True:
+                for stream, data in self._board.raw_streams().items():
+                    self._frames(stream, data)
+                await asyncio.sleep(1)
+
+        task = asyncio.ensure_future(live())
+        try:
+            while True:
+                self._received.put_nowait(await self._outgoing.get())
+                await asyncio.sleep(self._backend.connection_interval)
+        finally:
+            task.cancel()
+            self._received.put_nowait(b"")
+
+    async def send(self, data):
+        await asyncio.sleep(self._backend.latency)
+        self._requests += data
+        while len(self._requests) >= self._header:
+            stream, sequence, length = struct.unpack_from(schema.STREAM_HEADER, self._requests)
+            if len(self._requests) < self._header + length:
+                break
+            payload = bytes(self._requests[self._header:self._header + length])
+            del self._requests[:self._header + length]
+            if stream == schema.STREAM_HISTORY:
+                since, = struct.unpack(schema.HISTORY_REQUEST, payload)
+                # whole records to a frame, then an empty one
+                size = len(self._board.history[0])
+                per_frame = (self._mtu - self._header) // size * size
+                data = self._board.history_since(since)
+                for offset in range(0, len(data), per_frame):
+                    self._frames(stream, data[offset:offset + per_frame])
+                self._frames(stream, b"")
+
+    async def recv(self):
+        return await self._received.get()
+
+    async def close(self):
+        self._received.put_nowait(b"")
+
+
+class FakeBackend:
+    # boards new readings every interval seconds, and every operation takes
+    # latency seconds. history is streamed one mtu sized notification every
+    # connection_interval seconds
+    def __init__(self, boards=10, interval=1.0, latency=0.01, mtu=247, connection_interval=0.0075):
+        models = list(schema.RECORDS)
+        self.interval = interval
+        self.latency = latency
+        self.mtu = mtu
+        self.connection_interval = connection_interval
+        self.connected = 0
+        self.boards = {}
+        for i in range(boards):
+            address = "FA:KE:{:02X}:{:02X}:{:02X}:{:02X}".format(*i.to_bytes(4, "big"))
+            self.boards[address] = FakeBoard(address, models[i % len(models)])
+
+    async def scan(self, timeout=5.0):
+        await asyncio.sleep(min(timeout, self.latency))
+        return [board.advertisement() for board in self.boards.values()]
+
+    # boards take a new sample every interval and each advertises a few times
+    # in between, as they would in beacon mode
+    async def advertisements(self, passive=False, repeats=3):
+        boards = list(self.boards.values())
+        while True:
+            for board in boards:
+                board.sample()
+            for repeat in range(repeats):
+                for board in boards:
+                    yield board.advertisement()
+                    await asyncio.sleep(self.interval / repeats / len(boards))
+
+    async def connect(self, address, timeout=10.0):
+        await asyncio.sleep(self.latency)
+        self.connected += 1
+        return FakeConnection(self, self.boards[address])
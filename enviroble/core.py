@@ -0,0 +1,690 @@
+import enviroble.constants as constants
+import enviroble.schema as schema
+import uasyncio as asyncio
+import aioble
+import bluetooth
+import struct
+from micropython import const
+from enviroble.bus import I2CBus, FREQUENCIES, DETECT_FREQUENCY
+from machine import Pin, PWM, Timer
+import math
+import time
+
+# keep the power rail alive by holding VSYS_EN high as early as possible
+# ===========================================================================
+hold_vsys_en_pin = Pin(constants.HOLD_VSYS_EN_PIN, Pin.OUT, value=True)
+
+# milestones from reset to the first advertisement as (name, ms since reset)
+boot_marks = []
+
+
+def boot_mark(name):
+    boot_marks.append((name, time.ticks_ms()))
+
+
+boot_mark("start")
+
+# detect board model based on devices on the i2c bus and pin state
+# ===========================================================================
+i2c_bus = I2CBus(constants.I2C_SDA_PIN, constants.I2C_SCL_PIN, DETECT_FREQUENCY)
+i2c = i2c_bus.i2c
+
+# the detected model is kept in flash so that later boots only have to
+# confirm it, see confirm_model()
+MODEL_CACHE_FILE = "model.txt"
+
+
+# true if a device answers at address
+def i2c_present(address):
+    try:
+        i2c.writeto(address, b"")
+        return True
+    except OSError:
+        return False
+
+
+def detect_model():
+    if i2c_present(56):     # 56 = colour / light sensor and only present on Indoor
+        return "indoor"
+    elif i2c_present(35):   # 35 = ltr-599 on grow & weather
+        pump3_pin = Pin(12, Pin.IN, Pin.PULL_UP)
+        model = "weather" if pump3_pin.value() else "grow"
+        pump3_pin.init(pull=None)
+        return model
+    return "urban"          # otherwise it's urban..
+
+
+# check the cached model still matches the hardware, in case the Pico W has
+# moved to a different board. only an Indoor has the colour sensor, so one
+# probe settles that. the others tell each other apart by what's missing and
+# by the weather board's pull up, which is everything detect_model() checks
+def confirm_model(model):
+    if model == "indoor":
+        return i2c_present(56)
+    return detect_model() == model
+
+
+def load_model():
+    try:
+        with open(MODEL_CACHE_FILE, "r") as f:
+            model = f.read().strip()
+        if confirm_model(model):
+            return model
+    except OSError:
+        pass
+
+    model = detect_model()
+    try:
+        with open(MODEL_CACHE_FILE, "w") as f:
+            f.write(model)
+    except OSError:
+        pass
+    return model
+
+
+model = load_model()
+# now the board's known, run the bus as fast as its devices allow. the
+# boards pick up the bus object after this
+i2c_bus.set_freq(FREQUENCIES[model])
+i2c = i2c_bus.i2c
+boot_mark("model")
+
+
+# return the module that implements this board type
+def get_board():
+    module = f"enviroble.boards.{model}"
+    return getattr(getattr(__import__(module), "boards"), model)
+
+
+# stands in for a driver until it's first used, so the board can start
+# advertising without waiting for every sensor to be set up
+class Lazy:
+    def __init__(self, factory, *args, **kwargs):
+        self._factory = (factory, args, kwargs)
+        self._object = None
+
+    def __getattr__(self, name):
+        if self._object is None:
+            factory, args, kwargs = self._factory
+            self._object = factory(*args, **kwargs)
+        value = getattr(self._object, name)
+        # methods are kept so that later calls don't come through here
+        if callable(value):
+            setattr(self, name, value)
+        return value
+
+
+# set up the activity led
+# ===========================================================================
+activity_led_pwm = None
+activity_led_duty = None
+activity_led_timer = None
+activity_led_period_ms = None
+
+# how often the pulsing animation steps
+ACTIVITY_LED_STEP_MS = 50
+
+# gamma corrected (gamma 2.8) duty for each brightness from 0 to 100, and for
+# each step of the pulsing animation, a sinusoid between 20 and 100. they're
+# tuples rather than arrays so that looking up a duty hands back an int that
+# already exists, and they're filled in before they're used so that the timer
+# callback only has to look them up
+activity_led_gamma = None
+activity_led_pulse = None
+activity_led_step = 0
+
+
+def activity_led_output():
+    global activity_led_pwm, activity_led_duty, activity_led_gamma
+    if activity_led_pwm is None:
+        activity_led_gamma = tuple(gamma_duty(brightness) for brightness in range(101))
+        activity_led_pwm = PWM(Pin(constants.ACTIVITY_LED_PIN))
+        activity_led_pwm.freq(1000)
+        # bound once so that the timer callback doesn't allocate a new method
+        activity_led_duty = activity_led_pwm.duty_u16
+    return activity_led_pwm
+
+
+def gamma_duty(brightness):
+    return int(pow(brightness / 100.0, 2.8) * 65535.0 + 0.5)
+
+
+# set the brightness of the activity led
+def activity_led(brightness):
+    activity_led_output()
+    brightness = int(brightness)
+    if brightness < 0: # clamp to range
+        brightness = 0
+    elif brightness > 100:
+        brightness = 100
+    activity_led_duty(activity_led_gamma[brightness])
+
+
+# steps the pulsing animation on, one step each ACTIVITY_LED_STEP_MS. it only
+# counts through the pulse table and looks the duty up, so it doesn't
+# allocate and can run as a hard interrupt
+def activity_led_callback(t):
+    global activity_led_step
+    step = activity_led_step + 1
+    if step >= len(activity_led_pulse):
+        step = 0
+    activity_led_step = step
+    activity_led_duty(activity_led_pulse[step])
+
+
+# set the activity led into pulsing mode
+def pulse_activity_led(speed_hz = 1):
+    global activity_led_timer, activity_led_period_ms, activity_led_pulse, activity_led_step
+    activity_led_output()
+    period_ms = max(1, int(1000 / speed_hz))
+    if period_ms != activity_led_period_ms:
+        if activity_led_timer is not None:
+            activity_led_timer.deinit()
+        steps = max(1, period_ms // ACTIVITY_LED_STEP_MS)
+        activity_led_pulse = tuple(
+            gamma_duty(math.sin(step * math.pi * 2 / steps) * 40 + 60) for step in range(steps)
+        )
+        activity_led_period_ms = period_ms
+        activity_led_step = 0
+    if activity_led_timer is None:
+        activity_led_timer = Timer(-1)
+    activity_led_timer.deinit()
+    activity_led_timer.init(period=ACTIVITY_LED_STEP_MS, mode=Timer.PERIODIC, callback=activity_led_callback, hard=True)
+
+
+# turn off the activity led and disable any pulsing animation that's running
+def stop_activity_led():
+    if activity_led_timer is not None:
+        activity_led_timer.deinit()
+    if activity_led_pwm is not None:
+        activity_led_pwm.duty_u16(0)
+
+
+# whether the board is powered over USB, reading VBUS needs the wireless chip
+# so it's left until it's asked for
+def vbus_present():
+    return Pin("WL_GPIO2", Pin.IN).value()
+
+
+class logging:
+    def info(self, *args, **kwargs):
+      pass
+
+    def debug(self, *args, **kwargs):
+      pass
+
+
+# decides when subscribers to a characteristic should be notified of a new
+# value: when it has moved by more than the deadband since the value last
+# sent (relative deadbands are a fraction of that value), but no more often
+# than min_interval_ms, and always after max_interval_ms as a heartbeat
+class NotifyPolicy:
+    def __init__(self, deadband=0, relative=False, min_interval_ms=1000, max_interval_ms=10 * 60 * 1000):
+        self.deadband = deadband
+        self.relative = relative
+        self.min_interval_ms = min_interval_ms
+        self.max_interval_ms = max_interval_ms
+        self.last_value = None
+        self.last_sent = None
+
+    def due(self, value, now):
+        if self.last_sent is None:
+            return True
+        elapsed = time.ticks_diff(now, self.last_sent)
+        if elapsed < self.min_interval_ms:
+            return False
+        if elapsed >= self.max_interval_ms:
+            return True
+        deadband = self.deadband
+        if self.relative:
+            deadband *= abs(self.last_value)
+        change = abs(value - self.last_value)
+        return change > deadband if deadband else change != 0
+
+    def sent(self, value, now):
+        self.last_value = value
+        self.last_sent = now
+
+
+# default notification deadbands for each reading, as (amount, relative),
+# anything not listed notifies on any change
+NOTIFY_DEADBANDS = {
+    "temperature": (0.1, False),         # degrees C
+    "humidity": (1, False),              # %
+    "dew_point": (0.5, False),           # degrees C
+    "pressure": (0.2, False),            # hPa
+    "luminance": (0.1, True),            # 10%
+    "color_temperature": (100, False),   # kelvin
+    "gas_resistance": (0.05, True),      # 5%
+    "iaq": (10, False),
+    "moisture_a": (1, False),            # %
+    "moisture_b": (1, False),
+    "moisture_c": (1, False),
+    "wind_speed": (0.5, False),          # m/s
+    "wind_direction": (45, False),       # degrees
+    "wind_gust": (1, False),             # m/s
+    "gust_factor": (0.5, False),
+    "noise": (0.05, False),              # volts
+    "noise_rms": (0.01, False),          # volts
+    "noise_peak": (0.05, False),         # volts
+    "noise_dba": (3, False),             # dB(A)
+    "pm1": (2, False),                   # ug/m3
+    "pm2_5": (2, False),
+    "pm10": (2, False),
+    "pm1_atmospheric": (2, False),
+    "pm2_5_atmospheric": (2, False),
+    "pm10_atmospheric": (2, False),
+    "pm0_3_per_litre": (0.1, True),      # 10%
+    "pm0_5_per_litre": (0.1, True),
+    "pm1_per_litre": (0.1, True),
+    "pm2_5_per_litre": (0.1, True),
+    "pm5_per_litre": (0.1, True),
+    "pm10_per_litre": (0.1, True)
+}
+
+
+def notify_policy(name):
+    return NotifyPolicy(*NOTIFY_DEADBANDS.get(name, (0, False)))
+
+
+# connected centrals
+# ===========================================================================
+_IRQ_GATTS_WRITE = const(3)
+_CCCD_NOTIFY = const(1)
+
+# how aioble marks a characteristic made with capture=True in its flags
+_FLAG_WRITE_CAPTURE = const(0x10000)
+
+
+# a connected central, the characteristics it's subscribed to and any
+# notifications it couldn't take when they were sent
+class Central:
+    def __init__(self, connection):
+        self.connection = connection
+        self.subscriptions = set()
+        self.pending = set()
+        self.sent = 0
+        self.missed = 0
+
+    def send(self, characteristic):
+        try:
+            characteristic.notify(self.connection)
+        except OSError:
+            # its buffers are full, send the latest value once there's room
+            self.pending.add(characteristic)
+            self.missed += 1
+            return
+        self.pending.discard(characteristic)
+        self.sent += 1
+
+
+# keeps track of up to limit connected centrals and what each is subscribed
+# to, and fans notifications out to them
+#
+# the bluetooth stack only keeps one subscription state for each
+# characteristic whoever wrote it, so subscriptions are picked up from each
+# central's writes to the characteristics' CCCDs instead. notifications are
+# sent to each subscriber separately and a central that isn't keeping up is
+# skipped and sent the latest value later, so it can't hold up the others
+class Centrals:
+    # how often to retry notifications that couldn't be sent
+    RETRY_MS = 100
+
+    def __init__(self, limit=1):
+        self.limit = limit
+        self.centrals = {}
+        self._cccds = {}
+        self._room = asyncio.Event()
+        aioble.core.register_irq_handler(self._irq, None)
+
+    # follow subscriptions to characteristics, once their services are
+    # registered. the stack puts each CCCD right after its value
+    def watch(self, *characteristics):
+        for characteristic in characteristics:
+            self._cccds[characteristic._value_handle + 1] = characteristic
+
+    def _irq(self, event, data):
+        if event == _IRQ_GATTS_WRITE:
+            conn_handle, attr_handle = data
+            characteristic = self._cccds.get(attr_handle)
+            central = self.centrals.get(conn_handle)
+            if characteristic is not None and central is not None:
+                value = bluetooth.BLE().gatts_read(attr_handle)
+                if value and value[0] & _CCCD_NOTIFY:
+                    central.subscriptions.add(characteristic)
+                    # catch it up with the current value
+                    central.send(characteristic)
+                else:
+                    central.subscriptions.discard(characteristic)
+                    central.pending.discard(characteristic)
+        # let aioble see every event too
+        return None
+
+    def full(self):
+        return len(self.centrals) >= self.limit
+
+    async def wait_for_room(self):
+        while self.full():
+            self._room.clear()
+            await self._room.wait()
+
+    def add(self, connection):
+        central = Central(connection)
+        self.centrals[connection._conn_handle] = central
+        return central
+
+    def remove(self, connection):
+        self.centrals.pop(connection._conn_handle, None)
+        self._room.set()
+
+    # send characteristic's value to every central subscribed to it
+    def notify(self, characteristic):
+        for central in self.centrals.values():
+            if characteristic in central.subscriptions:
+                central.send(characteristic)
+
+    # retry notifications that couldn't be sent, for as long as the board runs
+    async def run(self):
+        while True:
+            await asyncio.sleep_ms(self.RETRY_MS)
+            for central in self.centrals.values():
+                for characteristic in list(central.pending):
+                    central.send(characteristic)
+
+
+centrals = Centrals()
+
+
+# set a characteristic's value and notify its subscribers if send_update
+def update(characteristic, data, send_update=False):
+    characteristic.write(data)
+    if send_update:
+        centrals.notify(characteristic)
+
+
+# hands what centrals write to each writable characteristic to its handler as
+# handler(connection, data) as soon as it arrives. every characteristic gets
+# a task that waits on its writes without a timeout, so a write is handled
+# within a pass of the event loop and nothing wakes up while there aren't any
+class Writes:
+    def __init__(self):
+        self._handlers = []
+
+    def on(self, characteristic, handler):
+        self._handlers.append((characteristic, handler))
+
+    async def _serve(self, characteristic, handler):
+        while True:
+            if characteristic.flags & _FLAG_WRITE_CAPTURE:
+                connection, data = await characteristic.written(timeout_ms=None)
+            else:
+                connection = await characteristic.written(timeout_ms=None)
+                data = characteristic.read()
+            # a bad write mustn't stop the characteristic taking any more
+            try:
+                handler(connection, data)
+            except Exception as e:
+                print(f"Couldn't handle write to {characteristic.uuid}: {e}")
+
+    # handle writes for as long as the board runs
+    async def run(self):
+        tasks = [asyncio.create_task(self._serve(characteristic, handler))
+                 for characteristic, handler in self._handlers]
+        await asyncio.gather(*tasks)
+
+
+writes = Writes()
+
+
+class EnviroAnalog(aioble.Characteristic):
+    UUID = 0x2A58
+    def __init__(self, service, title, policy=None):
+        aioble.Characteristic.__init__(self, service, bluetooth.UUID(self.UUID), read=True, write=False, notify=True)
+        aioble.Descriptor(self, bluetooth.UUID(0x2901), read=True, initial=title)
+        self.policy = policy or NotifyPolicy(1)
+        self._buffer = bytearray(2)
+
+    def write_float(self, value):
+        now = time.ticks_ms()
+        send_update = self.policy.due(value, now)
+        struct.pack_into("<h", self._buffer, 0, int(value * 100))
+        update(self, self._buffer, send_update)
+        if send_update:
+            self.policy.sent(value, now)
+
+
+class EnviroDigital(aioble.Characteristic):
+    UUID = 0x2A56
+    def __init__(self, service, title, pin):
+        aioble.Characteristic.__init__(self, service, bluetooth.UUID(self.UUID), read=True, write=True, notify=True)
+        aioble.Descriptor(self, bluetooth.UUID(0x2901), read=True, initial=title)
+        self._iopin = pin
+
+    # switch the pin to match a value written by a central, returning the
+    # new state or None if it wasn't a value
+    def set_from(self, data):
+        if len(data) != 2:
+            return None
+        value = struct.unpack("<h", data)[0]
+        if value == 1:
+            self._iopin.on()
+            return True
+        else:
+            self._iopin.off()
+            return False
+
+
+# a setting that a central can change, sent as an analog value in hundredths
+# like EnviroAnalog and kept between minimum and maximum
+class EnviroSetting(aioble.Characteristic):
+    UUID = 0x2A58
+    def __init__(self, service, title, value, minimum=0, maximum=100):
+        aioble.Characteristic.__init__(self, service, bluetooth.UUID(self.UUID), read=True, write=True, notify=True)
+        aioble.Descriptor(self, bluetooth.UUID(0x2901), read=True, initial=title)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.write(struct.pack("<h", int(value * 100)))
+
+    # the new value from what a central wrote, or None if it wasn't a value
+    def set_from(self, data):
+        if len(data) != 2:
+            return None
+        value = struct.unpack("<h", data)[0] / 100
+        value = max(self.minimum, min(self.maximum, value))
+        # put back what's actually used, in case it was out of range
+        update(self, struct.pack("<h", int(value * 100)), True)
+        return value
+
+
+class EnviroSensor(aioble.Characteristic):
+    # a standard Environmental Sensing characteristic, encoded as described by
+    # its entry in schema.FIELDS, that notifies subscribers when its policy
+    # says the new value is worth sending. measurement is the arguments for
+    # schema.pack_measurement() to describe how the reading is taken, if it
+    # needs saying
+    def __init__(self, service, name, read=True, notify=True, policy=None, measurement=None):
+        aioble.Characteristic.__init__(self, service, bluetooth.UUID(schema.FIELDS[name][1]), read=read, notify=notify)
+        if measurement is not None:
+            aioble.Descriptor(self, bluetooth.UUID(schema.MEASUREMENT_UUID), read=True,
+                              initial=schema.pack_measurement(*measurement))
+        self.name = name
+        self.property = schema.FIELDS[name][0]
+        # encode into the same buffer every time rather than building new
+        # bytes objects for each update
+        self._buffer = bytearray(struct.calcsize(schema.FIELDS[name][2]))
+        self._value = memoryview(self._buffer)[:schema.characteristic_size(name)]
+        self.policy = policy or notify_policy(name)
+
+    def update_from_dict(self, readings):
+        value = readings.get(self.property)
+        if value is None:
+            return
+        now = time.ticks_ms()
+        send_update = self.policy.due(value, now)
+        schema.pack_into(self.name, self._buffer, 0, value)
+        update(self, self._value, send_update)
+        if send_update:
+            self.policy.sent(value, now)
+
+
+class EnviroReadings(aioble.Characteristic):
+    # custom characteristic carrying every reading from the board in a single
+    # value so that a full sample costs one read or notification, the layouts
+    # for each model are in schema.RECORDS
+    #
+    # subscribers are notified with the whole record when any one of its
+    # fields' policies says it's worth sending
+    UUID = bluetooth.UUID(schema.RECORD_UUID)
+
+    def __init__(self, service, model, read=True, notify=True):
+        aioble.Characteristic.__init__(self, service, self.UUID, read=read, notify=notify)
+        self.model = model
+        self._buffer = bytearray(schema.record_size(model))
+        self.policies = {}
+        for name in schema.RECORDS[model][2]:
+            self.policies[schema.FIELDS[name][0]] = notify_policy(name)
+
+    def update_from_dict(self, readings):
+        now = time.ticks_ms()
+        send_update = False
+        for property, policy in self.policies.items():
+            value = readings.get(property)
+            if value is not None and policy.due(value, now):
+                send_update = True
+        schema.pack_record_into(self.model, self._buffer, readings)
+        update(self, self._buffer, send_update)
+        if send_update:
+            for property, policy in self.policies.items():
+                value = readings.get(property)
+                if value is not None:
+                    policy.sent(value, now)
+
+
+class EnviroStats(aioble.Characteristic):
+    # custom characteristic summarising the board's readings over each
+    # reporting interval, see schema.STATS_UUID for the layout. subscribers
+    # are notified with every new summary
+    UUID = bluetooth.UUID(schema.STATS_UUID)
+
+    def __init__(self, service, model, read=True, notify=True):
+        aioble.Characteristic.__init__(self, service, self.UUID, read=read, notify=notify)
+        self.model = model
+        self._buffer = bytearray(schema.stats_size(model))
+
+    def update_from_stats(self, stats, interval_s):
+        schema.pack_stats_into(self.model, self._buffer, interval_s, stats)
+        update(self, self._buffer, True)
+
+
+class EnviroHistory(aioble.Characteristic):
+    # lets a central download the readings kept in an enviroble.history
+    # History, see schema.HISTORY_UUID for the protocol
+    #
+    # the records asked for are sent as one stream cut into notifications as
+    # big as the connection's MTU allows, so records don't need to fit into a
+    # single notification and a central that loses the connection part way
+    # through just asks again from the last whole record it got. each central
+    # gets its own download, so a slow one doesn't hold up the others
+    UUID = bluetooth.UUID(schema.HISTORY_UUID)
+
+    # largest notification payload, for a 247 byte MTU
+    MAX_CHUNK = 244
+    # how long to wait for the controller to free up buffers when they're full
+    RETRY_MS = 10
+
+    def __init__(self, service, history):
+        aioble.Characteristic.__init__(self, service, self.UUID, read=True, write=True, notify=True, capture=True)
+        self.history = history
+        self._status = bytearray(struct.calcsize(schema.HISTORY_STATUS))
+        self._downloads = {}
+        self.update_status()
+
+    def update_status(self):
+        history = self.history
+        struct.pack_into(schema.HISTORY_STATUS, self._status, 0,
+                         history.oldest(), history.newest, time.time(), history.record_size)
+        self.write(self._status)
+
+    # handle a request written by a central, see Writes. a new request from
+    # a central replaces the download it already has going
+    def request(self, connection, request):
+        self.update_status()
+        if len(request) >= struct.calcsize(schema.HISTORY_REQUEST):
+            download = self._downloads.pop(connection, None)
+            if download is not None:
+                download.cancel()
+            sequence = struct.unpack_from(schema.HISTORY_REQUEST, request)[0]
+            self._downloads[connection] = asyncio.create_task(self._download(connection, sequence))
+
+    async def _download(self, connection, sequence):
+        try:
+            await self.send_since(connection, sequence)
+        finally:
+            if self._downloads.get(connection) is asyncio.current_task():
+                del self._downloads[connection]
+
+    async def send_since(self, connection, sequence):
+        mtu = getattr(connection, "mtu", None) or 23
+        size = min(self.MAX_CHUNK, mtu - 3)
+        chunk = memoryview(bytearray(size))
+        record = memoryview(bytearray(self.history.record_size))
+        record_size = len(record)
+
+        sequence = max(sequence + 1, self.history.oldest())
+        position = record_size
+        while connection.is_connected():
+            filled = 0
+            while filled < size:
+                if position == record_size:
+                    # skip past records overwritten while we were sending
+                    sequence = max(sequence, self.history.oldest())
+                    # records are copied out whole before being sent so one
+                    # that's overwritten part way through stays consistent
+                    if not self.history.copy_into(sequence, record):
+                        break
+                    sequence += 1
+                    position = 0
+                count = min(size - filled, record_size - position)
+                chunk[filled:filled + count] = record[position:position + count]
+                filled += count
+                position += count
+            if filled == 0:
+                return
+            await self._notify(connection, chunk[:filled])
+
+    async def _notify(self, connection, data):
+        while connection.is_connected():
+            try:
+                self.notify(connection, data)
+                await asyncio.sleep_ms(0)
+                return
+            except OSError:
+                await asyncio.sleep_ms(self.RETRY_MS)
+
+
+class EnviroBeacon:
+    # advertising payload for beacon mode, carrying the latest readings in the
+    # Environmental Sensing service data so they can be collected with a
+    # passive scan and no connection, see schema.pack_beacon_into
+    #
+    # the name and service list go in the scan response to leave room
+    def __init__(self, model, name, appearance=0):
+        self.model = model
+        self.sequence = 0
+        payload = 1 + schema.record_size(model, schema.COMPACT_RECORDS)
+        self.adv_data = bytearray(3 + 4 + payload)
+        if len(self.adv_data) > 31:
+            raise ValueError(f"{model} readings are too big to advertise")
+        # flags: general discoverable, BR/EDR not supported
+        struct.pack_into("<BBB", self.adv_data, 0, 2, 0x01, 0x06)
+        struct.pack_into("<BBH", self.adv_data, 3, 3 + payload, 0x16, schema.BEACON_UUID)
+        self._payload = memoryview(self.adv_data)[7:]
+
+        name = name.encode()
+        self.resp_data = struct.pack("<BB", len(name) + 1, 0x09) + name
+        self.resp_data += struct.pack("<BBH", 3, 0x03, schema.BEACON_UUID)
+        self.resp_data += struct.pack("<BBH", 3, 0x19, appearance)
+
+    def update_from_dict(self, readings):
+        self.sequence = self.sequence % 255 + 1
+        schema.pack_beacon_into(self.model, self._payload, self.sequence, readings)
@@ -0,0 +1,109 @@
+import struct
+import time
+import machine
+from array import array
+from machine import Pin
+
+# edges older than this are discarded when the counter is next queried
+MAX_AGE_MS = 60 * 60 * 1000
+
+# the running count of edges wraps here, keeping it a small int so that
+# counting doesn't allocate in the irq handler. small ints go up to 2**30 - 1,
+# so the count is one bit narrower than that to leave room for the count + 1
+# that's made before the mask is applied
+COUNT_MASK = 0x1FFFFFFF
+
+
+# counts edges on an input pin from its irq handler, recording the time of
+# each edge in a preallocated ring buffer so the pulse frequency over any
+# recent window can be worked out at any time without polling the pin
+#
+# several counters run side by side, so every channel is being measured all
+# of the time rather than one after another
+class EdgeCounter:
+    def __init__(self, pin, size=128, trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING):
+        self._pin = pin
+        self._size = size
+        self._ticks = array("L", [0] * size)
+        self._head = 0
+        self._stored = 0
+        self.count = 0
+        pin.irq(handler=self._irq, trigger=trigger, hard=True)
+
+    # runs in hard irq context so must not allocate
+    def _irq(self, pin):
+        self._ticks[self._head] = time.ticks_ms()
+        self._head = (self._head + 1) % self._size
+        if self._stored < self._size:
+            self._stored += 1
+        self.count = (self.count + 1) & COUNT_MASK
+
+    # returns the number of edges seen in the last window_ms along with the
+    # time in ms between the first and last of them
+    def edges(self, window_ms):
+        state = machine.disable_irq()
+        head = self._head
+        stored = self._stored
+        machine.enable_irq(state)
+
+        now = time.ticks_ms()
+        count = 0
+        first = last = 0
+        index = head
+        while count < stored:
+            index = (index - 1) % self._size
+            age = time.ticks_diff(now, self._ticks[index])
+            if age < 0 or age > window_ms:
+                break
+            if count == 0:
+                last = self._ticks[index]
+            first = self._ticks[index]
+            count += 1
+
+        # forget edges that are too old to ask about, which stops them looking
+        # recent again once the tick counter wraps
+        dropped = 0
+        while count + dropped < stored:
+            oldest = self._ticks[(head - stored + dropped) % self._size]
+            age = time.ticks_diff(now, oldest)
+            if 0 <= age <= MAX_AGE_MS:
+                break
+            dropped += 1
+        if dropped:
+            state = machine.disable_irq()
+            self._stored -= dropped
+            machine.enable_irq(state)
+
+        return count, time.ticks_diff(last, first)
+
+    # average time in ms between edges over the last window_ms, or None if
+    # there weren't enough edges to tell
+    def interval_ms(self, window_ms):
+        count, span = self.edges(window_ms)
+        if count < 2 or span == 0:
+            return None
+        return span / (count - 1)
+
+    # edges per second over the last window_ms
+    def frequency(self, window_ms):
+        interval = self.interval_ms(window_ms)
+        if interval is None:
+            return 0
+        return 1000 / interval
+
+    # copy the times of the edges after the count'th into buffer as uint32s,
+    # oldest first. returns the count to pass next time and how many times
+    # were copied, edges that are no longer held are skipped
+    def copy_since(self, count, buffer):
+        state = machine.disable_irq()
+        head = self._head
+        stored = self._stored
+        total = self.count
+        machine.enable_irq(state)
+
+        new = min((total - count) & COUNT_MASK, stored)
+        copied = min(new, len(buffer) // 4)
+        start = head - new
+        for i in range(copied):
+            struct.pack_into("<L", buffer, i * 4, self._ticks[(start + i) % self._size])
+        return (total - new + copied) & COUNT_MASK, copied
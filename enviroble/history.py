@@ -0,0 +1,98 @@
+import struct
+import time
+import enviroble.helpers as helpers
+import enviroble.schema as schema
+
+# the flash copy is a small header followed by every slot of the ring
+_MAGIC = b"HIST"
+_HEADER = "<4sHHI"
+_HEADER_SIZE = struct.calcsize(_HEADER)
+
+
+# the board's most recent readings, kept as fixed width records in one
+# preallocated ring so a central that's been away can catch up on what it
+# missed, see schema.HISTORY_UUID for the record layout
+#
+# records are numbered from 1 and the numbers carry on for the life of the
+# history, so a central only needs to remember the last one it saw. with a
+# filename every record is also written to flash, costing one slot write plus
+# a header update, so the history survives resets and low power mode
+class History:
+    def __init__(self, model, capacity=1440, filename=None):
+        self.model = model
+        self.capacity = capacity
+        self.record_size = schema.history_record_size(model)
+        self.newest = 0
+        self.last_time = None
+        self._header_size = struct.calcsize(schema.HISTORY_HEADER)
+        self._buffer = bytearray(capacity * self.record_size)
+        self._view = memoryview(self._buffer)
+        self._filename = filename
+        if filename is not None:
+            self._load()
+
+    def _load(self):
+        if helpers.file_size(self._filename) != _HEADER_SIZE + len(self._buffer):
+            self._create()
+            return
+
+        with open(self._filename, "rb") as historyfile:
+            magic, capacity, record_size, newest = struct.unpack(_HEADER, historyfile.read(_HEADER_SIZE))
+            if magic != _MAGIC or capacity != self.capacity or record_size != self.record_size:
+                self._create()
+                return
+            historyfile.readinto(self._buffer)
+        self.newest = newest
+        if newest:
+            self.last_time = struct.unpack_from(schema.HISTORY_HEADER, self._buffer, self._slot(newest))[1]
+
+    def _create(self):
+        with open(self._filename, "wb") as historyfile:
+            historyfile.write(struct.pack(_HEADER, _MAGIC, self.capacity, self.record_size, 0))
+            historyfile.write(self._buffer)
+
+    def _slot(self, sequence):
+        return ((sequence - 1) % self.capacity) * self.record_size
+
+    # sequence number of the oldest record still held, 0 if there are none
+    def oldest(self):
+        if self.newest == 0:
+            return 0
+        return max(1, self.newest - self.capacity + 1)
+
+    # whether it's been at least interval seconds since the newest record
+    def due(self, interval, now=None):
+        if self.last_time is None:
+            return True
+        if now is None:
+            now = time.time()
+        # the clock may have been set backwards, don't wait for it to catch up
+        return not 0 <= now - self.last_time < interval
+
+    def append(self, readings, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        sequence = self.newest + 1
+        offset = self._slot(sequence)
+        record = self._view[offset:offset + self.record_size]
+        struct.pack_into(schema.HISTORY_HEADER, record, 0, sequence, timestamp)
+        schema.pack_record_into(self.model, record[self._header_size:], readings, schema.COMPACT_RECORDS)
+        self.newest = sequence
+        self.last_time = timestamp
+
+        if self._filename is not None:
+            with open(self._filename, "r+b") as historyfile:
+                historyfile.seek(_HEADER_SIZE + offset)
+                historyfile.write(record)
+                historyfile.seek(0)
+                historyfile.write(struct.pack(_HEADER, _MAGIC, self.capacity, self.record_size, sequence))
+        return sequence
+
+    # copy record sequence into buffer, which must be record_size bytes, and
+    # return True, or False if it's no longer held
+    def copy_into(self, sequence, buffer):
+        if sequence < self.oldest() or sequence > self.newest:
+            return False
+        offset = self._slot(sequence)
+        buffer[:] = self._view[offset:offset + self.record_size]
+        return True
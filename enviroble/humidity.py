@@ -0,0 +1,89 @@
+from array import array
+import enviroble.helpers as helpers
+
+# the saturation vapour pressure is kept as a table with a step per degree
+# across the temperature sensors' working range and interpolated between
+# steps, which is within 0.06% of helpers.get_saturation_vapor_pressure()
+# above freezing and 0.12% at -40, without its exp() and fractional powers.
+# it's filled in when it's first used, temperatures outside the range use
+# the closed form
+SVP_MINIMUM_C = -40
+SVP_MAXIMUM_C = 85
+_svp_table = None
+
+
+def _table():
+    global _svp_table
+    if _svp_table is None:
+        _svp_table = array("f", [
+            helpers.get_saturation_vapor_pressure(helpers.celcius_to_kelvin(t))
+            for t in range(SVP_MINIMUM_C, SVP_MAXIMUM_C + 1)
+        ])
+    return _svp_table
+
+
+# the pressure of water vapour in saturated air at temperature_in_c, in Pa
+def saturation_vapor_pressure(temperature_in_c):
+    table = _table()
+    position = temperature_in_c - SVP_MINIMUM_C
+    index = int(position)
+    if position < 0 or index >= len(table) - 1:
+        if temperature_in_c == SVP_MAXIMUM_C:
+            return table[-1]
+        return helpers.get_saturation_vapor_pressure(helpers.celcius_to_kelvin(temperature_in_c))
+    low = table[index]
+    return low + (table[index + 1] - low) * (position - index)
+
+
+# the temperature at which air at temperature_in_c and relative_humidity
+# would be saturated, found by searching the table rather than inverting the
+# closed form. never lower than SVP_MINIMUM_C
+def dew_point(temperature_in_c, relative_humidity):
+    table = _table()
+    pressure = saturation_vapor_pressure(temperature_in_c) * relative_humidity / 100
+    if pressure <= table[0]:
+        return SVP_MINIMUM_C
+    if pressure >= table[-1]:
+        return SVP_MAXIMUM_C
+    low = 0
+    high = len(table) - 1
+    while high - low > 1:
+        middle = (low + high) >> 1
+        if table[middle] <= pressure:
+            low = middle
+        else:
+            high = middle
+    return SVP_MINIMUM_C + low + (pressure - table[low]) / (table[high] - table[low])
+
+
+# the relative humidity the same air would have at adjusted_temperature_in_c,
+# which is what helpers.relative_to_absolute_humidity() followed by
+# helpers.absolute_to_relative_humidity() works out, with the gas constant
+# cancelled out
+def adjust_relative_humidity(relative_humidity, temperature_in_c, adjusted_temperature_in_c):
+    humidity = (relative_humidity * saturation_vapor_pressure(temperature_in_c) /
+                saturation_vapor_pressure(adjusted_temperature_in_c) *
+                helpers.celcius_to_kelvin(adjusted_temperature_in_c) / helpers.celcius_to_kelvin(temperature_in_c))
+    return min(100, max(0, humidity))
+
+
+# wraps a source's reader, see enviroble.scheduler, to add a dew point to its
+# temperature and humidity. on usb power the board warms itself up, so when
+# usb_power() says it's plugged in and there's an offset the temperature is
+# lowered by offset_c first and the humidity adjusted to match
+def compensated(reader, offset_c=None, usb_power=None):
+    async def read(seconds_since_last):
+        readings = await reader(seconds_since_last)
+        temperature = readings.get("temperature")
+        humidity = readings.get("humidity")
+        if temperature is None or humidity is None:
+            return readings
+        if offset_c and usb_power is not None and usb_power():
+            adjusted_temperature = temperature - offset_c
+            humidity = adjust_relative_humidity(humidity, temperature, adjusted_temperature)
+            temperature = adjusted_temperature
+            readings["temperature"] = round(temperature, 2)
+            readings["humidity"] = round(humidity, 2)
+        readings["dew_point"] = round(dew_point(temperature, humidity), 2)
+        return readings
+    return read
@@ -0,0 +1,133 @@
+import math
+import struct
+import time
+
+# the baseline is kept in flash as a magic number, the baseline and how many
+# seconds of samples have gone into it
+_MAGIC = b"IAQ1"
+_FILE_FORMAT = "<4sfI"
+
+# the gas sensor's heater takes a while to settle after power up, its
+# readings until then don't count towards the baseline's history
+RUN_IN_S = 5 * 60
+
+# gas resistance falls as the humidity rises, by about 4% per % of relative
+# humidity, so readings are brought to what they'd be at 40% before they're
+# compared with the baseline
+# https://forums.pimoroni.com/t/bme680-observed-gas-ohms-readings/6608/25
+HUMIDITY_SLOPE = 0.04
+HUMIDITY_REFERENCE = 40
+
+# the baseline is the resistance of the cleanest air seen lately. it rises to
+# cleaner air within minutes, but falls over a day, so a stuffy afternoon
+# doesn't become the new normal while the sensor's slow drift is still
+# followed
+BASELINE_RISE_S = 10 * 60
+BASELINE_FALL_S = 24 * 60 * 60
+
+# readings are smoothed over about this long so the index doesn't jump about
+SMOOTHING_S = 60
+
+# the index is 25 at the baseline and rises by IAQ_PER_LOG as the resistance
+# falls to 1/e (37%) of it, up to 500
+IAQ_PER_LOG = 180
+IAQ_MAXIMUM = 500
+
+# how much to trust the index: running in, a baseline from less than an hour
+# of samples, from less than a day, and from a day or more
+ACCURACY_RUNNING_IN = 0
+ACCURACY_LOW = 1
+ACCURACY_MEDIUM = 2
+ACCURACY_HIGH = 3
+_ACCURACY_SECONDS = (60 * 60, 24 * 60 * 60)
+
+
+# an indoor air quality index from a metal oxide gas sensor, relative to a
+# baseline of clean air that's learnt as it goes. everything is running
+# values, so it takes the same memory however long it runs, and the baseline
+# is saved to filename every save_interval_s so that a reset doesn't have to
+# learn it all over again
+#
+# readings should be added as they're taken with the seconds since the last
+# one, the baseline moves at the same rate however often that is
+class IAQ:
+    def __init__(self, filename=None, save_interval_s=60 * 60):
+        self._filename = filename
+        self.save_interval_s = save_interval_s
+        self.baseline = None
+        self.history_s = 0
+        self._filtered = None
+        self._started = time.ticks_ms()
+        self._unsaved_s = 0
+        self._load()
+
+    def _load(self):
+        if self._filename is None:
+            return
+        size = struct.calcsize(_FILE_FORMAT)
+        try:
+            with open(self._filename, "rb") as f:
+                data = f.read(size)
+        except OSError:
+            return
+        if len(data) != size:
+            return
+        magic, baseline, history_s = struct.unpack(_FILE_FORMAT, data)
+        # nan never equals itself
+        if magic == _MAGIC and baseline == baseline:
+            self.baseline = baseline
+            self.history_s = history_s
+
+    def save(self):
+        self._unsaved_s = 0
+        if self._filename is None or self.baseline is None:
+            return
+        try:
+            with open(self._filename, "wb") as f:
+                f.write(struct.pack(_FILE_FORMAT, _MAGIC, self.baseline, self.history_s))
+        except OSError:
+            pass
+
+    def running_in(self):
+        return time.ticks_diff(time.ticks_ms(), self._started) < RUN_IN_S * 1000
+
+    def accuracy(self):
+        if self.baseline is None or self.running_in():
+            return ACCURACY_RUNNING_IN
+        if self.history_s < _ACCURACY_SECONDS[0]:
+            return ACCURACY_LOW
+        if self.history_s < _ACCURACY_SECONDS[1]:
+            return ACCURACY_MEDIUM
+        return ACCURACY_HIGH
+
+    # add a reading, returning the index
+    def add(self, gas_resistance, humidity, seconds):
+        value = math.log(max(1, gas_resistance)) + HUMIDITY_SLOPE * (humidity - HUMIDITY_REFERENCE)
+        seconds = max(0, seconds)
+
+        if self._filtered is None:
+            self._filtered = value
+        else:
+            self._filtered += (value - self._filtered) * seconds / (SMOOTHING_S + seconds)
+        value = self._filtered
+
+        if self.baseline is None:
+            self.baseline = value
+        else:
+            window_s = BASELINE_RISE_S if value > self.baseline else BASELINE_FALL_S
+            self.baseline += (value - self.baseline) * seconds / (window_s + seconds)
+
+        if not self.running_in():
+            self.history_s = min(self.history_s + int(seconds), 0xFFFFFFFF)
+            self._unsaved_s += seconds
+            if self._unsaved_s >= self.save_interval_s:
+                self.save()
+
+        return self.index()
+
+    # 0 for the cleanest air to 500 for the worst, 25 at the baseline
+    def index(self):
+        if self.baseline is None:
+            return None
+        index = 25 + (self.baseline - self._filtered) * IAQ_PER_LOG
+        return max(0, min(IAQ_MAXIMUM, index))
@@ -0,0 +1,116 @@
+import struct
+import uasyncio as asyncio
+from array import array
+
+# a frame from the sensor: the start characters "BM" and the length of the
+# rest of the frame, then pm1, pm2.5 and pm10 in ug/m3 as the factory
+# calibrated them and again for atmospheric conditions, the particles larger
+# than 0.3, 0.5, 1, 2.5, 5 and 10um in each 0.1 litre of air, a version and
+# error code and a checksum of every byte before it
+FRAME_FORMAT = ">BBH12HBBH"
+FRAME_SIZE = 32
+_START = (0x42, 0x4D)
+_LENGTH = 28
+
+# the readings each frame carries, in order. the counts are per litre
+READINGS = (
+    "pm1", "pm2_5", "pm10",
+    "pm1_atmospheric", "pm2_5_atmospheric", "pm10_atmospheric",
+    "pm0_3_per_litre", "pm0_5_per_litre", "pm1_per_litre",
+    "pm2_5_per_litre", "pm5_per_litre", "pm10_per_litre"
+)
+_CONCENTRATIONS = 6
+
+# the sensor has a new frame about every second
+FRAME_INTERVAL_MS = 1000
+
+# how long the fan runs before frames are taken, the datasheet asks for 30
+# seconds before the readings are fully settled
+WARM_UP_MS = 5000
+
+# frames averaged for each reading when the sensor is duty cycled
+FRAMES = 5
+
+
+# a plantower particulate sensor on an I2CDevice, see enviroble.bus. each
+# reading averages the frames it's made of, and frames that don't check out
+# are dropped and counted in errors
+#
+# duty cycled, the sensor is powered up for each reading with power(True),
+# left to warm up for warm_up_ms and then frames frames are read a
+# frame_interval_ms apart before it's powered down again. continuous, it's
+# powered up once and a task reads every frame, each reading averaging those
+# since the last. the first waits for it to warm up the same way
+#
+# frames are read into frame, a FRAME_SIZE bytearray, every time
+class PMS5003:
+    def __init__(self, device, frame, power, continuous=False, warm_up_ms=WARM_UP_MS, frames=FRAMES,
+                 frame_interval_ms=FRAME_INTERVAL_MS):
+        self._device = device
+        self._frame = frame
+        self._checked = memoryview(frame)[:FRAME_SIZE - 2]
+        self._power = power
+        self.continuous = continuous
+        self.warm_up_ms = warm_up_ms
+        self.frames = frames
+        self.frame_interval_ms = frame_interval_ms
+        self._totals = array("I", [0] * len(READINGS))
+        self._count = 0
+        self._task = None
+        self.errors = 0
+
+    # read a frame, adding it to the totals if it's whole
+    async def _read_frame(self):
+        try:
+            await self._device.read_into(0x00, self._frame)
+        except OSError:
+            self.errors += 1
+            return
+        values = struct.unpack_from(FRAME_FORMAT, self._frame)
+        if (values[0] != _START[0] or values[1] != _START[1] or values[2] != _LENGTH
+                or values[-1] != sum(self._checked)):
+            self.errors += 1
+            return
+        totals = self._totals
+        for i in range(len(totals)):
+            totals[i] += values[3 + i]
+        self._count += 1
+
+    async def _run(self):
+        self._power(True)
+        await asyncio.sleep_ms(self.warm_up_ms)
+        while True:
+            await self._read_frame()
+            await asyncio.sleep_ms(self.frame_interval_ms)
+
+    # the average of the frames since the last reading, nothing if there
+    # weren't any good ones
+    def _average(self):
+        count = self._count
+        readings = {}
+        if count:
+            totals = self._totals
+            for i in range(len(totals)):
+                if i < _CONCENTRATIONS:
+                    readings[READINGS[i]] = round(totals[i] / count, 1)
+                else:
+                    readings[READINGS[i]] = round(totals[i] * 10 / count)
+                totals[i] = 0
+        self._count = 0
+        return readings
+
+    async def read(self):
+        if not self.continuous:
+            self._power(True)
+            try:
+                await asyncio.sleep_ms(self.warm_up_ms)
+                for i in range(self.frames):
+                    if i:
+                        await asyncio.sleep_ms(self.frame_interval_ms)
+                    await self._read_frame()
+            finally:
+                self._power(False)
+        elif self._task is None:
+            self._task = asyncio.create_task(self._run())
+            await asyncio.sleep_ms(self.warm_up_ms + self.frames * self.frame_interval_ms)
+        return self._average()
@@ -0,0 +1,216 @@
+import time
+
+# power management for low power mode, plus an energy accounting model that
+# runs on the board or, with a SimulatedClock, on host Python to compare modes
+#
+#   from enviroble.power import compare_modes
+#   compare_modes()
+
+# rough current draw of an Enviro board in each state in mA, measure your own
+# board and adjust these for better estimates
+CURRENT_MA = {
+    "off": 0.005,    # VSYS released, only the RTC is running
+    "sleep": 1.5,    # lightsleep
+    "idle": 20.0,    # awake and waiting on the event loop
+    "cpu": 28.0      # awake and busy
+}
+# extra draw while the radio is advertising or connected
+RADIO_MA = 12.0
+
+
+class SimulatedClock:
+    def __init__(self):
+        self.now = 0
+
+    def ticks_ms(self):
+        return self.now
+
+    def ticks_diff(self, a, b):
+        return a - b
+
+    def advance(self, ms):
+        self.now += ms
+
+
+# keeps track of how long is spent in each state, how often the cpu wakes up
+# and how long the radio is on, and works out the cost of each reading
+class EnergyMeter:
+    def __init__(self, clock=None):
+        self.clock = clock or time
+        self.state = "cpu"
+        self.radio_on = False
+        self.state_ms = {state: 0 for state in CURRENT_MA}
+        self.radio_ms = 0
+        # starting up counts as waking up
+        self.wakeups = 1
+        self.readings = 0
+        self._since = self.clock.ticks_ms()
+
+    def _update(self):
+        now = self.clock.ticks_ms()
+        elapsed = self.clock.ticks_diff(now, self._since)
+        self.state_ms[self.state] += elapsed
+        if self.radio_on:
+            self.radio_ms += elapsed
+        self._since = now
+
+    def enter(self, state):
+        self._update()
+        if state == "cpu" and self.state != "cpu":
+            self.wakeups += 1
+        self.state = state
+
+    def radio(self, on):
+        self._update()
+        self.radio_on = on
+
+    def reading(self):
+        self.readings += 1
+
+    def report(self):
+        self._update()
+        readings = max(1, self.readings)
+        total_ms = sum(self.state_ms.values())
+        charge = sum(CURRENT_MA[state] * ms for state, ms in self.state_ms.items())
+        charge += RADIO_MA * self.radio_ms
+        return {
+            "readings": self.readings,
+            "wakeups_per_reading": self.wakeups / readings,
+            "radio_ms_per_reading": self.radio_ms / readings,
+            "cpu_ms_per_reading": self.state_ms["cpu"] / readings,
+            "mah_per_reading": charge / 3_600_000 / readings,
+            "average_ma": charge / total_ms if total_ms else 0
+        }
+
+
+# model a day of running in the given mode on a simulated clock
+#
+# "always-on" is the default firmware: always advertising, blinking the
+# activity led every second and sampling on the scheduler's periods, plus the
+# led pulse timer every pulse_ms when that's set. "low-power" wakes every
+# period_ms, samples, advertises for advertise_ms and powers off (or
+# lightsleeps when on usb power)
+def simulate(mode, period_ms=60 * 1000, hours=24, sample_cpu_ms=30, sample_wait_ms=100,
+             advertise_ms=5000, boot_ms=1500, timer_cpu_ms=1, pulse_ms=None, usb_power=False):
+    clock = SimulatedClock()
+    meter = EnergyMeter(clock)
+    end = hours * 60 * 60 * 1000
+
+    if mode == "always-on":
+        meter.radio(True)
+        periods = {"sample": period_ms, "blink": 1000}
+        if pulse_ms:
+            periods["pulse"] = pulse_ms
+        due = {name: 0 for name in periods}
+        while clock.now < end:
+            meter.enter("cpu")
+            for name, period in periods.items():
+                if due[name] > clock.now:
+                    continue
+                due[name] += period
+                if name == "sample":
+                    clock.advance(sample_cpu_ms)
+                    meter.enter("idle")
+                    clock.advance(sample_wait_ms)
+                    meter.enter("cpu")
+                    meter.reading()
+                else:
+                    clock.advance(timer_cpu_ms)
+            meter.enter("idle")
+            clock.advance(max(0, min(due.values()) - clock.now))
+
+    elif mode == "low-power":
+        while clock.now < end:
+            start = clock.now
+            meter.enter("cpu")
+            clock.advance(boot_ms + sample_cpu_ms)
+            meter.enter("idle")
+            clock.advance(sample_wait_ms)
+            meter.reading()
+            meter.radio(True)
+            clock.advance(advertise_ms)
+            meter.radio(False)
+            meter.enter("sleep" if usb_power else "off")
+            clock.advance(max(0, period_ms - (clock.now - start)))
+
+    else:
+        raise ValueError(f"unknown mode {mode}")
+
+    return meter.report()
+
+
+def compare_modes(**kwargs):
+    for mode in ("always-on", "low-power"):
+        report = simulate(mode, **kwargs)
+        print(f"{mode:>10}: {report['wakeups_per_reading']:8.1f} wakeups, "
+              f"{report['radio_ms_per_reading']:8.0f}ms radio, "
+              f"{report['cpu_ms_per_reading']:6.0f}ms cpu, "
+              f"{report['mah_per_reading']:.4f}mAh per reading, "
+              f"{report['average_ma']:.3f}mA average")
+
+
+# on the board
+# ===========================================================================
+def _rtc():
+    from pcf85063a import PCF85063A
+    from enviroble import i2c
+    return PCF85063A(i2c)
+
+
+# call early at boot: sets the system clock from the battery backed rtc, so
+# timestamps carry on across power cycles, clears any wake alarm and returns
+# the reason the board woke up
+def startup():
+    import machine
+    import wakeup
+    from enviroble import constants, vbus_present
+
+    state = wakeup.get_gpio_state()
+    if state & (1 << constants.BUTTON_PIN):
+        reason = constants.WAKE_REASON_BUTTON_PRESS
+    elif state & (1 << constants.RTC_ALARM_PIN):
+        reason = constants.WAKE_REASON_RTC_ALARM
+    elif state & (1 << constants.RAIN_PIN):
+        reason = constants.WAKE_REASON_RAIN_TRIGGER
+    elif vbus_present():
+        reason = constants.WAKE_REASON_USB_POWERED
+    else:
+        reason = constants.WAKE_REASON_UNKNOWN
+
+    rtc = _rtc()
+    rtc.enable_timer_interrupt(False)
+    rtc.clear_timer_flag()
+    rtc.clear_alarm_flag()
+
+    year, month, day, hour, minute, second, weekday = rtc.datetime()
+    machine.RTC().datetime((year, month, day, weekday, hour, minute, second, 0))
+    return reason
+
+
+# sleep for duration_ms and start afresh, never returns
+#
+# on battery power releasing VSYS_EN turns the whole board off until the rtc
+# timer turns it back on. on usb power that can't happen so lightsleep instead
+def sleep(duration_ms):
+    import machine
+    import bluetooth
+    from pcf85063a import PCF85063A
+    from enviroble import hold_vsys_en_pin, stop_activity_led
+
+    seconds = max(1, duration_ms // 1000)
+    rtc = _rtc()
+    rtc.clear_timer_flag()
+    if seconds <= 255:
+        rtc.set_timer(seconds, PCF85063A.TIMER_TICK_1HZ)
+    else:
+        rtc.set_timer(min(255, seconds // 60), PCF85063A.TIMER_TICK_1_OVER_60HZ)
+    rtc.enable_timer_interrupt(True)
+
+    stop_activity_led()
+    hold_vsys_en_pin.init(machine.Pin.IN)
+    time.sleep_ms(100)
+
+    # still running, so we must be on usb power
+    bluetooth.BLE().active(False)
+    machine.lightsleep(duration_ms)
+    machine.reset()
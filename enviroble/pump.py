@@ -0,0 +1,48 @@
+import uasyncio as asyncio
+from machine import Timer
+
+# no pump is ever left on for longer than this, however it was switched on
+MAX_ON_MS = 5000
+
+
+# a pump on an output pin that can't be left running. every time it's
+# switched on a one shot timer is armed to switch it off again after
+# max_on_ms, so it stops even if whatever switched it on never gets round to
+# switching it off, or the event loop stalls
+#
+# it has the same on(), off() and value() as a Pin so it can stand in for
+# one, and dose() runs it for a while without holding anything else up.
+# several pumps run side by side
+class Pump:
+    def __init__(self, pin, max_on_ms=MAX_ON_MS):
+        self._pin = pin
+        self.max_on_ms = max_on_ms
+        self._timer = Timer(-1)
+        self._cutoff = self._cutoff_irq
+        pin.value(0)
+
+    # runs in irq context, just stops the pump
+    def _cutoff_irq(self, timer):
+        self._pin.value(0)
+
+    def on(self):
+        self._pin.value(1)
+        self._timer.init(mode=Timer.ONE_SHOT, period=self.max_on_ms, callback=self._cutoff)
+
+    def off(self):
+        self._pin.value(0)
+        self._timer.deinit()
+
+    def value(self):
+        return self._pin.value()
+
+    # run the pump for duration_ms, cut short at max_on_ms
+    async def dose(self, duration_ms):
+        duration_ms = min(duration_ms, self.max_on_ms)
+        if duration_ms <= 0:
+            return
+        self.on()
+        try:
+            await asyncio.sleep_ms(duration_ms)
+        finally:
+            self.off()
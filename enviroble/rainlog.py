@@ -0,0 +1,94 @@
+import struct
+from array import array
+import enviroble.helpers as helpers
+
+# the log is a fixed size file holding a small header followed by a ring of
+# uint32 timestamps (seconds since the epoch), sized so that the whole file
+# fits in a single 4096 byte filesystem block
+_MAGIC = b"RAIN"
+_HEADER = "<4sI"
+_HEADER_SIZE = struct.calcsize(_HEADER)
+CAPACITY = (4096 - _HEADER_SIZE) // 4
+
+
+# append-only log of rain bucket tips that survives resets
+#
+# each tip costs a single 4 byte write plus a header update rather than a
+# rewrite of the whole log, and a copy of the timestamps is kept in ram so
+# that counting the tips in a window is a binary search
+class RainLog:
+    def __init__(self, filename="rain.bin", capacity=CAPACITY):
+        self._filename = filename
+        self._capacity = capacity
+        self._entries = array("I", [0] * capacity)
+        self._total = 0
+        self._load()
+
+    def _load(self):
+        if helpers.file_size(self._filename) != _HEADER_SIZE + self._capacity * 4:
+            self._create()
+            return
+
+        with open(self._filename, "rb") as logfile:
+            magic, total = struct.unpack(_HEADER, logfile.read(_HEADER_SIZE))
+            if magic != _MAGIC:
+                self._create()
+                return
+            logfile.readinto(self._entries)
+        self._total = total
+
+    def _create(self):
+        self._total = 0
+        for i in range(self._capacity):
+            self._entries[i] = 0
+        with open(self._filename, "wb") as logfile:
+            logfile.write(struct.pack(_HEADER, _MAGIC, 0))
+            logfile.write(self._entries)
+
+    def __len__(self):
+        return min(self._total, self._capacity)
+
+    # entry n in time order, oldest first
+    def _entry(self, n):
+        start = self._total - len(self)
+        return self._entries[(start + n) % self._capacity]
+
+    def last(self):
+        return self._entry(len(self) - 1) if self._total else None
+
+    def append(self, timestamp):
+        # the clock has gone backwards, because the rtc lost its backup or
+        # wasn't set after a reset. the tips logged so far can't be placed
+        # against it any more and would all count as recent, so the log starts
+        # again. it also has to stay in order for the binary search
+        last = self.last()
+        if last is not None and timestamp < last:
+            self._create()
+
+        index = self._total % self._capacity
+        self._entries[index] = timestamp
+        self._total += 1
+
+        with open(self._filename, "r+b") as logfile:
+            logfile.seek(_HEADER_SIZE + index * 4)
+            logfile.write(struct.pack("<I", timestamp))
+            logfile.seek(0)
+            logfile.write(struct.pack(_HEADER, _MAGIC, self._total))
+
+    # the position of the first tip logged after timestamp
+    def _after(self, timestamp):
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle) <= timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # number of tips logged strictly after the given timestamp and no later
+    # than now, tips stamped after now were logged before the clock went back
+    # and don't count
+    def count_since(self, timestamp, now=None):
+        end = len(self) if now is None else self._after(now)
+        return max(0, end - self._after(timestamp))
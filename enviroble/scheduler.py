@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict
+
+# readings due within this long of a tick are taken early so that their
+# hardware reads are shared with that tick rather than needing another wakeup
+COALESCE_MS = 1000
+
+
+# boards describe their hardware as sources, each one an async reader that
+# takes the seconds since it was last read and returns a dict of readings,
+# along with the names of the readings it provides:
+#
+#   SOURCES = {"bme280": (read_bme280, ("temperature", "humidity", "pressure"))}
+#
+# read every source in turn and return all of their readings
+async def read_sources(sources, seconds_since_last):
+    readings = OrderedDict()
+    for reader, names in sources.values():
+        readings.update(await reader(seconds_since_last))
+    return readings
+
+
+# samples each reading on its own period, reading each source at most once per
+# tick however many of its readings are due
+class Scheduler:
+    def __init__(self, sources, periods_ms=None, default_period_ms=60 * 1000):
+        periods_ms = periods_ms or {}
+        self.sources = sources
+        self.readings = OrderedDict()
+        self.periods_ms = {}
+        self._source = {}
+        self._due = {}
+        self._last_read = {}
+
+        now = time.ticks_ms()
+        for source, (reader, names) in sources.items():
+            self._last_read[source] = None
+            for name in names:
+                self._source[name] = source
+                self.periods_ms[name] = periods_ms.get(name, default_period_ms)
+                self._due[name] = now
+
+        self._started = now
+        self.busy_ms = 0
+        self.ticks = 0
+
+    # read the sources with readings that are due, returning the names of the
+    # sources that were read
+    async def tick(self):
+        now = time.ticks_ms()
+        sources = set()
+        for name, due in self._due.items():
+            if time.ticks_diff(due, now) <= COALESCE_MS:
+                sources.add(self._source[name])
+
+        start = time.ticks_ms()
+        for source, (reader, names) in self.sources.items():
+            if source not in sources:
+                continue
+            last_read = self._last_read[source]
+            seconds_since_last = 0 if last_read is None else time.ticks_diff(start, last_read) / 1000
+            self._last_read[source] = time.ticks_ms()
+            self.readings.update(await reader(seconds_since_last))
+
+            # every reading from the source is fresh now, so they all restart
+            # their periods even if they weren't due yet
+            for name in names:
+                self._due[name] = time.ticks_add(self._last_read[source], self.periods_ms[name])
+
+        self.busy_ms += time.ticks_diff(time.ticks_ms(), start)
+        self.ticks += 1
+        return sources
+
+    # how long until the next reading is due
+    def next_due_ms(self):
+        now = time.ticks_ms()
+        return max(0, min(time.ticks_diff(due, now) for due in self._due.values()))
+
+    # the fraction of time spent reading sources since the scheduler started
+    def duty_cycle(self):
+        elapsed = time.ticks_diff(time.ticks_ms(), self._started)
+        return self.busy_ms / elapsed if elapsed > 0 else 0
@@ -0,0 +1,445 @@
+import struct
+import sys
+from enviroble import constants
+
+# how each reading is encoded over BLE, shared by the firmware and by client
+# code running under CPython so the two can't drift apart
+#
+# name: (property, uuid, format, size, scale, minimum, maximum)
+#
+# property   the key of the value in the board's readings
+# uuid       16-bit characteristic UUID, a custom 128-bit UUID string for
+#            readings with no standard characteristic, or None if it's only
+#            sent as part of a packed record
+# format     little-endian struct format of the encoded value
+# size       bytes sent in the characteristic value, less than the format's
+#            size for the uint24 characteristics
+# scale      the reading is multiplied by this and rounded when encoded
+# minimum    readings are clamped to minimum...maximum before encoding
+# maximum
+FIELDS = {
+    # org.bluetooth.characteristic.temperature - sint16, 0.01 degrees C
+    "temperature": ("temperature", 0x2A6E, "<h", 2, 100, -273.15, 327.67),
+    # org.bluetooth.characteristic.humidity - uint16, 0.01 %
+    "humidity": ("humidity", 0x2A6F, "<H", 2, 100, 0, 100),
+    # org.bluetooth.characteristic.dew_point - sint8, degrees C
+    "dew_point": ("dew_point", 0x2A7B, "<b", 1, 1, -128, 127),
+    # org.bluetooth.characteristic.pressure - uint32, 0.1 Pa (readings are hPa)
+    "pressure": ("pressure", 0x2A6D, "<I", 4, 1000, 0, 4294967.295),
+    # org.bluetooth.characteristic.illuminance - uint24, 0.01 lux
+    "luminance": ("luminance", 0x2AFB, "<I", 3, 100, 0, 167772.15),
+    # org.bluetooth.characteristic.correlated_color_temperature - uint16, kelvin
+    "color_temperature": ("color_temperature", 0x2AE9, "<H", 2, 1, 0, 65535),
+    # org.bluetooth.characteristic.true_wind_speed - uint16, 0.01 m/s
+    "wind_speed": ("wind_speed", 0x2A70, "<H", 2, 100, 0, 655.35),
+    # org.bluetooth.characteristic.true_wind_direction - uint16, 0.01 degrees
+    "wind_direction": ("wind_direction", 0x2A71, "<H", 2, 100, 0, 359.99),
+    # org.bluetooth.characteristic.gust_factor - uint8, 0.1
+    "gust_factor": ("gust_factor", 0x2A74, "<B", 1, 10, 0, 25.5),
+    # uint16, 0.01 m/s
+    "wind_gust": ("wind_gust", "0b6c0006-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<H", 2, 100, 0, 655.35),
+    # org.bluetooth.characteristic.rainfall - uint16, 1 mm
+    "rainfall": ("rain", 0x2A78, "<H", 2, 1, 0, 65535),
+    # rain since the last reading - uint16, 0.01 mm
+    "rain": ("rain", None, "<H", 2, 100, 0, 655.35),
+    # uint32, ohms
+    "gas_resistance": ("gas_resistance", None, "<I", 4, 1, 0, 4294967295),
+    # uint16, 0.1, an indoor air quality index from 0 to 500, see enviroble.iaq
+    "iaq": ("iaq", "0b6c0008-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<H", 2, 10, 0, 500),
+    # uint8, how far the air quality index can be trusted from 0 to 3
+    "iaq_accuracy": ("iaq_accuracy", "0b6c0009-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<B", 1, 1, 0, 3),
+    # uint16, 0.01 %
+    "moisture_a": ("moisture_a", None, "<H", 2, 100, 0, 100),
+    "moisture_b": ("moisture_b", None, "<H", 2, 100, 0, 100),
+    "moisture_c": ("moisture_c", None, "<H", 2, 100, 0, 100),
+    # uint16, 0.001 volts peak to peak
+    "noise": ("noise", None, "<H", 2, 1000, 0, 65.535),
+    # uint16, 0.0001 volts rms
+    "noise_rms": ("noise_rms", "0b6c0003-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<H", 2, 10000, 0, 6.5535),
+    # uint16, 0.001 volts from the mean
+    "noise_peak": ("noise_peak", "0b6c0004-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<H", 2, 1000, 0, 65.535),
+    # uint16, 0.1 dB(A), approximate
+    "noise_dba": ("noise_dba", "0b6c0005-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<H", 2, 10, 0, 6553.5),
+    # uint16, ug/m3 as the particulate sensor's factory calibrated them, see
+    # enviroble.pms5003
+    "pm1": ("pm1", "0b6c000a-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<H", 2, 1, 0, 65535),
+    "pm2_5": ("pm2_5", "0b6c000b-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<H", 2, 1, 0, 65535),
+    "pm10": ("pm10", "0b6c000c-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<H", 2, 1, 0, 65535),
+    # uint16, ug/m3 under atmospheric conditions
+    "pm1_atmospheric": ("pm1_atmospheric", "0b6c000d-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<H", 2, 1, 0, 65535),
+    "pm2_5_atmospheric": ("pm2_5_atmospheric", "0b6c000e-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<H", 2, 1, 0, 65535),
+    "pm10_atmospheric": ("pm10_atmospheric", "0b6c000f-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<H", 2, 1, 0, 65535),
+    # uint32, particles larger than each size in a litre of air
+    "pm0_3_per_litre": ("pm0_3_per_litre", "0b6c0010-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<I", 4, 1, 0, 4294967295),
+    "pm0_5_per_litre": ("pm0_5_per_litre", "0b6c0011-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<I", 4, 1, 0, 4294967295),
+    "pm1_per_litre": ("pm1_per_litre", "0b6c0012-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<I", 4, 1, 0, 4294967295),
+    "pm2_5_per_litre": ("pm2_5_per_litre", "0b6c0013-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<I", 4, 1, 0, 4294967295),
+    "pm5_per_litre": ("pm5_per_litre", "0b6c0014-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<I", 4, 1, 0, 4294967295),
+    "pm10_per_litre": ("pm10_per_litre", "0b6c0015-8f1e-4e3a-9a2c-5c7e2d1f4b60", "<I", 4, 1, 0, 4294967295)
+}
+
+# custom characteristic carrying every reading from the board in one value
+RECORD_UUID = "0b6c0001-8f1e-4e3a-9a2c-5c7e2d1f4b60"
+
+# packed record layouts for each model: a uint8 model id and a uint8 layout
+# version followed by these fields, bump the version whenever a layout changes.
+# these carry every reading the board has an encoding for and are sent in the
+# "all readings" characteristic
+RECORDS = {
+    "indoor": (constants.ENVIRO_INDOOR, 3, (
+        "temperature", "humidity", "pressure", "dew_point", "gas_resistance", "iaq",
+        "iaq_accuracy", "luminance", "color_temperature"
+    )),
+    "grow": (constants.ENVIRO_GROW, 2, (
+        "temperature", "humidity", "pressure", "dew_point", "luminance",
+        "moisture_a", "moisture_b", "moisture_c"
+    )),
+    "weather": (constants.ENVIRO_WEATHER, 3, (
+        "temperature", "humidity", "pressure", "dew_point", "luminance",
+        "wind_speed", "wind_direction", "rain", "wind_gust", "gust_factor"
+    )),
+    "urban": (constants.ENVIRO_URBAN, 2, (
+        "temperature", "humidity", "pressure", "dew_point", "noise",
+        "noise_rms", "noise_peak", "noise_dba",
+        "pm1", "pm2_5", "pm10", "pm1_atmospheric", "pm2_5_atmospheric", "pm10_atmospheric",
+        "pm0_3_per_litre", "pm0_5_per_litre", "pm1_per_litre", "pm2_5_per_litre",
+        "pm5_per_litre", "pm10_per_litre"
+    ))
+}
+
+# smaller layouts of each board's main readings, laid out the same way with
+# versions of their own. they fit in an advertisement, so they're what the
+# beacon sends, and they're what the history and stats are kept in so that a
+# day of history still fits in ram
+COMPACT_RECORDS = {
+    "indoor": (constants.ENVIRO_INDOOR, 2, (
+        "temperature", "humidity", "pressure", "gas_resistance", "iaq",
+        "luminance", "color_temperature"
+    )),
+    "grow": (constants.ENVIRO_GROW, 1, (
+        "temperature", "humidity", "pressure", "luminance",
+        "moisture_a", "moisture_b", "moisture_c"
+    )),
+    "weather": (constants.ENVIRO_WEATHER, 2, (
+        "temperature", "humidity", "pressure", "luminance",
+        "wind_speed", "wind_direction", "rain", "wind_gust"
+    )),
+    "urban": (constants.ENVIRO_URBAN, 1, (
+        "temperature", "humidity", "pressure", "noise",
+        "pm1", "pm2_5", "pm10"
+    ))
+}
+
+RECORD_HEADER = "<BB"
+
+# in beacon mode the advertising payload carries service data under the
+# Environmental Sensing UUID: a uint8 sequence number, which counts 1...255
+# with each new sample and is 0 until the first one, followed by the board's
+# compact record
+BEACON_UUID = 0x181A
+
+# org.bluetooth.descriptor.es_measurement, describing how a reading is
+# measured: uint16 flags, a uint8 sampling function, uint24 measurement
+# period and update interval in seconds, a uint8 application and a uint8
+# measurement uncertainty in 0.5% steps
+MEASUREMENT_UUID = 0x290C
+SAMPLING_UNSPECIFIED = 0x00
+SAMPLING_INSTANTANEOUS = 0x01
+SAMPLING_MEAN = 0x02
+SAMPLING_MAXIMUM = 0x04
+APPLICATION_AIR = 0x01
+UNCERTAINTY_UNKNOWN = 0xFF
+
+# custom characteristic for downloading the readings kept on the board, see
+# enviroble.history. reading it gives HISTORY_STATUS: the oldest and newest
+# sequence numbers held, the board's clock in seconds and the size of each
+# record. writing a uint32 sequence number asks for every record after it,
+# which are notified back as one continuous stream of records split to fit
+# the MTU. each record is HISTORY_HEADER, a uint32 sequence number and the
+# uint32 board time it was taken, followed by the board's compact record
+HISTORY_UUID = "0b6c0002-8f1e-4e3a-9a2c-5c7e2d1f4b60"
+HISTORY_STATUS = "<IIIH"
+HISTORY_REQUEST = "<I"
+HISTORY_HEADER = "<II"
+
+# custom characteristic summarising each reading in the board's compact record
+# over the last reporting interval, see enviroble.stats. its value is
+# STATS_HEADER, the uint8 model id and layout version of the compact record
+# and a uint16 interval in seconds, followed by each field of the record bar
+# STATS_EXCLUDED as a uint16 count of samples and then the minimum, maximum,
+# mean and standard deviation, each encoded as the field is. fields with no
+# samples are all zeros
+STATS_UUID = "0b6c0007-8f1e-4e3a-9a2c-5c7e2d1f4b60"
+STATS_HEADER = "<BBH"
+STATS_COUNT = "<H"
+
+# directions don't average as plain numbers
+STATS_EXCLUDED = ("wind_direction",)
+
+# l2cap connection oriented channel for streaming raw data, see
+# enviroble.stream. the board listens on STREAM_PSM and both ends send frames
+# of STREAM_HEADER, a uint8 stream id, a uint16 sequence number counting the
+# frames sent on that stream (so a central can tell when frames were dropped)
+# and a uint16 payload length, followed by the payload
+STREAM_PSM = 0x0080
+STREAM_HEADER = "<BHH"
+
+# the streams and their payloads:
+#   STREAM_HISTORY      to the board a HISTORY_REQUEST, from the board whole
+#                       history records with an empty frame after the last
+#   STREAM_MICROPHONE   raw uint16 microphone adc samples from each reading
+#   STREAM_WIND         uint32 ticks_ms times of the anemometer's edges
+STREAM_HISTORY = 1
+STREAM_MICROPHONE = 2
+STREAM_WIND = 3
+
+
+# encoding
+# ===========================================================================
+def characteristic_size(name):
+    return FIELDS[name][3]
+
+
+# records are laid out by RECORDS unless layouts says otherwise, such as
+# COMPACT_RECORDS
+def record_size(model, layouts=RECORDS):
+    return _fields_size(layouts[model][2])
+
+
+def _fields_size(names):
+    size = struct.calcsize(RECORD_HEADER)
+    for name in names:
+        size += struct.calcsize(FIELDS[name][2])
+    return size
+
+
+def stats_fields(model):
+    return tuple(name for name in COMPACT_RECORDS[model][2] if name not in STATS_EXCLUDED)
+
+
+def stats_size(model):
+    size = struct.calcsize(STATS_HEADER)
+    for name in stats_fields(model):
+        size += struct.calcsize(STATS_COUNT) + 4 * struct.calcsize(FIELDS[name][2])
+    return size
+
+
+def history_record_size(model):
+    return struct.calcsize(HISTORY_HEADER) + record_size(model, COMPACT_RECORDS)
+
+
+# the encoders write each value a byte at a time rather than through
+# struct, so that no int bigger than a byte is ever made. MicroPython keeps
+# ints of up to 30 bits without allocating, CPython caches those up to 256 but
+# recycles floats, so each splits the value up with the arithmetic that's
+# free for it. both round half to even, as round() does
+_INT_ARITHMETIC = sys.implementation.name == "micropython"
+
+
+# each field's encoding worked out once: (property, bytes, scale, minimum,
+# maximum, the value a negative number wraps to zero at or 0 if unsigned).
+# the encoded value takes up all of its struct format's bytes
+def _codec(name):
+    property, uuid, format, size, scale, minimum, maximum = FIELDS[name]
+    full_size = struct.calcsize(format)
+    wrap = 1 << (8 * full_size) if format[-1].islower() else 0
+    if not _INT_ARITHMETIC:
+        scale, wrap = float(scale), float(wrap)
+    return (property, full_size, scale, minimum, maximum, wrap)
+
+
+_CODECS = {name: _codec(name) for name in FIELDS}
+
+
+def _encode(codec, buffer, offset, value):
+    property, size, scale, minimum, maximum, wrap = codec
+    if value < minimum:
+        value = minimum
+    elif value > maximum:
+        value = maximum
+    end = offset + size
+    if _INT_ARITHMETIC:
+        # the shifts take care of the sign
+        value = round(value * scale)
+        while offset < end:
+            buffer[offset] = value & 0xFF
+            value >>= 8
+            offset += 1
+    else:
+        value = value * scale
+        rounded = (value + 0.5) // 1
+        if rounded - value == 0.5 and rounded % 2:
+            rounded -= 1
+        if rounded < 0:
+            rounded += wrap
+        while offset < end:
+            buffer[offset] = int(rounded % 256)
+            rounded //= 256
+            offset += 1
+
+
+# encode one field into buffer at offset without allocating, buffer must
+# have room for the whole struct format
+def pack_into(name, buffer, offset, value):
+    _encode(_CODECS[name], buffer, offset, value)
+
+
+# each layout's codecs and their offsets in the record, by model
+def _record_codecs(layouts):
+    records = {}
+    for model, (model_id, version, names) in layouts.items():
+        offsets = []
+        offset = struct.calcsize(RECORD_HEADER)
+        for name in names:
+            offsets.append(offset)
+            offset += _CODECS[name][1]
+        records[model] = (model_id, version, tuple(_CODECS[name] for name in names), tuple(offsets))
+    return records
+
+
+_RECORD_CODECS = _record_codecs(RECORDS)
+_COMPACT_CODECS = _record_codecs(COMPACT_RECORDS)
+
+
+# encode a board's packed record into buffer from start, without allocating.
+# readings that are missing are sent as zero
+def pack_record_into(model, buffer, readings, layouts=RECORDS, start=0):
+    model_id, version, codecs, offsets = (_COMPACT_CODECS if layouts is COMPACT_RECORDS else _RECORD_CODECS)[model]
+    buffer[start] = model_id
+    buffer[start + 1] = version
+    i = 0
+    count = len(codecs)
+    while i < count:
+        codec = codecs[i]
+        value = readings.get(codec[0])
+        _encode(codec, buffer, start + offsets[i], 0 if value is None else value)
+        i += 1
+
+
+# encode the statistics for a board into buffer, stats is an
+# enviroble.stats.ReadingStats with a slot for each field's property
+def pack_stats_into(model, buffer, interval_s, stats):
+    model_id, version, names = COMPACT_RECORDS[model]
+    struct.pack_into(STATS_HEADER, buffer, 0, model_id, version, min(interval_s, 0xFFFF))
+    offset = struct.calcsize(STATS_HEADER)
+    for name in stats_fields(model):
+        field = FIELDS[name]
+        count, minimum, maximum, mean, deviation = stats.summary(field[0])
+        struct.pack_into(STATS_COUNT, buffer, offset, min(count, 0xFFFF))
+        offset += struct.calcsize(STATS_COUNT)
+        for value in (minimum, maximum, mean, deviation):
+            pack_into(name, buffer, offset, value)
+            offset += struct.calcsize(field[2])
+
+
+def pack_measurement(sampling, period_s, interval_s, application=APPLICATION_AIR,
+                     uncertainty=UNCERTAINTY_UNKNOWN):
+    return struct.pack("<HBHBHBBB", 0, sampling, period_s & 0xFFFF, period_s >> 16,
+                       interval_s & 0xFFFF, interval_s >> 16, application, uncertainty)
+
+
+def pack_beacon_into(model, buffer, sequence, readings):
+    buffer[0] = sequence
+    pack_record_into(model, buffer, readings, COMPACT_RECORDS, 1)
+
+
+# decoding
+# ===========================================================================
+MODELS = {record[0]: model for model, record in RECORDS.items()}
+# every layout by model id and version, as (model, fields)
+LAYOUTS = {}
+for _layouts in (RECORDS, COMPACT_RECORDS):
+    for _model, (_model_id, _version, _names) in _layouts.items():
+        LAYOUTS[(_model_id, _version)] = (_model, _names)
+UUIDS = {field[1]: name for name, field in FIELDS.items() if field[1] is not None}
+
+
+def unpack(name, data, offset=0):
+    property, uuid, format, size, scale, minimum, maximum = FIELDS[name]
+    full_size = struct.calcsize(format)
+    if len(data) - offset < full_size:
+        data = bytes(data[offset:offset + size]) + bytes(full_size - size)
+        offset = 0
+    return struct.unpack_from(format, data, offset)[0] / scale
+
+
+# the model, version and fields of the record layout data starts with
+def _layout(data, offset=0):
+    model_id, version = struct.unpack_from(RECORD_HEADER, data, offset)
+    layout = LAYOUTS.get((model_id, version))
+    if layout is None:
+        raise ValueError(f"unknown record layout {model_id}:{version}")
+    return layout[0], version, layout[1]
+
+
+# decode a packed record in any of the layouts, full or compact, returning
+# the model name, layout version and a dict of readings keyed by property
+def unpack_record(data):
+    model, version, names = _layout(data)
+    if len(data) < _fields_size(names):
+        raise ValueError(f"short record for layout {data[0]}:{version}")
+
+    readings = {}
+    offset = struct.calcsize(RECORD_HEADER)
+    for name in names:
+        field = FIELDS[name]
+        readings[field[0]] = unpack(name, data, offset)
+        offset += struct.calcsize(field[2])
+    return model, version, readings
+
+
+# decode a measurement descriptor, returning (sampling, period, interval, application, uncertainty)
+def unpack_measurement(data):
+    flags, sampling, period, period_high, interval, interval_high, application, uncertainty = \
+        struct.unpack("<HBHBHBBB", data)
+    return sampling, period | period_high << 16, interval | interval_high << 16, application, uncertainty
+
+
+# decode beacon service data, returning the sequence number, model name,
+# layout version and readings
+def unpack_beacon(data):
+    model, version, readings = unpack_record(memoryview(data)[1:])
+    return data[0], model, version, readings
+
+
+# decode a stats value, returning the model name, layout version, interval
+# in seconds and a dict of (samples, minimum, maximum, mean, standard
+# deviation) keyed by property
+def unpack_stats(data):
+    model_id, version, interval = struct.unpack_from(STATS_HEADER, data, 0)
+    model = MODELS.get(model_id)
+    if model is None or COMPACT_RECORDS[model][1] != version or len(data) < stats_size(model):
+        raise ValueError(f"unknown record layout {model_id}:{version}")
+
+    stats = {}
+    offset = struct.calcsize(STATS_HEADER)
+    for name in stats_fields(model):
+        field = FIELDS[name]
+        count = struct.unpack_from(STATS_COUNT, data, offset)[0]
+        offset += struct.calcsize(STATS_COUNT)
+        values = []
+        for i in range(4):
+            values.append(unpack(name, data, offset))
+            offset += struct.calcsize(field[2])
+        stats[field[0]] = tuple([count] + values)
+    return model, version, interval, stats
+
+
+# decode a stream of history records, returning a list of (sequence number,
+# board time, model name, layout version, readings), a partial record at the
+# end is ignored
+def unpack_history(data):
+    header = struct.calcsize(HISTORY_HEADER)
+    records = []
+    offset = 0
+    while len(data) - offset > header + 1:
+        model, version, names = _layout(data, offset + header)
+        size = header + _fields_size(names)
+        if len(data) - offset < size:
+            break
+        sequence, timestamp = struct.unpack_from(HISTORY_HEADER, data, offset)
+        model, version, readings = unpack_record(memoryview(data)[offset + header:offset + size])
+        records.append((sequence, timestamp, model, version, readings))
+        offset += size
+    return records
+
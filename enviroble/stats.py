@@ -0,0 +1,67 @@
+import math
+from array import array
+
+# where each statistic is kept in a slot
+_MEAN = 0
+_M2 = 1
+_MINIMUM = 2
+_MAXIMUM = 3
+_SLOT_SIZE = 4
+
+
+# the running minimum, maximum, mean and standard deviation of a set of
+# readings, kept with Welford's method in one preallocated slot per reading
+# so that memory stays the same however many samples are added, see
+# schema.STATS_UUID for how they're sent
+class ReadingStats:
+    def __init__(self, properties):
+        self.properties = tuple(properties)
+        self._slots = {}
+        for i, property in enumerate(self.properties):
+            self._slots[property] = i
+        self._counts = array("I", [0] * len(self.properties))
+        self._values = array("f", [0] * (_SLOT_SIZE * len(self.properties)))
+
+    def reset(self):
+        for i in range(len(self._counts)):
+            self._counts[i] = 0
+
+    # add a sample of each of properties that has a value in readings, other
+    # readings are ignored
+    def add(self, readings, properties):
+        for property in properties:
+            index = self._slots.get(property)
+            value = readings.get(property)
+            if index is None or value is None:
+                continue
+            count = self._counts[index] + 1
+            self._counts[index] = count
+            values = self._values
+            slot = index * _SLOT_SIZE
+            if count == 1:
+                values[slot + _MEAN] = value
+                values[slot + _M2] = 0
+                values[slot + _MINIMUM] = value
+                values[slot + _MAXIMUM] = value
+                continue
+            mean = values[slot + _MEAN]
+            delta = value - mean
+            mean += delta / count
+            values[slot + _MEAN] = mean
+            values[slot + _M2] += delta * (value - mean)
+            if value < values[slot + _MINIMUM]:
+                values[slot + _MINIMUM] = value
+            if value > values[slot + _MAXIMUM]:
+                values[slot + _MAXIMUM] = value
+
+    # (samples, minimum, maximum, mean, standard deviation) of property, all
+    # zero if it hasn't been sampled
+    def summary(self, property):
+        index = self._slots[property]
+        count = self._counts[index]
+        if count == 0:
+            return 0, 0, 0, 0, 0
+        slot = index * _SLOT_SIZE
+        values = self._values
+        deviation = math.sqrt(max(0, values[slot + _M2]) / (count - 1)) if count > 1 else 0
+        return count, values[slot + _MINIMUM], values[slot + _MAXIMUM], values[slot + _MEAN], deviation
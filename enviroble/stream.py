@@ -0,0 +1,163 @@
+import struct
+import time
+import uasyncio as asyncio
+import enviroble.schema as schema
+from aioble.l2cap import L2CAPDisconnectedError
+
+
+# serves raw data over an l2cap connection oriented channel, which moves far
+# more per connection event than notifications can, see schema.STREAM_PSM for
+# the framing
+#
+# flow control comes from the channel's credits: send() waits while the
+# central has no room for more. bulk transfers wait as long as it takes, live
+# streams pass a timeout so that a slow central can't hold up the board, and
+# the frames they drop still use up a sequence number so the gap shows
+#
+# every connected central can open its own channel. each has its own frame
+# buffer, sequence numbers and lock, so a history download only ever goes to
+# the central that asked for it and a stalled central only holds up itself
+class StreamServer:
+    def __init__(self, history=None, mtu=512):
+        self.history = history
+        self.mtu = mtu
+        self.links = {}
+        self.sent = 0
+        self.dropped = 0
+        self._header_size = struct.calcsize(schema.STREAM_HEADER)
+        if history is not None:
+            self._records_per_frame = (mtu - self._header_size) // history.record_size
+
+    def listening(self):
+        return len(self.links) > 0
+
+    # wait for the central on connection to open the channel and then handle
+    # its requests until it goes away, run as a task for each connection
+    async def accept(self, connection):
+        try:
+            channel = await connection.l2cap_accept(schema.STREAM_PSM, self.mtu)
+        except OSError as e:
+            print("L2CAP channels aren't available:", e)
+            return
+
+        link = _Link(channel, self)
+        self.links[connection] = link
+        try:
+            await self._serve(link)
+        except L2CAPDisconnectedError:
+            pass
+        finally:
+            link.channel = None
+            if self.links.get(connection) is link:
+                del self.links[connection]
+
+    async def _serve(self, link):
+        requests = memoryview(link.requests)
+        header = self._header_size
+        filled = 0
+        while True:
+            filled += await link.channel.recvinto(requests[filled:])
+            while filled >= header:
+                stream, sequence, length = struct.unpack_from(schema.STREAM_HEADER, requests)
+                if header + length > len(requests):
+                    # too big to be a request, throw it away
+                    filled = 0
+                    break
+                if filled < header + length:
+                    break
+                await self._handle(link, stream, requests[header:header + length])
+                size = header + length
+                link.requests[:filled - size] = link.requests[size:filled]
+                filled -= size
+
+    async def _handle(self, link, stream, payload):
+        if stream == schema.STREAM_HISTORY and self.history is not None:
+            if len(payload) >= struct.calcsize(schema.HISTORY_REQUEST):
+                await self.send_history(link, struct.unpack_from(schema.HISTORY_REQUEST, payload)[0])
+
+    # send every history record after sequence down one central's channel, as
+    # many whole records to a frame as fit, then an empty frame to say that's
+    # all
+    async def send_history(self, link, sequence):
+        history = self.history
+        size = history.record_size
+        records = memoryview(link.records)
+        sequence = max(sequence + 1, history.oldest())
+        while link.channel is not None:
+            count = 0
+            while count < self._records_per_frame:
+                # skip past records overwritten while we were sending
+                sequence = max(sequence, history.oldest())
+                if not history.copy_into(sequence, records[count * size:(count + 1) * size]):
+                    break
+                sequence += 1
+                count += 1
+            if not await self._send(link, schema.STREAM_HISTORY, records[:count * size]):
+                return
+            if count == 0:
+                return
+
+    # send data on stream to every central with the channel open, split into
+    # as many frames as it needs. waits up to timeout_ms in all for each
+    # central to have room, or forever if it's None, dropping whatever frames
+    # it still hasn't room for. returns False if nobody's listening or
+    # anything was dropped
+    async def send(self, stream, data, timeout_ms=None):
+        links = list(self.links.values())
+        if not links:
+            return False
+        if len(links) == 1:
+            return await self._send(links[0], stream, data, timeout_ms)
+        results = await asyncio.gather(*[self._send(link, stream, data, timeout_ms) for link in links])
+        return all(results)
+
+    async def _send(self, link, stream, data, timeout_ms=None):
+        header = self._header_size
+        room = self.mtu - header
+        sent = True
+        if timeout_ms is not None:
+            deadline = time.ticks_add(time.ticks_ms(), timeout_ms)
+        async with link.lock:
+            offset = 0
+            while True:
+                channel = link.channel
+                if channel is None:
+                    return False
+                count = min(room, len(data) - offset)
+                sequence = link.sequences.get(stream, 0)
+                link.sequences[stream] = (sequence + 1) & 0xFFFF
+                struct.pack_into(schema.STREAM_HEADER, link.frame, 0, stream, sequence, count)
+                link.view[header:header + count] = data[offset:offset + count]
+                if timeout_ms is not None:
+                    timeout_ms = time.ticks_diff(deadline, time.ticks_ms())
+                # aioble takes a timeout of 0 to mean none at all, so a frame
+                # that's already out of time is dropped without trying
+                if timeout_ms is not None and timeout_ms <= 0:
+                    self.dropped += 1
+                    sent = False
+                else:
+                    try:
+                        await channel.send(link.view[:header + count], timeout_ms)
+                        self.sent += 1
+                    except asyncio.TimeoutError:
+                        self.dropped += 1
+                        sent = False
+                    except L2CAPDisconnectedError:
+                        return False
+                offset += count
+                if offset >= len(data):
+                    return sent
+
+
+# one central's open channel and what's needed to serve it
+class _Link:
+    def __init__(self, channel, server):
+        self.channel = channel
+        self.frame = bytearray(server.mtu)
+        self.view = memoryview(self.frame)
+        self.sequences = {}
+        self.lock = asyncio.Lock()
+        self.requests = bytearray(64)
+        self.records = None
+        if server.history is not None:
+            self.records = bytearray(server._records_per_frame * server.history.record_size)
@@ -0,0 +1,81 @@
+import math
+from array import array
+
+# x and y components of each of the wind vane's headings, 45 degrees apart
+# starting from north, scaled by 1024
+_COMPONENTS = array("h", [round(math.sin(math.radians(i * 45)) * 1024) for i in range(8)] +
+                         [round(math.cos(math.radians(i * 45)) * 1024) for i in range(8)])
+
+
+# wind statistics over a reporting interval, fed with the anemometer's edge
+# count and the vane's heading every sample and holding nothing but running
+# totals, so it costs the same however long the interval is:
+#
+#   mean      all the edges over all the time
+#   gust      the most edges in any gust_samples samples in a row, the 3
+#             second gust at one sample a second
+#   direction the mean of the headings as vectors weighted by the edges in
+#             their sample, so a gust from one side outweighs a lull from the
+#             other. if there was no wind each heading counts the same
+#
+# speeds are left as edges and milliseconds for the board to scale
+class WindStats:
+    def __init__(self, gust_samples=3):
+        self._gust_edges = array("H", [0] * gust_samples)
+        self._gust_ms = array("H", [0] * gust_samples)
+        self._gust_next = 0
+        self._gust_stored = 0
+        self.reset()
+
+    # start a new reporting interval, gusts keep counting the samples from the
+    # end of the last one
+    def reset(self):
+        self.samples = 0
+        self.edges = 0
+        self.elapsed_ms = 0
+        self.gust_edges = 0
+        self.gust_elapsed_ms = 0
+        self._x = 0
+        self._y = 0
+        self._calm_x = 0
+        self._calm_y = 0
+
+    def add(self, edges, elapsed_ms, heading):
+        if elapsed_ms <= 0:
+            return
+        self.samples += 1
+        self.edges += edges
+        self.elapsed_ms += elapsed_ms
+
+        index = self._gust_next
+        self._gust_edges[index] = min(edges, 0xFFFF)
+        self._gust_ms[index] = min(elapsed_ms, 0xFFFF)
+        self._gust_next = (index + 1) % len(self._gust_edges)
+        if self._gust_stored < len(self._gust_edges):
+            self._gust_stored += 1
+        window_edges = 0
+        window_ms = 0
+        for i in range(self._gust_stored):
+            window_edges += self._gust_edges[i]
+            window_ms += self._gust_ms[i]
+        # compare rates without dividing
+        if self.gust_elapsed_ms == 0 or window_edges * self.gust_elapsed_ms > self.gust_edges * window_ms:
+            self.gust_edges = window_edges
+            self.gust_elapsed_ms = window_ms
+
+        sector = (heading // 45) % 8
+        x = _COMPONENTS[sector]
+        y = _COMPONENTS[sector + 8]
+        self._x += x * edges
+        self._y += y * edges
+        self._calm_x += x
+        self._calm_y += y
+
+    # the mean direction in degrees from 0 to 360, or None without samples
+    def direction(self):
+        if self.samples == 0:
+            return None
+        x, y = self._x, self._y
+        if x == 0 and y == 0:
+            x, y = self._calm_x, self._calm_y
+        return math.degrees(math.atan2(x, y)) % 360
@@ -1,6 +1,5 @@
 import sys
 import time
-import struct
 
 from micropython import const
 
@@ -11,8 +10,16 @@ import bluetooth
 import enviroble
 from enviroble.helpers import uid
 from enviroble.constants import ENVIRO_BLE_VERSION
+from enviroble.scheduler import Scheduler
+from enviroble.history import History
+from enviroble.stats import ReadingStats
+import enviroble.schema as schema
+import enviroble.power as power
+import enviroble.bus
 
 board = enviroble.get_board()
+wake_reason = power.startup()
+enviroble.boot_mark("board")
 
 
 # org.bluetooth.service.enviro_sensing
@@ -27,6 +34,55 @@ _ADV_APPEARANCE_GENERIC_THERMOMETER = const(768)
 # How frequently to send advertising beacons.
 _ADV_INTERVAL_MS = 250_000
 
+# Broadcast the latest readings in the advertising payload so that they can
+# be collected with a passive scan, without connecting. The advertisement is
+# restarted every _BEACON_REFRESH_MS to pick up the latest payload.
+_BEACON_MODE = False
+_BEACON_REFRESH_MS = 1000
+
+# Save battery by waking every _LOW_POWER_PERIOD_MS to take a reading and
+# advertise it for _LOW_POWER_ADVERTISE_MS, then powering off (or lightsleeping
+# when on USB) until the RTC wakes the board again. The activity LED stays off.
+# A central that connects during the window keeps the board awake for up to
+# _LOW_POWER_CONNECTED_MS. Pairs well with _BEACON_MODE.
+_LOW_POWER_MODE = False
+_LOW_POWER_PERIOD_MS = 5 * 60 * 1000
+_LOW_POWER_ADVERTISE_MS = 5000
+_LOW_POWER_CONNECTED_MS = 60 * 1000
+
+# Keep a reading every _HISTORY_INTERVAL_S on the board, up to _HISTORY_RECORDS
+# of them, so that a central that's been away can download what it missed.
+# Set _HISTORY_FILE to also keep them in flash, so they survive a reset (or
+# low power mode).
+_HISTORY_INTERVAL_S = 60
+_HISTORY_RECORDS = 24 * 60
+_HISTORY_FILE = None
+
+# Ask for a bigger MTU, so that history downloads need fewer notifications.
+_MTU = 247
+
+# Listen for an L2CAP channel from a connected central and stream raw data
+# over it (the microphone's samples on Urban, the anemometer's ticks on
+# Weather) every _STREAM_INTERVAL_MS, along with history downloads. Frames
+# of live data the central hasn't room for within _STREAM_TIMEOUT_MS are
+# dropped rather than holding up the board.
+_STREAM_MODE = False
+_STREAM_MTU = 512
+_STREAM_INTERVAL_MS = 1000
+_STREAM_TIMEOUT_MS = 500
+
+# Summarise the readings over every _STATS_INTERVAL_S as their minimum,
+# maximum, mean and standard deviation, in the stats characteristic. So that
+# there's something to summarise, readings without a period of their own are
+# sampled every _STATS_SAMPLE_MS rather than every minute. None turns the
+# summaries off.
+_STATS_INTERVAL_S = 5 * 60
+_STATS_SAMPLE_MS = 10 * 1000
+
+# How many centrals can be connected at once. The board keeps advertising
+# until this many are connected. Your MicroPython build's Bluetooth stack
+# may allow fewer.
+_MAX_CONNECTIONS = 3
 
 
 device_info = aioble.Service(_DEVICE_INFO_UUID)
@@ -45,18 +101,50 @@ sensors = []
 
 enviro_sensing = aioble.Service(_ENV_SENSE_UUID)
 
-# All boards have Temperature, Humidity and Pressure readings
+# All boards have Temperature, Humidity, Dew Point and Pressure readings
 sensors.append(enviroble.EnviroSensor(enviro_sensing, "temperature"))
 sensors.append(enviroble.EnviroSensor(enviro_sensing, "humidity"))
+sensors.append(enviroble.EnviroSensor(enviro_sensing, "dew_point"))
 sensors.append(enviroble.EnviroSensor(enviro_sensing, "pressure"))
 
 if board.model == "weather":
-    sensors.append(enviroble.EnviroSensor(enviro_sensing, "rain_per_second"))
-    sensors.append(enviroble.EnviroSensor(enviro_sensing, "wind_direction"))
+    sensors.append(enviroble.EnviroSensor(enviro_sensing, "rainfall"))
+    for name in ("wind_speed", "wind_gust", "gust_factor", "wind_direction"):
+        sensors.append(enviroble.EnviroSensor(enviro_sensing, name, measurement=board.MEASUREMENTS[name]))
 
 if board.model in ("grow", "weather", "indoor"):
     sensors.append(enviroble.EnviroSensor(enviro_sensing, "luminance"))
 
+if board.model == "indoor":
+    sensors.append(enviroble.EnviroSensor(enviro_sensing, "color_temperature"))
+    sensors.append(enviroble.EnviroSensor(enviro_sensing, "iaq"))
+    sensors.append(enviroble.EnviroSensor(enviro_sensing, "iaq_accuracy"))
+
+if board.model == "urban":
+    sensors.append(enviroble.EnviroSensor(enviro_sensing, "noise_rms"))
+    sensors.append(enviroble.EnviroSensor(enviro_sensing, "noise_peak"))
+    sensors.append(enviroble.EnviroSensor(enviro_sensing, "noise_dba"))
+    for name in board.PMS5003_READINGS:
+        sensors.append(enviroble.EnviroSensor(enviro_sensing, name, measurement=board.MEASUREMENTS[name]))
+
+# Every reading from the board packed into one value
+sensors.append(enviroble.EnviroReadings(enviro_sensing, board.model))
+
+# Each reading's statistics over the last interval
+stats = None
+if _STATS_INTERVAL_S is not None:
+    stats = ReadingStats(schema.FIELDS[name][0] for name in schema.stats_fields(board.model))
+    stats_characteristic = enviroble.EnviroStats(enviro_sensing, board.model)
+
+# Readings kept on the board for download
+history = History(board.model, _HISTORY_RECORDS, _HISTORY_FILE)
+history_characteristic = enviroble.EnviroHistory(enviro_sensing, history)
+
+streams = None
+if _STREAM_MODE:
+    from enviroble.stream import StreamServer
+    streams = StreamServer(history, _STREAM_MTU)
+
 if board.model == "grow":
     automation = aioble.Service(_AUTOMATION_UUID)
     soil_channels = {
@@ -64,59 +152,177 @@ if board.model == "grow":
         "moisture_b": enviroble.EnviroAnalog(automation, "Soil Moisure B"),
         "moisture_c": enviroble.EnviroAnalog(automation, "Soil Moisure C")
     }
+    # The pumps switch themselves off after board.PUMP_MAX_ON_MS, however
+    # they were switched on.
     pump_channels = [
-        enviroble.EnviroDigital(automation, "Pump A", board.pump_pins[0]),
-        enviroble.EnviroDigital(automation, "Pump B", board.pump_pins[1]),
-        enviroble.EnviroDigital(automation, "Pump C", board.pump_pins[2])
+        enviroble.EnviroDigital(automation, "Pump A", board.pumps[0]),
+        enviroble.EnviroDigital(automation, "Pump B", board.pumps[1]),
+        enviroble.EnviroDigital(automation, "Pump C", board.pumps[2])
+    ]
+    # The moisture each channel is watered up to, 0 for never.
+    target_channels = [
+        enviroble.EnviroSetting(automation, "Moisture Target A", board.moisture_targets[0]),
+        enviroble.EnviroSetting(automation, "Moisture Target B", board.moisture_targets[1]),
+        enviroble.EnviroSetting(automation, "Moisture Target C", board.moisture_targets[2])
     ]
 
     aioble.register_services(enviro_sensing, device_info, automation)
 
 else:
     aioble.register_services(enviro_sensing, device_info)
-    
 
+bluetooth.BLE().config(mtu=_MTU)
+
+# Follow each central's subscriptions, so notifications go to just the
+# centrals that asked for them.
+enviroble.centrals.limit = _MAX_CONNECTIONS
+enviroble.centrals.watch(*sensors)
+if stats is not None:
+    enviroble.centrals.watch(stats_characteristic)
+if board.model == "grow":
+    enviroble.centrals.watch(*soil_channels.values())
+    enviroble.centrals.watch(*target_channels)
+
+# Act on what centrals write as soon as it arrives.
+enviroble.writes.on(history_characteristic, history_characteristic.request)
+if board.model == "grow":
+    def pump_written(channel):
+        def handler(connection, data):
+            value = pump_channels[channel].set_from(data)
+            if value is not None:
+                print(f"Pump {board.CHANNEL_NAMES[channel]} set to {value}")
+        return handler
+
+    def target_written(channel):
+        def handler(connection, data):
+            value = target_channels[channel].set_from(data)
+            if value is not None:
+                board.moisture_targets[channel] = value
+                print(f"Moisture target {board.CHANNEL_NAMES[channel]} set to {value}")
+        return handler
+
+    for channel in range(len(pump_channels)):
+        enviroble.writes.on(pump_channels[channel], pump_written(channel))
+        enviroble.writes.on(target_channels[channel], target_written(channel))
+enviroble.boot_mark("services")
+
+scheduler = Scheduler(board.SOURCES, board.SAMPLE_PERIODS_MS,
+                      60 * 1000 if stats is None else _STATS_SAMPLE_MS)
+
+beacon = None
+if _BEACON_MODE:
+    beacon = enviroble.EnviroBeacon(board.model, f"enviro-{board.model}", _ADV_APPEARANCE_GENERIC_THERMOMETER)
 
-# This would be periodically polling a hardware sensor.
+
+# Update the characteristics, and the beacon if there is one, with new readings.
+def publish(readings):
+    for sensor in sensors:
+        sensor.update_from_dict(readings)
+    if board.model == "grow":
+        for channel, soil_channel in soil_channels.items():
+            soil_channel.write_float(readings.get(channel))
+    if history.due(_HISTORY_INTERVAL_S):
+        history.append(readings)
+    history_characteristic.update_status()
+    if beacon is not None:
+        # peripheral_task picks this up the next time it starts advertising.
+        beacon.update_from_dict(readings)
+
+
+# Sample each reading on its own period, publishing whatever changed after
+# every tick, and the statistics of the fresh readings every _STATS_INTERVAL_S.
 async def sensor_task():
-    last_reading = time.ticks_ms()
+    stats_start = time.ticks_ms()
     while True:
-        seconds_since_last = (time.ticks_ms() - last_reading) / 1000
-        readings = board.get_sensor_readings(seconds_since_last)
+        sources = await scheduler.tick()
+        readings = scheduler.readings
         print(readings)
-        last_reading = time.ticks_ms()
-        for sensor in sensors:
-            sensor.update_from_dict(readings)
-        if board.model == "grow":
-            for channel, soil_channel in soil_channels.items():
-                soil_channel.write_float(readings.get(channel))
-        await asyncio.sleep_ms(1000 * 60)
+        publish(readings)
+        if stats is not None:
+            for source in sources:
+                stats.add(readings, board.SOURCES[source][1])
+            elapsed_ms = time.ticks_diff(time.ticks_ms(), stats_start)
+            if elapsed_ms >= _STATS_INTERVAL_S * 1000:
+                stats_characteristic.update_from_stats(stats, elapsed_ms // 1000)
+                stats.reset()
+                stats_start = time.ticks_ms()
+        if scheduler.ticks % 60 == 0:
+            print(f"Sampling duty cycle {scheduler.duty_cycle() * 100:.1f}%")
+            for name, bus_us, transactions in enviroble.bus.report():
+                print(f"  {name}: {bus_us / 1000:.1f}ms of bus time in {transactions} transactions")
+            enviroble.bus.reset()
+        await asyncio.sleep_ms(scheduler.next_due_ms())
 
 
-async def io_task():
-    while True:
-        for pump_channel in pump_channels:
-            value = await pump_channel.update()
-            if value is not None:
-                print(f"Pump set to {value}")
-        await asyncio.sleep_ms(1000 * 1)
+def advertise(timeout_ms=None):
+    if beacon is not None:
+        return aioble.advertise(
+            _ADV_INTERVAL_MS,
+            adv_data=beacon.adv_data,
+            resp_data=beacon.resp_data,
+            timeout_ms=timeout_ms,
+        )
+    return aioble.advertise(
+        _ADV_INTERVAL_MS,
+        name=f"enviro-{board.model}",
+        services=[_ENV_SENSE_UUID],
+        appearance=_ADV_APPEARANCE_GENERIC_THERMOMETER,
+        timeout_ms=timeout_ms,
+    )
 
 
-# Serially wait for connections. Don't advertise while a central is
-# connected.
+# Report how long it took to get from reset to the first advertisement.
+def boot_report():
+    enviroble.boot_mark("advertising")
+    marks = enviroble.boot_marks
+    stages = ", ".join(f"{name} {ms}ms" for name, ms in marks[:-1])
+    print(f"Boot: {marks[-1][1]}ms from reset to first advertisement ({stages})")
+
+
+# Look after one central for as long as it's connected.
+async def central_task(connection):
+    print("Connection from", connection.device)
+    accept = None
+    if streams is not None:
+        accept = asyncio.create_task(streams.accept(connection))
+    try:
+        async with connection:
+            await connection.disconnected(timeout_ms=None)
+    finally:
+        enviroble.centrals.remove(connection)
+        if accept is not None:
+            accept.cancel()
+        print("Disconnected", connection.device)
+
+
+# Keep advertising for more connections until _MAX_CONNECTIONS centrals are
+# connected. In beacon mode each advertisement only runs for _BEACON_REFRESH_MS,
+# so that the next one carries the latest readings.
 async def peripheral_task():
+    boot_report()
     while True:
+        await enviroble.centrals.wait_for_room()
         try:
-            async with await aioble.advertise(
-                _ADV_INTERVAL_MS,
-                name=f"enviro-{board.model}",
-                services=[_ENV_SENSE_UUID],
-                appearance=_ADV_APPEARANCE_GENERIC_THERMOMETER,
-            ) as connection:
-                print("Connection from", connection.device)
-                await connection.disconnected()
-        except asyncio.CancelledError:
-            print("Disconnected?")
+            connection = await advertise(None if beacon is None else _BEACON_REFRESH_MS)
+        except asyncio.TimeoutError:
+            continue
+        # Count it straight away, before deciding whether to advertise again.
+        enviroble.centrals.add(connection)
+        asyncio.create_task(central_task(connection))
+
+
+# Send whatever raw data the board has gathered to the central listening on
+# the stream, if there is one.
+async def stream_task():
+    sources = getattr(board, "STREAMS", {})
+    while True:
+        await asyncio.sleep_ms(_STREAM_INTERVAL_MS)
+        if not streams.listening():
+            continue
+        for stream, source in sources.items():
+            data = source()
+            if data:
+                await streams.send(stream, data, _STREAM_TIMEOUT_MS)
 
 
 async def blink_task():
@@ -127,15 +333,74 @@ async def blink_task():
         await asyncio.sleep_ms(1000)
 
 
+# Log any rain tips counted while awake, as rain_task isn't running to do it.
+def log_rain():
+    if board.model == "weather":
+        board.check_trigger()
+
+
+# One low power cycle: take every reading, advertise them for a while and
+# sleep. Every wake is a fresh boot so there's nothing to keep between cycles.
+async def low_power_task():
+    meter = power.EnergyMeter()
+
+    # Woken only to log a rain tip, go straight back to sleep.
+    if board.model == "weather" and not board.startup(wake_reason):
+        log_rain()
+        power.sleep(_LOW_POWER_PERIOD_MS)
+
+    # The edge counters only started counting when the board was set up, so
+    # give them a whole window of edges before reading them.
+    window_ms = getattr(board, "EDGE_WINDOW_MS", 0)
+    counting_ms = time.ticks_diff(time.ticks_ms(), dict(enviroble.boot_marks)["board"])
+    if counting_ms < window_ms:
+        await asyncio.sleep_ms(window_ms - counting_ms)
+
+    log_rain()
+    readings = await board.get_sensor_readings(_LOW_POWER_PERIOD_MS / 1000)
+    print(readings)
+    publish(readings)
+    meter.reading()
+
+    meter.enter("idle")
+    meter.radio(True)
+    asyncio.create_task(enviroble.writes.run())
+    boot_report()
+    try:
+        async with await advertise(_LOW_POWER_ADVERTISE_MS) as connection:
+            print("Connection from", connection.device)
+            enviroble.centrals.add(connection)
+            await connection.disconnected(timeout_ms=_LOW_POWER_CONNECTED_MS)
+    except asyncio.TimeoutError:
+        pass
+    meter.radio(False)
+
+    print(meter.report())
+    log_rain()
+    power.sleep(_LOW_POWER_PERIOD_MS)
+
+
 # Run both tasks.
 async def main():
+    if _LOW_POWER_MODE:
+        await low_power_task()
+        return
+
     tasks = [
         asyncio.create_task(sensor_task()),
         asyncio.create_task(peripheral_task()),
-        asyncio.create_task(blink_task())
+        asyncio.create_task(blink_task()),
+        asyncio.create_task(enviroble.writes.run()),
+        asyncio.create_task(enviroble.centrals.run())
     ]
+    if streams is not None:
+        tasks.append(asyncio.create_task(stream_task()))
     if board.model == "grow":
-        tasks.append(asyncio.create_task(io_task()))
+        for channel in range(len(board.pumps)):
+            tasks.append(asyncio.create_task(board.water_task(channel)))
+    if board.model == "weather":
+        tasks.append(asyncio.create_task(board.rain_task()))
+        tasks.append(asyncio.create_task(board.wind_task()))
     await asyncio.gather(*tasks)
 
 
@@ -0,0 +1,33 @@
+# Freeze Enviro BLE into a MicroPython build so that it's imported straight
+# from flash as bytecode, for example:
+#
+#   make -C ports/rp2 BOARD=PICO_W FROZEN_MANIFEST=/path/to/enviro-ble/manifest.py
+#
+# main.py still needs to be on the filesystem. The client library is for
+# regular Python and is left out.
+include("$(BOARD_DIR)/manifest.py")
+
+package("enviroble", files=(
+    "__init__.py",
+    "bus.py",
+    "constants.py",
+    "core.py",
+    "edges.py",
+    "helpers.py",
+    "history.py",
+    "humidity.py",
+    "iaq.py",
+    "pms5003.py",
+    "power.py",
+    "pump.py",
+    "rainlog.py",
+    "scheduler.py",
+    "stats.py",
+    "schema.py",
+    "stream.py",
+    "wind.py",
+    "boards/grow.py",
+    "boards/indoor.py",
+    "boards/urban.py",
+    "boards/weather.py",
+))